@@ -0,0 +1,58 @@
+"""
+Compares positions/sec of the per-position `board_to_tensor` against the batched `boards_to_tensor`.
+
+Usage: python -m benchmarks.bench_board_encoding --positions 20000
+"""
+import argparse
+import random
+import time
+
+import chess
+import torch
+
+from maia2.utils import board_to_tensor, boards_to_tensor
+
+
+def random_positions(n_positions: int, seed: int = 42) -> list[chess.Board]:
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < n_positions:
+        board = chess.Board()
+        for _ in range(rng.randint(10, 120)):
+            legal_moves = list(board.legal_moves)
+            if not legal_moves:
+                break
+            board.push(rng.choice(legal_moves))
+            positions.append(board.copy(stack=False))
+    return positions[:n_positions]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--positions", type=int, default=20000)
+    arg_parser.add_argument("--batch-size", type=int, default=8192)
+    arg_parser.add_argument("--seed", type=int, default=42)
+    args = arg_parser.parse_args()
+
+    boards = random_positions(args.positions, args.seed)
+
+    start = time.perf_counter()
+    reference = torch.stack([board_to_tensor(board) for board in boards])
+    per_board_elapsed = time.perf_counter() - start
+
+    out = torch.empty((len(boards), 18, 8, 8), dtype=torch.float32)
+    start = time.perf_counter()
+    for idx in range(0, len(boards), args.batch_size):
+        batch = boards[idx: idx + args.batch_size]
+        boards_to_tensor(batch, out=out[idx: idx + len(batch)])
+    batched_elapsed = time.perf_counter() - start
+
+    assert torch.equal(reference, out), "Batched encoding does not match board_to_tensor"
+
+    print(f"board_to_tensor:   {len(boards) / per_board_elapsed:12,.0f} positions/sec")
+    print(f"boards_to_tensor:  {len(boards) / batched_elapsed:12,.0f} positions/sec")
+    print(f"speedup:           {per_board_elapsed / batched_elapsed:12.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Compares positions/sec of building legal-move masks with per-move UCI lookups against `legal_move_masks`.
+
+The reference formats every legal move as UCI (mirrored for black) and looks it up in
+`MOVE_VOCABULARY`; `legal_move_masks` goes through the `square_index` table and sets
+the whole batch in one scatter.
+
+Usage: python -m benchmarks.bench_legal_masks --positions 20000
+"""
+import argparse
+import time
+
+import chess
+import numpy as np
+
+from benchmarks.bench_board_encoding import random_positions
+from maia2.move_masks import MASK_SIZE, legal_move_masks, unpack_masks
+from maia2.utils import MOVE_VOCABULARY
+
+
+def uci_masks(boards: list[chess.Board]) -> np.ndarray:
+    masks = np.zeros((len(boards), MASK_SIZE), dtype=bool)
+    for idx, board in enumerate(boards):
+        for move in board.legal_moves:
+            uci = move.uci()
+            if not board.turn:
+                uci = chess.Move(chess.square_mirror(move.from_square), chess.square_mirror(move.to_square), move.promotion).uci()
+            if uci in MOVE_VOCABULARY:
+                masks[idx, MOVE_VOCABULARY.index(uci)] = True
+    return masks
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--positions", type=int, default=20000)
+    arg_parser.add_argument("--batch-size", type=int, default=8192)
+    arg_parser.add_argument("--seed", type=int, default=42)
+    args = arg_parser.parse_args()
+
+    boards = random_positions(args.positions, args.seed)
+
+    start = time.perf_counter()
+    reference = uci_masks(boards)
+    uci_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    packed = np.concatenate([
+        legal_move_masks(boards[idx: idx + args.batch_size], packed=True)
+        for idx in range(0, len(boards), args.batch_size)
+    ])
+    batched_elapsed = time.perf_counter() - start
+
+    assert (unpack_masks(packed).numpy() == reference).all(), "legal_move_masks does not match the UCI lookups"
+
+    print(f"UCI lookups:       {len(boards) / uci_elapsed:12,.0f} positions/sec")
+    print(f"legal_move_masks:  {len(boards) / batched_elapsed:12,.0f} positions/sec")
+    print(f"speedup:           {uci_elapsed / batched_elapsed:12.1f}x")
+    print(f"packed mask size:  {packed.shape[1]:12d} bytes/position")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compares games/sec of `replay_movetext` against `chess.pgn.read_game` on a synthetic corpus.
+
+The reference parses every game into a `chess.pgn` tree and walks its mainline,
+reading `node.clock()` and pushing each move on the game's board. `replay_movetext`
+is timed on every ply and with the config's `first_n_moves`/`last_n_moves`/`max_ply`/`clock_threshold`.
+
+Usage: python -m benchmarks.bench_movetext_replay --games 5000
+"""
+import argparse
+import io
+import time
+
+import chess
+import chess.pgn
+
+from benchmarks.synthetic_pgn import generate_pgn_games
+from maia2.replay import PositionSelection, replay_movetext
+from maia2.utils import MOVE_VOCABULARY
+
+
+def read_game_positions(game_text: str) -> list[tuple[int, int, int]]:
+    """`(move, clock, ply)` of every ply through `chess.pgn.read_game`, as `replay_movetext` yields them."""
+    game = chess.pgn.read_game(io.StringIO(game_text))
+    board = game.board()
+    positions = []
+    for ply, node in enumerate(game.mainline()):
+        move = node.move if board.turn else chess.Move(
+            chess.square_mirror(node.move.from_square), chess.square_mirror(node.move.to_square), node.move.promotion
+        )
+        if move.uci() in MOVE_VOCABULARY:
+            clock = node.clock()
+            positions.append((MOVE_VOCABULARY.index(move.uci()), -1 if clock is None else int(clock), ply))
+        board.push(node.move)
+    return positions
+
+
+def replay_positions(game_text: str, selection: PositionSelection) -> list[tuple[int, int, int]]:
+    movetext = game_text[game_text.find("\n\n") + 2:]
+    return [(position.move, position.clock, position.ply) for position in replay_movetext(movetext, selection)]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--games", type=int, default=5000)
+    arg_parser.add_argument("--first-n-moves", type=int, default=10)
+    arg_parser.add_argument("--last-n-moves", type=int, default=10)
+    arg_parser.add_argument("--max-ply", type=int, default=300)
+    arg_parser.add_argument("--clock-threshold", type=int, default=30)
+    arg_parser.add_argument("--seed", type=int, default=42)
+    args = arg_parser.parse_args()
+
+    games = generate_pgn_games(args.games, args.seed)
+    selection = PositionSelection(args.first_n_moves, args.last_n_moves, args.max_ply, args.clock_threshold)
+
+    start = time.perf_counter()
+    reference = [read_game_positions(game) for game in games]
+    read_game_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    replayed = [replay_positions(game, PositionSelection(clock_threshold=-1)) for game in games]
+    replay_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    selected = sum(len(replay_positions(game, selection)) for game in games)
+    selected_elapsed = time.perf_counter() - start
+
+    assert replayed == reference, "replay_movetext does not match chess.pgn.read_game"
+
+    print(f"chess.pgn.read_game:         {len(games) / read_game_elapsed:10,.0f} games/sec")
+    print(f"replay_movetext (all plies): {len(games) / replay_elapsed:10,.0f} games/sec"
+          f"  ({read_game_elapsed / replay_elapsed:.1f}x)")
+    print(f"replay_movetext (selected):  {len(games) / selected_elapsed:10,.0f} games/sec"
+          f"  ({read_game_elapsed / selected_elapsed:.1f}x, {selected:,} positions)")
+
+
+if __name__ == "__main__":
+    main()
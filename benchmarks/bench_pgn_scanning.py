@@ -0,0 +1,81 @@
+"""
+Microbenchmark of PGN header filtering and clock extraction on a synthetic corpus.
+
+Compares the previous regex/dict based implementations (copied below as `legacy_*`)
+against `scan_pgn_header` / `fast_filter_pgn_games` and `extract_clock_times`.
+
+Usage: python -m benchmarks.bench_pgn_scanning --games 20000
+"""
+import argparse
+import re
+import time
+
+from benchmarks.synthetic_pgn import generate_pgn_games
+from maia2.data_ingestion import fast_filter_pgn_games, scan_pgn_header, split_pgn_game
+from maia2.utils import extract_clock_times
+
+LEGACY_TAG_RE = re.compile(r'\[(WhiteElo|BlackElo|Event)\s+"([^"]+)"\]')
+COMMENT_RE = re.compile(r"\{[^}]*\}")
+
+
+def legacy_fast_filter_pgn_games(pgn_text: str, elo_threshold: int = 1200) -> bool:
+    if 'Blitz' not in pgn_text:
+        return False
+    tags = dict(LEGACY_TAG_RE.findall(pgn_text))
+    try:
+        white_elo = int(tags.get("WhiteElo", 0))
+        black_elo = int(tags.get("BlackElo", 0))
+        if white_elo <= elo_threshold or black_elo <= elo_threshold:
+            return True
+    except ValueError:
+        pass
+    return False
+
+
+def legacy_extract_clock_time(comment: str) -> int:
+    pattern = r"\[%clk (\d+):(\d+):(\d+)\]"
+    match = re.search(pattern, comment)
+    if match:
+        hours, minutes, seconds = map(int, match.groups())
+        return hours * 3600 + minutes * 60 + seconds
+    return None
+
+
+def legacy_clock_times(movetext: str) -> list[int]:
+    return [legacy_extract_clock_time(comment) for comment in COMMENT_RE.findall(movetext)]
+
+
+def timed(func, items) -> tuple[float, list]:
+    start = time.perf_counter()
+    results = [func(item) for item in items]
+    return time.perf_counter() - start, results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--games", type=int, default=20000)
+    arg_parser.add_argument("--seed", type=int, default=42)
+    args = arg_parser.parse_args()
+
+    games = generate_pgn_games(args.games, args.seed)
+    movetexts = [split_pgn_game(game)[1] for game in games]
+
+    legacy_elapsed, legacy_kept = timed(legacy_fast_filter_pgn_games, games)
+    filter_elapsed, kept = timed(fast_filter_pgn_games, games)
+    assert legacy_kept == kept, "fast_filter_pgn_games disagrees with the legacy filter"
+    scan_elapsed, _ = timed(scan_pgn_header, games)
+
+    legacy_clock_elapsed, legacy_clocks = timed(legacy_clock_times, movetexts)
+    clock_elapsed, clocks = timed(extract_clock_times, movetexts)
+    assert all(list(new) == old for new, old in zip(clocks, legacy_clocks)), "Clock extraction mismatch"
+
+    n_games = len(games)
+    print(f"legacy fast_filter_pgn_games: {n_games / legacy_elapsed:12,.0f} games/sec")
+    print(f"fast_filter_pgn_games:        {n_games / filter_elapsed:12,.0f} games/sec")
+    print(f"scan_pgn_header:              {n_games / scan_elapsed:12,.0f} games/sec")
+    print(f"legacy extract_clock_time:    {n_games / legacy_clock_elapsed:12,.0f} games/sec")
+    print(f"extract_clock_times:          {n_games / clock_elapsed:12,.0f} games/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Local HTTP server serving a byte string with `Range` support, standing in for
+database.lichess.org in offline download benchmarks.
+
+Faults are injected per request: fixed `latency` plus random `jitter` before the
+response, a `failure_rate` share of 503 responses, a `stall_rate` share of requests
+that hang for `stall_seconds` (stragglers), and a per-connection `bandwidth` cap.
+
+    async with RangeServer(data, latency=0.05, failure_rate=0.02) as server:
+        async for pos, chunk in async_parallel_stream(server.url, len(data)):
+            ...
+"""
+import asyncio
+import random
+
+from aiohttp import web
+
+PIECE_SIZE = 64 * 1024
+
+
+class RangeServer:
+    def __init__(
+        self,
+        data: bytes,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        failure_rate: float = 0.0,
+        stall_rate: float = 0.0,
+        stall_seconds: float = 5.0,
+        bandwidth: float = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        seed: int = 0
+    ):
+        self.data = data
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.bandwidth = bandwidth          # Bytes per second per connection, None for unlimited
+        self.host = host
+        self.port = port
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.failures = 0
+        self.stalls = 0
+        self._runner = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/lichess_db_standard_rated.pgn.zst"
+
+    async def start(self) -> "RangeServer":
+        app = web.Application()
+        app.router.add_get("/{name}", self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def __aenter__(self) -> "RangeServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def _parse_range(self, header: str) -> tuple[int, int]:
+        start, _, end = header.removeprefix("bytes=").partition("-")
+        start = int(start)
+        end = min(int(end) if end else len(self.data) - 1, len(self.data) - 1)
+        return start, end
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        await asyncio.sleep(self.latency + self.rng.uniform(0, self.jitter))
+        if self.rng.random() < self.failure_rate:
+            self.failures += 1
+            return web.Response(status=503)
+        if self.rng.random() < self.stall_rate:
+            self.stalls += 1
+            await asyncio.sleep(self.stall_seconds)
+
+        range_header = request.headers.get("Range")
+        if range_header is None:
+            start, end, status = 0, len(self.data) - 1, 200
+        else:
+            start, end = self._parse_range(range_header)
+            status = 206
+        response = web.StreamResponse(status=status, headers={
+            "Content-Length": str(end - start + 1),
+            "Accept-Ranges": "bytes",
+            "Content-Type": "application/octet-stream",
+        })
+        if status == 206:
+            response.headers["Content-Range"] = f"bytes {start}-{end}/{len(self.data)}"
+        await response.prepare(request)
+        if request.method == "HEAD":
+            return response
+
+        with memoryview(self.data) as view:
+            for pos in range(start, end + 1, PIECE_SIZE):
+                piece = view[pos: min(pos + PIECE_SIZE, end + 1)]
+                await response.write(piece.tobytes())
+                if self.bandwidth:
+                    await asyncio.sleep(len(piece) / self.bandwidth)
+        await response.write_eof()
+        return response
@@ -0,0 +1,371 @@
+"""
+Throughput suite of the ingestion and encoding hot paths on a deterministic synthetic corpus.
+
+Each case times one stage on its own: `ZstdUtf8Stream.feed`, `PgnStreamParser.feed`,
+`fast_filter_pgn_games`, `ParallelPgnProcessor.process_spans`, `board_to_tensor` /
+`boards_to_tensor` and `get_all_possible_moves`, and `end_to_end` runs the whole
+`IngestionPipeline` against the local `RangeServer`. Every case runs in a fresh
+interpreter so its peak RSS is its own. Results are written as JSON (MB/s of each
+case's input, compressed bytes for `zstd_feed` and `end_to_end`, games/s, peak RSS
+and the sampled RSS of worker processes) to compare commits offline. The corpus
+(`synthetic_pgn.generate_pgn_corpus` written as a multi-frame `.pgn.zst`) is kept
+in `--work-dir` and reused across runs.
+
+Usage: python -m benchmarks.suite --size-mb 64 --out results.json [--cases zstd_feed,end_to_end]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from benchmarks.synthetic_pgn import MB, generate_pgn_corpus, write_pgn_zst
+
+SUITE_VERSION = 2
+READ_SIZE = 4 * MB
+
+
+class Corpus:
+    """The `.pgn` and `.pgn.zst` files of one (size, seed, frame size) corpus in `work_dir`."""
+    def __init__(self, work_dir: Path, size_mb: float, seed: int, frame_mb: float):
+        stem = f"corpus_{size_mb:g}mb_seed{seed}_frame{frame_mb:g}mb"
+        self.pgn = Path(work_dir) / f"{stem}.pgn"
+        self.zst = Path(work_dir) / f"{stem}.pgn.zst"
+        self.size_mb, self.seed, self.frame_mb = size_mb, seed, frame_mb
+
+    def ensure(self) -> dict:
+        if not self.zst.exists():
+            text = generate_pgn_corpus(int(self.size_mb * MB), self.seed)
+            self.pgn.write_bytes(text)
+            write_pgn_zst(self.zst, text, int(self.frame_mb * MB))
+        text = self.pgn.read_bytes()
+        return {
+            "size_mb": self.size_mb,
+            "seed": self.seed,
+            "frame_mb": self.frame_mb,
+            "pgn_mb": len(text) / MB,
+            "zst_mb": self.zst.stat().st_size / MB,
+            "games": text.count(b"[Event "),
+        }
+
+
+def _rates(seconds: float, n_bytes: int = None, games: int = None, **extra) -> dict:
+    result = {"seconds": seconds}
+    if n_bytes is not None:
+        result["mb_per_s"] = n_bytes / MB / seconds
+    if games is not None:
+        result["games_per_s"] = games / seconds
+    return {**result, **extra}
+
+
+def bench_zstd_feed(corpus: Corpus, args) -> dict:
+    from maia2.data_ingestion import ZstdUtf8Stream
+
+    data = corpus.zst.read_bytes()
+    stream = ZstdUtf8Stream()
+    chars = 0
+    start = time.perf_counter()
+    for pos in range(0, len(data), READ_SIZE):
+        chars += len(stream.feed(data[pos: pos + READ_SIZE]))
+    seconds = time.perf_counter() - start
+    return _rates(seconds, len(data), decompressed_mb_per_s=corpus.pgn.stat().st_size / MB / seconds, chars=chars)
+
+
+def bench_pgn_parser_feed(corpus: Corpus, args) -> dict:
+    from maia2.data_ingestion import PgnStreamParser
+
+    text = corpus.pgn.read_text()
+    pieces = [text[pos: pos + READ_SIZE] for pos in range(0, len(text), READ_SIZE)]
+    parser = PgnStreamParser()
+    games = 0
+    start = time.perf_counter()
+    for piece in pieces:
+        games += len(parser.feed(piece))
+    games += len(parser.flush())
+    return _rates(time.perf_counter() - start, corpus.pgn.stat().st_size, games)
+
+
+def bench_fast_filter(corpus: Corpus, args) -> dict:
+    from maia2.data_ingestion import fast_filter_pgn_games
+
+    text = corpus.pgn.read_text()
+    games = ["[Event " + game for game in text.split("\n[Event ")]
+    games[0] = games[0].removeprefix("[Event ")
+    start = time.perf_counter()
+    accepted = sum(1 for game in games if fast_filter_pgn_games(game))
+    return _rates(time.perf_counter() - start, corpus.pgn.stat().st_size, len(games), accepted=accepted)
+
+
+def bench_parallel_processor(corpus: Corpus, args) -> dict:
+    from maia2.data_ingestion import ParallelPgnProcessor, PgnByteSplitter
+
+    data = corpus.pgn.read_bytes()
+
+    async def run() -> tuple[int, int]:
+        processor = ParallelPgnProcessor(workers=args.workers, use_shared_memory=True)
+        splitter = PgnByteSplitter()
+        accepted = 0
+        try:
+            for pos in range(0, len(data), args.chunk_mb * MB):
+                spans = splitter.feed(data[pos: pos + args.chunk_mb * MB])
+                accepted += len((await processor.process_spans(splitter.buffer, spans))[0])
+            accepted += len((await processor.process_spans(splitter.buffer, splitter.flush()))[0])
+        finally:
+            processor.close()
+        return splitter.games_emitted, accepted
+
+    start = time.perf_counter()
+    games, accepted = asyncio.run(run())
+    return _rates(time.perf_counter() - start, len(data), games, accepted=accepted, workers=args.workers)
+
+
+def bench_board_to_tensor(corpus: Corpus, args) -> dict:
+    from benchmarks.bench_board_encoding import random_positions
+    from maia2.utils import board_to_tensor, boards_to_tensor
+
+    boards = random_positions(args.positions, args.seed)
+    start = time.perf_counter()
+    for board in boards:
+        board_to_tensor(board)
+    per_board = time.perf_counter() - start
+    start = time.perf_counter()
+    for idx in range(0, len(boards), 8192):
+        boards_to_tensor(boards[idx: idx + 8192])
+    batched = time.perf_counter() - start
+    return {
+        "seconds": per_board + batched,
+        "positions_per_s": len(boards) / per_board,
+        "batched_positions_per_s": len(boards) / batched,
+    }
+
+
+def bench_get_all_possible_moves(corpus: Corpus, args) -> dict:
+    from maia2.utils import get_all_possible_moves
+
+    calls = 20
+    start = time.perf_counter()
+    for _ in range(calls):
+        moves = get_all_possible_moves()
+    seconds = time.perf_counter() - start
+    return {"seconds": seconds, "calls_per_s": calls / seconds, "moves": len(moves)}
+
+
+def bench_end_to_end(corpus: Corpus, args) -> dict:
+    from benchmarks.range_server import RangeServer
+    from maia2.data_ingestion import (
+        DownloadCheckpoint,
+        IngestionPipeline,
+        ParallelPgnProcessor,
+        PgnByteSplitter,
+        ZstdUtf8Stream,
+        async_parallel_stream,
+    )
+    from maia2.game_metadata import GameMetadataWriter
+
+    data = corpus.zst.read_bytes()
+
+    async def run(out_dir: Path) -> tuple[dict, int, int]:
+        checkpoint = DownloadCheckpoint(out_dir / "checkpoint.json", out_dir / "games.pgn")
+        processor = ParallelPgnProcessor(workers=args.workers, use_shared_memory=True)
+        splitter = PgnByteSplitter()
+        try:
+            async with RangeServer(data, latency=args.latency) as server:
+                with open(out_dir / "games.pgn", "wb") as out, GameMetadataWriter(out_dir / "metadata") as metadata_out:
+                    pipeline = IngestionPipeline(processor, splitter, ZstdUtf8Stream(), checkpoint, out, metadata_out)
+                    chunks = async_parallel_stream(server.url, len(data), chunk_size=args.chunk_mb * MB)
+                    stage_stats = await pipeline.run(chunks)
+                    return stage_stats, splitter.total_seen, metadata_out.rows
+        finally:
+            processor.close()
+
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as out_dir:
+        start = time.perf_counter()
+        stage_stats, games, written = asyncio.run(run(Path(out_dir)))
+        seconds = time.perf_counter() - start
+    return _rates(
+        seconds, len(data), games,
+        decompressed_mb_per_s=corpus.pgn.stat().st_size / MB / seconds,
+        written=written, workers=args.workers, stages=stage_stats
+    )
+
+
+CASES = {
+    "zstd_feed": bench_zstd_feed,
+    "pgn_parser_feed": bench_pgn_parser_feed,
+    "fast_filter": bench_fast_filter,
+    "parallel_processor": bench_parallel_processor,
+    "board_to_tensor": bench_board_to_tensor,
+    "get_all_possible_moves": bench_get_all_possible_moves,
+    "end_to_end": bench_end_to_end,
+}
+
+
+def _peak_rss_mb(who: int) -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (MB if sys.platform == "darwin" else 1024)
+
+
+class WorkerRssSampler:
+    """
+    Samples the RSS (`VmRSS` in `/proc/<pid>/status`) of the processes started below this
+    one after `start()`, e.g. pool workers, every `interval` seconds in a thread. Processes
+    already running (torch's helper) are left out, and so are workers that come and go
+    between two samples. Forked workers count the pages they still share with this
+    process. Linux only; elsewhere the peaks stay None.
+    """
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_total_mb = self.peak_worker_mb = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._existing = set()
+
+    @staticmethod
+    def _descendants() -> set[int]:
+        parents = {}
+        for entry in Path("/proc").iterdir():
+            if entry.name.isdigit():
+                try:
+                    # The command name may hold spaces, the ppid follows its closing parenthesis
+                    parents[int(entry.name)] = int((entry / "stat").read_text().rpartition(")")[2].split()[1])
+                except (OSError, IndexError, ValueError):
+                    continue
+        found, frontier = set(), {os.getpid()}
+        while frontier:
+            frontier = {pid for pid, parent in parents.items() if parent in frontier} - found
+            found |= frontier
+        return found
+
+    @staticmethod
+    def _rss_mb(pid: int) -> float:
+        try:
+            for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return 0.0
+
+    def _sample(self):
+        sizes = [self._rss_mb(pid) for pid in self._descendants() - self._existing]
+        self.peak_total_mb = max(self.peak_total_mb or 0.0, sum(sizes))
+        self.peak_worker_mb = max([self.peak_worker_mb or 0.0] + sizes)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        if Path("/proc/self/status").exists():
+            self._existing = self._descendants()
+            self._thread.start()
+
+    def stop(self):
+        if self._thread.is_alive():
+            self._stop.set()
+            self._thread.join()
+            self._sample()
+
+
+def run_case(name: str, args) -> dict:
+    """
+    Runs one case in this process. The baseline is the peak after importing maia2 (torch
+    included), so a peak above it comes from the case. Worker processes the case starts
+    are sampled by `WorkerRssSampler`: their peak summed RSS and the largest one.
+    """
+    import maia2.data_ingestion
+
+    corpus = Corpus(args.work_dir, args.size_mb, args.seed, args.frame_mb)
+    baseline = _peak_rss_mb(resource.RUSAGE_SELF)
+    sampler = WorkerRssSampler()
+    sampler.start()
+    try:
+        result = CASES[name](corpus, args)
+    finally:
+        sampler.stop()
+    result["baseline_rss_mb"] = baseline
+    result["peak_rss_mb"] = _peak_rss_mb(resource.RUSAGE_SELF)
+    result["peak_workers_rss_mb"] = sampler.peak_total_mb
+    result["peak_worker_rss_mb"] = sampler.peak_worker_mb
+    return result
+
+
+def _case_argv(name: str, args) -> list[str]:
+    return [
+        sys.executable, "-m", "benchmarks.suite", "--case", name,
+        "--work-dir", str(args.work_dir), "--size-mb", str(args.size_mb), "--frame-mb", str(args.frame_mb),
+        "--seed", str(args.seed), "--workers", str(args.workers), "--chunk-mb", str(args.chunk_mb),
+        "--positions", str(args.positions), "--latency", str(args.latency),
+    ]
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=Path(__file__).parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--size-mb", type=float, default=64, help="Decompressed PGN size of the corpus")
+    arg_parser.add_argument("--frame-mb", type=float, default=4, help="Decompressed bytes per zstd frame")
+    arg_parser.add_argument("--seed", type=int, default=42)
+    arg_parser.add_argument("--workers", type=int, default=os.cpu_count())
+    arg_parser.add_argument("--chunk-mb", type=int, default=8, help="Range size and filter chunk size")
+    arg_parser.add_argument("--positions", type=int, default=20000, help="Boards for board_to_tensor")
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="Range server latency in seconds")
+    arg_parser.add_argument("--cases", default=",".join(CASES))
+    arg_parser.add_argument("--work-dir", type=Path, default=Path(tempfile.gettempdir()) / "maia2_benchmarks")
+    arg_parser.add_argument("--out", type=Path, help="JSON results file, printed when omitted")
+    arg_parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    args.work_dir.mkdir(parents=True, exist_ok=True)
+    if args.case:
+        print(json.dumps(run_case(args.case, args)))
+        return
+
+    corpus = Corpus(args.work_dir, args.size_mb, args.seed, args.frame_mb).ensure()
+    results = {}
+    for name in args.cases.split(","):
+        if name not in CASES:
+            arg_parser.error(f"Unknown case {name}, expected one of {', '.join(CASES)}")
+        completed = subprocess.run(_case_argv(name, args), capture_output=True, text=True)
+        if completed.returncode != 0:
+            results[name] = {"error": completed.stderr.strip().splitlines()[-1:]}
+            print(f"{name:>24}: failed\n{completed.stderr}", file=sys.stderr)
+            continue
+        results[name] = json.loads(completed.stdout.strip().splitlines()[-1])
+        rates = {key: value for key, value in results[name].items() if key.endswith("_per_s")}
+        summary = ", ".join(f"{key} {value:,.1f}" for key, value in rates.items())
+        print(f"{name:>24}: {summary} (peak RSS {results[name]['peak_rss_mb']:.0f} MB)", file=sys.stderr)
+
+    report = {
+        "suite_version": SUITE_VERSION,
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "corpus": corpus,
+        "results": results,
+    }
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Deterministic generator of Lichess-style PGN games for benchmarks.
+
+Games carry the usual Lichess header tags, Elo ratings drawn from a normal
+distribution and `[%clk]` comments after every move. Movetext is produced by random
+legal playouts; a small pool of playouts is reused across games to keep generation fast.
+
+`write_pgn_zst` compresses a corpus into independent zstd frames with content
+checksums, like the Lichess dumps. As a script it writes a corpus of a given size:
+
+    python -m benchmarks.synthetic_pgn --size-mb 64 --out corpus.pgn.zst
+"""
+import argparse
+import random
+from pathlib import Path
+
+import chess
+import pyzstd
+
+MB = 1024 * 1024
+
+EVENTS = [
+    ("Rated Blitz game", ["180+0", "180+2", "300+0", "300+3"]),
+    ("Rated Bullet game", ["60+0", "120+1"]),
+    ("Rated Rapid game", ["600+0", "600+5", "900+10"]),
+    ("Rated Classical game", ["1800+0", "1800+20"]),
+]
+TERMINATIONS = ["Normal", "Normal", "Normal", "Time forfeit"]
+
+
+def random_playout(rng: random.Random, max_plies: int = 120) -> tuple[list[str], str]:
+    """Plays random legal moves and returns the SAN moves and the game result."""
+    board = chess.Board()
+    sans = []
+    for _ in range(rng.randint(10, max_plies)):
+        legal_moves = list(board.legal_moves)
+        if not legal_moves:
+            break
+        move = rng.choice(legal_moves)
+        sans.append(board.san(move))
+        board.push(move)
+    result = board.result(claim_draw=False)
+    if result == "*":
+        result = rng.choice(["1-0", "0-1", "1/2-1/2"])
+    return sans, result
+
+
+def format_movetext(rng: random.Random, sans: list[str], result: str, base_seconds: int, increment: int) -> str:
+    clocks = [base_seconds, base_seconds]
+    tokens = []
+    for ply, san in enumerate(sans):
+        side = ply % 2
+        clocks[side] = max(0, clocks[side] - rng.randint(0, 8) + increment)
+        hours, rem = divmod(clocks[side], 3600)
+        minutes, seconds = divmod(rem, 60)
+        move_number = ply // 2 + 1
+        prefix = f"{move_number}." if side == 0 else f"{move_number}..."
+        tokens.append(f"{prefix} {san} {{ [%clk {hours}:{minutes:02d}:{seconds:02d}] }}")
+    tokens.append(result)
+    return " ".join(tokens)
+
+
+def generate_game(rng: random.Random, game_id: int, playouts: list[tuple[list[str], str]]) -> str:
+    event, time_controls = rng.choice(EVENTS)
+    time_control = rng.choice(time_controls)
+    base_seconds, increment = map(int, time_control.split("+"))
+    sans, result = rng.choice(playouts)
+    white_elo = max(400, int(rng.gauss(1500, 350)))
+    black_elo = max(400, int(rng.gauss(1500, 350)))
+
+    headers = [
+        ("Event", event),
+        ("Site", f"https://lichess.org/{game_id:08x}"),
+        ("Date", "2023.11.01"),
+        ("Round", "-"),
+        ("White", f"player{rng.randrange(100000)}"),
+        ("Black", f"player{rng.randrange(100000)}"),
+        ("Result", result),
+        ("UTCDate", "2023.11.01"),
+        ("UTCTime", f"{rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}"),
+        ("WhiteElo", str(white_elo)),
+        ("BlackElo", str(black_elo)),
+        ("WhiteRatingDiff", f"{rng.randint(-9, 9):+d}"),
+        ("BlackRatingDiff", f"{rng.randint(-9, 9):+d}"),
+        ("ECO", "C20"),
+        ("Opening", "King's Pawn Game"),
+        ("TimeControl", time_control),
+        ("Termination", rng.choice(TERMINATIONS)),
+    ]
+    header_text = "\n".join(f'[{tag} "{value}"]' for tag, value in headers)
+    return header_text + "\n\n" + format_movetext(rng, sans, result, base_seconds, increment)
+
+
+def generate_pgn_games(n_games: int, seed: int = 42, n_playouts: int = 64) -> list[str]:
+    rng = random.Random(seed)
+    playouts = [random_playout(rng) for _ in range(n_playouts)]
+    return [generate_game(rng, game_id, playouts) for game_id in range(n_games)]
+
+
+def generate_pgn_text(n_games: int, seed: int = 42, n_playouts: int = 64) -> str:
+    """A whole PGN file as Lichess writes it: games separated by a blank line."""
+    return "\n\n".join(generate_pgn_games(n_games, seed, n_playouts)) + "\n\n"
+
+
+def generate_pgn_corpus(size_bytes: int, seed: int = 42, n_playouts: int = 256) -> bytes:
+    """At least `size_bytes` of PGN text (whole games), identical for a given seed."""
+    rng = random.Random(seed)
+    playouts = [random_playout(rng) for _ in range(n_playouts)]
+    games, size = [], 0
+    while size < size_bytes:
+        game = generate_game(rng, len(games), playouts) + "\n\n"
+        games.append(game)
+        size += len(game.encode())
+    return "".join(games).encode()
+
+
+def write_pgn_zst(path: Path, text: bytes, frame_size: int = 4 * MB, level: int = 3) -> int:
+    """Writes `text` as one zstd frame per `frame_size` bytes of input; returns the frame count."""
+    option = {pyzstd.CParameter.compressionLevel: level, pyzstd.CParameter.checksumFlag: 1}
+    frames = 0
+    with open(path, "wb") as file:
+        for start in range(0, len(text), frame_size):
+            file.write(pyzstd.compress(text[start: start + frame_size], level_or_option=option))
+            frames += 1
+    return frames
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--size-mb", type=float, default=64)
+    arg_parser.add_argument("--frame-mb", type=float, default=4)
+    arg_parser.add_argument("--seed", type=int, default=42)
+    arg_parser.add_argument("--out", type=Path, required=True)
+    args = arg_parser.parse_args()
+
+    text = generate_pgn_corpus(int(args.size_mb * MB), args.seed)
+    if args.out.suffix == ".zst":
+        frames = write_pgn_zst(args.out, text, int(args.frame_mb * MB))
+        print(f"Wrote {len(text) / MB:.1f} MB of PGN as {frames} frames ({args.out.stat().st_size / MB:.1f} MB) to {args.out}")
+    else:
+        args.out.write_bytes(text)
+        print(f"Wrote {len(text) / MB:.1f} MB of PGN to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
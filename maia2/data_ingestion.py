@@ -2,36 +2,64 @@ import aiohttp
 import asyncio
 # import chess.pgn
 import codecs
-import heapq
-import io
 import pyzstd
 from pathlib import Path
 import requests
 import re
 import multiprocessing as mp
-from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 import json
 import tqdm
 import hashlib
+import os
 import signal
+import tempfile
+import threading
 import random
-from maia2.utils import setup_data_directory
-from maia2.logger import get_logger
+import time
+from typing import NamedTuple
+import numpy as np
+from maia2.utils import ELO_BUCKETS, Config, EloBuckets, extract_clock_times, setup_data_directory
+from maia2.logger import get_logger, rate_limited
+from maia2.dump_cache import DumpCache
+from maia2.game_metadata import (
+    GAME_METADATA_DTYPE,
+    RESULT_CODES,
+    UNKNOWN_RESULT,
+    GameMetadata,
+    GameMetadataWriter,
+    column_paths,
+    parse_time_control,
+)
+from maia2.zstd_frames import (
+    FrameIndex,
+    FrameIndexBuilder,
+    FrameTracker,
+    find_corrupt_frames,
+    parallel_decompress_file,
+)
 
 MB: int = 1024 * 1024
+QUOTA_CHUNK_GAMES: int = 20000      # Games per `EloStratifiedSampler` chunk, the config's `chunk_size`
 log = get_logger("data")
+# Per-chunk messages, see `RateLimitedLogger`
+hot_log = rate_limited(log, interval=10.0)
 
-# Optimized Regex patterns
-# Captures: [WhiteElo "1150"] -> Groups: WhiteElo, 1150
-TAG_RE = re.compile(r'\[(WhiteElo|BlackElo|Event)\s+"([^"]+)"\]')
 # Boundary: Splits strictly at the start of a new PGN block
 GAME_BOUNDARY = re.compile(r'\n(?=\[Event )')
 
 
-def get_lichess_database_metadata(year: int, month: int) -> dict:
+_METADATA_CACHE: dict[tuple[int, int], dict] = {}
+
+
+def get_lichess_database_metadata(year: int, month: int, refresh: bool = False) -> dict:
+    """Response headers of a month's dump from a HEAD request, cached for the process."""
+    if not refresh and (year, month) in _METADATA_CACHE:
+        return _METADATA_CACHE[year, month]
     url = f"https://database.lichess.org/standard/lichess_db_standard_rated_{year}-{month:02d}.pgn.zst"
     try:
-        response: requests.Request = requests.get(url, timeout=5)
+        response: requests.Response = requests.head(url, timeout=5, allow_redirects=True, stream=True)
         response.raise_for_status()
         headers = response.headers
         content_type, content_length = headers.get("content-type"), headers.get("content-length")
@@ -41,7 +69,7 @@ def get_lichess_database_metadata(year: int, month: int) -> dict:
         domain = url.split("//")[1].split("/")[0]
         port, ip_address = response.raw.connection.sock.getpeername() if response.raw.connection and response.raw.connection.sock else (None, None)
 
-        return {
+        _METADATA_CACHE[year, month] = {
             "url": url,
             "server": response.headers.get('Server'),
             "domain": domain,
@@ -50,9 +78,11 @@ def get_lichess_database_metadata(year: int, month: int) -> dict:
             "content_length": content_length,
             "request_date": request_date,
             "last_modified_date": last_modified_date,
+            "etag": headers.get("ETag"),
             "ip_address": ip_address,
             "port": port
         }
+        return _METADATA_CACHE[year, month]
     except requests.exceptions.Timeout:
         log.error(f"TimeOutException: Request timed out for url -> {url}")
     except requests.exceptions.RequestException as e:
@@ -67,9 +97,8 @@ class AsyncOrderedQueue:
         self.q = asyncio.PriorityQueue(maxsize=max_chunks)
     
     async def put(self, priority: int, data):
-        print("Put chunk with priority", priority)
         await self.q.put((priority, data))
-        print("Put chunk with priority", priority, "into queue")
+        hot_log.debug("Put chunk with priority %s into queue", priority)
         
     async def get(self):
         priority, data = await self.q.get()
@@ -83,10 +112,93 @@ class AsyncOrderedQueue:
         await self.q.put((float('inf'), None))
 
   
+class StreamVerifier:
+    """
+    The one SHA-256 of a compressed stream, fed with `(chunk, offset)` pairs.
+
+    Bytes it already covers are skipped, so several stages may feed the same verifier
+    and each byte is still hashed once; a gap invalidates it. `update()` hashes in the
+    calling thread, `submit()` hands chunks to the verifier's own thread so the event
+    loop never hashes. The hash state is not saved: a resumed stream is hashed again
+    from byte 0, e.g. from the partial file of a `CachedDumpWriter`, or not verified.
+    """
+    def __init__(self):
+        self.hashed_bytes = 0
+        self.valid = True
+        self._hasher = hashlib.sha256()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pending = []
+
+    def update(self, chunk: bytes, offset: int = None):
+        with self._lock:
+            if not self.valid:
+                return
+            offset = self.hashed_bytes if offset is None else offset
+            if offset > self.hashed_bytes:
+                log.warning(f"Gap in hashed data at byte {self.hashed_bytes}, the checksum will not cover this run.")
+                self.valid = False
+                return
+            if offset + len(chunk) > self.hashed_bytes:
+                self._hasher.update(chunk[self.hashed_bytes - offset:])
+                self.hashed_bytes = offset + len(chunk)
+
+    async def submit(self, chunk: bytes, offset: int = None, max_pending: int = 4):
+        """Hashes `chunk` in the verifier's thread, waiting only if `max_pending` chunks are queued."""
+        if self._thread is None:
+            self._thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sha256")
+        self._pending.append(asyncio.get_running_loop().run_in_executor(self._thread, self.update, chunk, offset))
+        while len(self._pending) > max_pending:
+            await self._pending.pop(0)
+
+    async def drain(self):
+        pending, self._pending = self._pending, []
+        await asyncio.gather(*pending)
+
+    def close(self):
+        if self._thread is not None:
+            self._thread.shutdown()
+            self._thread = None
+
+    def hexdigest(self) -> str | None:
+        with self._lock:
+            return self._hasher.hexdigest() if self.valid else None
+
+    def state(self) -> dict:
+        """`hashed_bytes` and `checksum`, taken atomically."""
+        with self._lock:
+            checksum = self._hasher.hexdigest() if self.valid else None
+            return {"hashed_bytes": self.hashed_bytes, "checksum": checksum}
+
+    def verify(self, expected_sha256: str, total_size: int) -> bool | None:
+        """True/False once the whole stream is hashed, None if this verifier cannot tell."""
+        if not self.valid or self.hashed_bytes != total_size:
+            return None
+        return self.hexdigest() == expected_sha256.lower()
+
+
 class DownloadCheckpoint:
-    def __init__(self, checkpoint_path: Path, target_file: Path):
+    """
+    Resume state of one month. Besides the remote position and game count it records
+    how many bytes of each output file were valid at that point, so a restart truncates
+    the outputs back to a consistent state. The SHA-256 covers one run: a resumed month
+    is only verified when its `CachedDumpWriter` hashes the bytes before the resume.
+
+    `commit()` updates the state after every chunk but only persists it (fsync of the
+    outputs, then an atomic JSON replace) every `commit_every` bytes or
+    `commit_interval` seconds, on completion, or on `persist()`.
+    """
+    def __init__(
+        self,
+        checkpoint_path: Path,
+        target_file: Path,
+        commit_every: int = 256 * MB,
+        commit_interval: float = 30.0
+    ):
         self.path = Path(checkpoint_path)
         self.target_file = Path(target_file)
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
         
         # Internal state defaults
         self.state = {
@@ -95,11 +207,17 @@ class DownloadCheckpoint:
             "expected_size": None,   # Remote content-length
             "processed_games": 0,    # Counter for your DB
             "last_sync_point": 0,    # Last known Zstd frame boundary
-            "checksum": None         # SHA-256 hex of data processed so far
+            "checksum": None,        # SHA-256 hex of data processed so far
+            "hashed_bytes": 0,       # Compressed bytes covered by the checksum
+            "verified": None,        # Whether the checksum matched the published SHA-256
+            "output_offsets": {},    # Valid bytes of each output file at this checkpoint
+            "elo_quota": None        # Counters of the open `EloStratifiedSampler` chunk
         }
         
-        self._hasher = hashlib.sha256()
         self._load_and_validate()
+        self.verifier = StreamVerifier()
+        self._persisted_byte = self.state["next_byte"]
+        self._persisted_time = time.monotonic()
 
     def _load_and_validate(self):
         """Loads state and performs a sanity check against the actual output file."""
@@ -111,22 +229,72 @@ class DownloadCheckpoint:
             
             # If the output file was deleted but checkpoint exists, reset next_byte
             if not self.target_file.exists() and stored.get("next_byte", 0) > 0:
-                print("Target file missing. Resetting checkpoint to 0.")
+                log.warning("Target file missing. Resetting checkpoint to 0.")
                 return
 
             self.state.update(stored)
             
         except (json.JSONDecodeError, KeyError) as e:
-            print(f"Checkpoint corrupted ({e}). Initializing new state.")
-
-    def update_hash(self, chunk: bytes):
-        """Update rolling hash of the COMPRESSED stream."""
-        self._hasher.update(chunk)
-
-    def commit(self, next_byte: int, games_count: int = None, is_sync_point: bool = False, complete: bool = False):
+            log.warning(f"Checkpoint corrupted ({e}). Initializing new state.")
+
+    def restore_outputs(self, outputs: dict[str, Path]) -> bool:
+        """
+        Truncates every output file back to its committed size, dropping games written
+        after the last persisted commit. Returns False (and resets the checkpoint) if an
+        output is shorter than recorded, as resuming would then lose games.
+        """
+        offsets = self.state["output_offsets"]
+        for name, path in outputs.items():
+            if name not in offsets:
+                continue
+            path = Path(path)
+            size = path.stat().st_size if path.exists() else 0
+            if size < offsets[name]:
+                log.warning(f"Output {path} is shorter than its checkpoint. Starting over.")
+                self.reset()
+                return False
+            if size > offsets[name]:
+                log.info(f"Truncating {path} from {size} to {offsets[name]} bytes")
+                os.truncate(path, offsets[name])
+        return True
+
+    def reset(self):
+        self.state.update(
+            next_byte=0, complete=False, processed_games=0, last_sync_point=0,
+            checksum=None, hashed_bytes=0, verified=None, output_offsets={},
+            elo_quota=None
+        )
+        self.verifier = StreamVerifier()
+        self._persisted_byte = 0
+
+    def update_hash(self, chunk: bytes, offset: int = None):
+        """
+        Update rolling hash of the COMPRESSED stream with `chunk`, which starts at remote
+        byte `offset`. Bytes already hashed (by a `CachedDumpWriter` sharing the verifier)
+        are skipped.
+        """
+        self.verifier.update(chunk, offset)
+
+    def verify(self, expected_sha256: str, total_size: int) -> bool | None:
+        """Checks the stream against its published SHA-256 and records the outcome."""
+        self.state["verified"] = self.verifier.verify(expected_sha256, total_size)
+        return self.state["verified"]
+
+    def commit(
+        self,
+        next_byte: int,
+        games_count: int = None,
+        is_sync_point: bool = False,
+        complete: bool = False,
+        outputs: dict = None,
+        force: bool = False
+    ) -> bool:
+        """
+        Records the state after a chunk whose games were written to the open `outputs`
+        files ({name: binary file}). Returns True if it was persisted.
+        """
         self.state["next_byte"] = next_byte
         self.state["complete"] = complete
-        self.state["checksum"] = self._hasher.hexdigest()
         
         if games_count is not None:
             self.state["processed_games"] = games_count
@@ -134,13 +302,39 @@ class DownloadCheckpoint:
         if is_sync_point:
             self.state["last_sync_point"] = next_byte
 
+        for name, file in (outputs or {}).items():
+            self.state["output_offsets"][name] = file.tell()
+
+        due = (
+            next_byte - self._persisted_byte >= self.commit_every
+            or time.monotonic() - self._persisted_time >= self.commit_interval
+        )
+        if force or complete or due:
+            self.persist(outputs)
+            return True
+        return False
+
+    def persist(self, outputs: dict = None):
+        """Writes the current state to disk once the outputs it describes are durable."""
+        for file in (outputs or {}).values():
+            if not file.closed:
+                file.flush()
+                os.fsync(file.fileno())
+
+        self.state.update(self.verifier.state())
+        state = json.dumps(self.state, indent=4)
+
         # Atomic Write Pattern
         temp_path = self.path.with_suffix(".tmp")
         with open(temp_path, "w") as f:
-            json.dump(self.state, f, indent=4)
+            f.write(state)
+            f.flush()
+            os.fsync(f.fileno())
         
         # rename/replace is atomic on most OSs
         temp_path.replace(self.path)
+        self._persisted_byte = self.state["next_byte"]
+        self._persisted_time = time.monotonic()
 
     @property
     def next_byte(self) -> int:
@@ -151,10 +345,6 @@ class DownloadCheckpoint:
         """The last byte where Zstd decompression was guaranteed to be stable."""
         return self.state["last_sync_point"]
 
-    @property
-    def next_byte(self) -> int:
-        return self.state["next_byte"]
-
     @property
     def is_complete(self) -> bool:
         return self.state["complete"]       
@@ -174,9 +364,18 @@ class ZstdUtf8Stream:
         return self._last_call_synced
 
     def feed(self, chunk: bytes) -> str:
+        try:
+            return self._decoder.decode(self.feed_bytes(chunk))
+        except UnicodeDecodeError:
+            # Fallback for lost context, same as a decompression error
+            self._reset()
+            return self.feed(chunk)
+
+    def feed_bytes(self, chunk: bytes) -> bytes:
+        """Like feed(), but returns the decompressed bytes without UTF-8 decoding them."""
         if not chunk:
             self._last_call_synced = False
-            return ""
+            return b""
 
         # Reset sync flag for this specific chunk
         self._last_call_synced = False
@@ -186,19 +385,21 @@ class ZstdUtf8Stream:
                 # Attempt to find magic number
                 synced_chunk = self._resync(chunk)
                 if not synced_chunk:
-                    return ""
+                    return b""
                 chunk = synced_chunk
                 self._last_call_synced = True # Signal that we found a boundary
 
-            decompressed = self._zstd.decompress(chunk)
-            return self._decoder.decode(decompressed)
+            return self._zstd.decompress(chunk)
 
-        except (pyzstd.ZstdError, UnicodeDecodeError) as e:
+        except pyzstd.ZstdError as e:
             # Fallback for mid-stream corruption or lost context
-            self._in_sync = False
-            self._zstd = pyzstd.EndlessZstdDecompressor()
-            self._decoder = codecs.getincrementaldecoder("utf-8")()
-            return self.feed(chunk) # Recursively retry with the current chunk
+            self._reset()
+            return self.feed_bytes(chunk) # Recursively retry with the current chunk
+
+    def _reset(self):
+        self._in_sync = False
+        self._zstd = pyzstd.EndlessZstdDecompressor()
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
 
     def _resync(self, chunk: bytes) -> bytes:
         pos = chunk.find(self.ZSTD_MAGIC)
@@ -214,28 +415,544 @@ class ZstdUtf8Stream:
         except:
             return ""
 
+    def flush_bytes(self) -> bytes:
+        try:
+            return self._zstd.decompress(b"")
+        except pyzstd.ZstdError:
+            return b""
+
   
+class PgnHeader(NamedTuple):
+    event: str
+    white_elo: int          # -1 when missing or not a number (e.g. "?")
+    black_elo: int
+    time_control: str
+    result: str
+    termination: str
+
+
+def split_pgn_game(pgn_text: str) -> tuple[str, str]:
+    """Splits a game into its tag section and movetext at the first blank line."""
+    header_end = pgn_text.find("\n\n")
+    if header_end == -1:
+        return pgn_text, ""
+    return pgn_text[:header_end], pgn_text[header_end + 2:]
+
+
+def _header_tag(pgn_text: str, tag_prefix: str, header_end: int) -> str:
+    start = pgn_text.find(tag_prefix, 0, header_end)
+    if start == -1:
+        return ""
+    start += len(tag_prefix)
+    return pgn_text[start: pgn_text.find('"', start, header_end)]
+
+
+def _parse_elo(value: str | bytes) -> int:
+    return int(value) if value.isdigit() else -1
+
+
+def _header_end(pgn_text: str) -> int:
+    header_end = pgn_text.find("\n\n")
+    return len(pgn_text) if header_end == -1 else header_end
+
+
+def scan_pgn_header(pgn_text: str) -> PgnHeader:
+    """
+    Reads the tags needed for filtering from the header block only, the movetext
+    after the first blank line is never searched.
+    """
+    header_end = _header_end(pgn_text)
+    return PgnHeader(
+        event=_header_tag(pgn_text, '[Event "', header_end),
+        white_elo=_parse_elo(_header_tag(pgn_text, '[WhiteElo "', header_end)),
+        black_elo=_parse_elo(_header_tag(pgn_text, '[BlackElo "', header_end)),
+        time_control=_header_tag(pgn_text, '[TimeControl "', header_end),
+        result=_header_tag(pgn_text, '[Result "', header_end),
+        termination=_header_tag(pgn_text, '[Termination "', header_end)
+    )
+
+
+def _header_tag_bytes(buffer: bytes, tag_prefix: bytes, start: int, header_end: int) -> bytes:
+    pos = buffer.find(tag_prefix, start, header_end)
+    if pos == -1:
+        return b""
+    pos += len(tag_prefix)
+    return buffer[pos: buffer.find(b'"', pos, header_end)]
+
+
+def scan_pgn_header_bytes(buffer: bytes, start: int, end: int) -> PgnHeader:
+    """
+    `scan_pgn_header` for a game stored as `buffer[start:end]` (bytes or bytearray),
+    only the tag values themselves are decoded.
+    """
+    header_end = buffer.find(b"\n\n", start, end)
+    if header_end == -1:
+        header_end = end
+    return PgnHeader(
+        event=_header_tag_bytes(buffer, b'[Event "', start, header_end).decode(),
+        white_elo=_parse_elo(_header_tag_bytes(buffer, b'[WhiteElo "', start, header_end)),
+        black_elo=_parse_elo(_header_tag_bytes(buffer, b'[BlackElo "', start, header_end)),
+        time_control=_header_tag_bytes(buffer, b'[TimeControl "', start, header_end).decode(),
+        result=_header_tag_bytes(buffer, b'[Result "', start, header_end).decode(),
+        termination=_header_tag_bytes(buffer, b'[Termination "', start, header_end).decode()
+    )
+
+
 def fast_filter_pgn_games(pgn_text: str, elo_threshold: int = 1200) -> bool:
-    if 'Blitz' not in pgn_text:
+    header_end = _header_end(pgn_text)
+    if 'Blitz' not in _header_tag(pgn_text, '[Event "', header_end):
         return False
-    # Extract only relevant header tags using regex
-    tags = dict(TAG_RE.findall(pgn_text))
-    
-    try:
-        white_elo = int(tags.get("WhiteElo", 0))
-        black_elo = int(tags.get("BlackElo", 0))
-        # Simple filter: Only consider games where at lease one player has an Elo equal to or below the threshold
-        # TODO: Verify other tags like Event, TimeControl, etc. to further optimize filtering
-        if white_elo <= elo_threshold or black_elo <= elo_threshold:
-            return True
-    except ValueError:
-        pass
-    return False
+    # Simple filter: Only consider games where at lease one player has an Elo equal to or below the threshold
+    # See GameFilter for the configurable version (TimeControl, Termination, ply count, clocks)
+    white_elo = _parse_elo(_header_tag(pgn_text, '[WhiteElo "', header_end))
+    black_elo = _parse_elo(_header_tag(pgn_text, '[BlackElo "', header_end))
+    return 0 <= white_elo <= elo_threshold or 0 <= black_elo <= elo_threshold
+
+
+HEADER_STAGE = 0      # Predicates that only need the tag section
+MOVETEXT_STAGE = 1    # Predicates that need the movetext (clocks, ply count)
+
+COMMENT_RE = re.compile(r"\{[^}]*\}")
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+
+def count_plies(movetext: str) -> int:
+    """Counts SAN moves in a movetext, ignoring comments, move numbers and the result."""
+    tokens = COMMENT_RE.sub(" ", movetext).split()
+    return sum(1 for token in tokens if not token.endswith(".") and token not in RESULTS)
+
+
+class EventPredicate:
+    stage = HEADER_STAGE
+
+    def __init__(self, events: list[str]):
+        self.events = tuple(events)
+
+    def __call__(self, header: PgnHeader) -> bool:
+        return any(event in header.event for event in self.events)
+
+
+class EloPredicate:
+    """Keeps games where any (or both) of the players are rated within [min_elo, max_elo]."""
+    stage = HEADER_STAGE
+
+    def __init__(self, min_elo: int = 0, max_elo: int = 1200, players: str = "any"):
+        if players not in ("any", "both"):
+            raise ValueError(f"players must be 'any' or 'both', got {players!r}")
+        self.min_elo, self.max_elo, self.players = min_elo, max_elo, players
+
+    def __call__(self, header: PgnHeader) -> bool:
+        white_ok = self.min_elo <= header.white_elo <= self.max_elo
+        black_ok = self.min_elo <= header.black_elo <= self.max_elo
+        return (white_ok or black_ok) if self.players == "any" else (white_ok and black_ok)
+
+
+class TimeControlPredicate:
+    stage = HEADER_STAGE
+
+    def __init__(self, time_controls: list[str]):
+        self.time_controls = frozenset(time_controls)
+
+    def __call__(self, header: PgnHeader) -> bool:
+        return header.time_control in self.time_controls
+
+
+class TerminationPredicate:
+    stage = HEADER_STAGE
+
+    def __init__(self, terminations: list[str]):
+        self.terminations = frozenset(terminations)
+
+    def __call__(self, header: PgnHeader) -> bool:
+        return header.termination in self.terminations
+
+
+class PlyPredicate:
+    stage = MOVETEXT_STAGE
+
+    def __init__(self, min_ply: int = 0, max_ply: int = None):
+        self.min_ply, self.max_ply = min_ply, max_ply
+
+    def __call__(self, movetext: str, clocks: np.ndarray) -> bool:
+        n_plies = len(clocks) if len(clocks) else count_plies(movetext)
+        return n_plies >= self.min_ply and (self.max_ply is None or n_plies <= self.max_ply)
+
+
+class ClockPredicate:
+    """
+    Keeps games that yield at least `min_positions` training positions: plies between
+    `first_n_moves` and `max_ply` played with more than `clock_threshold` seconds left.
+    """
+    stage = MOVETEXT_STAGE
+
+    def __init__(self, clock_threshold: int = 30, first_n_moves: int = 0, max_ply: int = None, min_positions: int = 1):
+        self.clock_threshold = clock_threshold
+        self.first_n_moves, self.max_ply = first_n_moves, max_ply
+        self.min_positions = min_positions
+
+    def __call__(self, movetext: str, clocks: np.ndarray) -> bool:
+        window = clocks[self.first_n_moves: self.max_ply]
+        return np.count_nonzero(window > self.clock_threshold) >= self.min_positions
+
+
+def _build_predicate(name: str, params, cfg: Config = None):
+    cfg_value = lambda key, default: getattr(cfg, key, default) if cfg is not None else default
+
+    if name == "event":
+        return EventPredicate(params)
+    if name == "elo":
+        return EloPredicate(params.get("min", 0), params.get("max", 1200), params.get("players", "any"))
+    if name == "time_control":
+        return TimeControlPredicate(params)
+    if name == "termination":
+        return TerminationPredicate(params)
+    if name == "ply":
+        return PlyPredicate(params.get("min", 0), params.get("max"))
+    if name == "clock":
+        params = params if isinstance(params, dict) else {}
+        return ClockPredicate(
+            clock_threshold=params.get("threshold", cfg_value("clock_threshold", 30)),
+            first_n_moves=params.get("first_n_moves", cfg_value("first_n_moves", 0)),
+            max_ply=params.get("max_ply", cfg_value("max_ply", None)),
+            min_positions=params.get("min_positions", 1)
+        )
+    raise ValueError(f"Unknown game filter predicate: {name!r}")
+
+
+# Same games as `fast_filter_pgn_games`
+DEFAULT_FILTER_SPEC = {"event": ["Blitz"], "elo": {"min": 0, "max": 1200, "players": "any"}}
+
+
+class GameFilter:
+    """
+    Ordered chain of game predicates compiled from a declarative spec, e.g. the
+    `game_filter` section of `config.yaml`:
+
+        {"event": ["Blitz"], "elo": {"max": 1200}, "ply": {"min": 20}, "clock": {}}
+
+    Header predicates always run before movetext predicates (spec order is kept within
+    a stage), so the movetext is only parsed for games that survive the header checks.
+    Every predicate keeps a rejection counter, see `stats()`.
+    """
+    def __init__(self, predicates: list[tuple[str, object]]):
+        self._compile(predicates)
+
+    def _compile(self, predicates: list[tuple[str, object]]):
+        # sorted() is stable, so the spec order is preserved within each stage
+        self.predicates = sorted(predicates, key=lambda item: item[1].stage)
+        self.header_predicates = [(name, p) for name, p in self.predicates if p.stage == HEADER_STAGE]
+        self.movetext_predicates = [(name, p) for name, p in self.predicates if p.stage == MOVETEXT_STAGE]
+        # Predicates that count the games the whole chain accepted, see `EloQuotaPredicate`
+        self.accept_hooks = [p for _, p in self.header_predicates if hasattr(p, "accepted")]
+        self.reset_stats()
+
+    @classmethod
+    def from_spec(cls, spec: dict, cfg: Config = None) -> "GameFilter":
+        return cls([(name, _build_predicate(name, params, cfg)) for name, params in spec.items()])
+
+    @classmethod
+    def from_config(cls, cfg: Config) -> "GameFilter":
+        return cls.from_spec(cfg.game_filter, cfg)
+
+    def add(self, name: str, predicate) -> "GameFilter":
+        """Appends a predicate to its stage (counters are reset)."""
+        self._compile(self.predicates + [(name, predicate)])
+        return self
+
+    def reset_stats(self):
+        self.last_header = None
+        self.games_seen = 0
+        self.games_accepted = 0
+        self.rejected = {name: 0 for name, _ in self.predicates}
+        for _, predicate in self.predicates:
+            if hasattr(predicate, "reset"):
+                predicate.reset()
+
+    def __call__(self, pgn_text: str) -> bool:
+        self.games_seen += 1
+
+        header = scan_pgn_header(pgn_text) if self.header_predicates else None
+        if header is not None and not self._check_header(header):
+            return False
+
+        if self.movetext_predicates:
+            movetext = pgn_text[_header_end(pgn_text) + 2:]
+            if not self._check_movetext(movetext):
+                return False
+
+        self.games_accepted += 1
+        for predicate in self.accept_hooks:
+            predicate.accepted(header)
+        return True
+
+    def filter_span(self, buffer: bytes, start: int, end: int) -> bool:
+        """
+        Same as calling the filter on `buffer[start:end].decode()`, but only the header
+        tags, and the movetext of games that pass the header checks, are decoded.
+        """
+        self.games_seen += 1
+
+        # Kept for callers that want the parsed tags (e.g. the Elo values) of the game
+        self.last_header = scan_pgn_header_bytes(buffer, start, end)
+        if self.header_predicates and not self._check_header(self.last_header):
+            return False
+
+        if self.movetext_predicates:
+            header_end = buffer.find(b"\n\n", start, end)
+            movetext = buffer[header_end + 2: end].decode() if header_end != -1 else ""
+            if not self._check_movetext(movetext):
+                return False
+
+        self.games_accepted += 1
+        for predicate in self.accept_hooks:
+            predicate.accepted(self.last_header)
+        return True
+
+    def _check_header(self, header: PgnHeader) -> bool:
+        for name, predicate in self.header_predicates:
+            if not predicate(header):
+                self.rejected[name] += 1
+                return False
+        return True
+
+    def _check_movetext(self, movetext: str) -> bool:
+        clocks = extract_clock_times(movetext)
+        for name, predicate in self.movetext_predicates:
+            if not predicate(movetext, clocks):
+                self.rejected[name] += 1
+                return False
+        return True
+
+    def stats(self) -> dict:
+        return {"games_seen": self.games_seen, "games_accepted": self.games_accepted, "rejected": dict(self.rejected)}
+
+    def merge_stats(self, stats: dict):
+        """Adds counters collected by a copy of this filter (e.g. in a worker process)."""
+        self.games_seen += stats["games_seen"]
+        self.games_accepted += stats["games_accepted"]
+        for name, count in stats["rejected"].items():
+            self.rejected[name] += count
+
+
+class EloQuotaPredicate:
+    """
+    Rejects games whose (white, black) Elo bucket pair already has `remaining` games
+    accepted, before their movetext is decoded. `remaining` is a snapshot taken by
+    `EloStratifiedSampler` when the task was sent; counts are local to one task, which
+    never spans two quota chunks, so in chunk scope only games the sampler would drop
+    anyway are rejected.
+    """
+    stage = HEADER_STAGE
+
+    def __init__(self, elo_buckets: EloBuckets, remaining: np.ndarray):
+        self.elo_buckets = elo_buckets
+        self.remaining = remaining
+        self.reset()
+
+    def reset(self):
+        self.counts = np.zeros_like(self.remaining)
+
+    def _pair(self, header: PgnHeader) -> tuple[int, int]:
+        return self.elo_buckets.bucket(header.white_elo), self.elo_buckets.bucket(header.black_elo)
+
+    def __call__(self, header: PgnHeader) -> bool:
+        pair = self._pair(header)
+        return self.counts[pair] < self.remaining[pair]
+
+    def accepted(self, header: PgnHeader):
+        self.counts[self._pair(header)] += 1
+
+
+class EloStratifiedSampler:
+    """
+    Caps the games written per (white, black) Elo bucket pair at `max_games` (the
+    config's `max_games_per_elo_range`), per chunk of `chunk_games` games or per month
+    (`scope`).
+
+    It sits between filtering and output: `wrap()` adds an `EloQuotaPredicate` to the
+    filter so workers stop decoding games of full buckets, and the writer calls
+    `sample()` on each pipeline chunk's metadata in order. Counters live in one `(n, n)`
+    array.
+
+    A quota chunk is a fixed run of games of the dump, numbered by `PgnByteSplitter`
+    (filtered out games included), like the original `chunk_size` games of Maia-2, and
+    unrelated to the download ranges. Its first `max_games` games of each pair are kept,
+    so the output does not depend on bandwidth, workers or resumes; the counters of the
+    open chunk are checkpointed (`state()`). In month scope, games are written as the
+    month streams by, so a bucket is filled by the first pipeline chunks that reach it:
+    when one has more candidates than the room left, a uniform random subset is kept.
+    """
+    def __init__(
+        self,
+        elo_buckets: EloBuckets,
+        max_games: int,
+        scope: str = "chunk",
+        chunk_games: int = QUOTA_CHUNK_GAMES,
+        seed: int = 0
+    ):
+        if scope not in ("chunk", "month"):
+            raise ValueError(f"scope must be 'chunk' or 'month', got {scope!r}")
+        self.elo_buckets = elo_buckets
+        self.max_games = max_games
+        self.scope = scope
+        self.chunk_games = chunk_games
+        self.n_buckets = len(elo_buckets)
+        self.counts = np.zeros((self.n_buckets, self.n_buckets), dtype=np.int64)
+        self.chunk = -1                 # Quota chunk `counts` belong to, in chunk scope
+        self.candidates, self.kept = 0, 0
+        self.rng = np.random.default_rng(seed)
+        self.predicate = EloQuotaPredicate(elo_buckets, self._remaining())
+
+    @classmethod
+    def from_config(cls, cfg: Config) -> "EloStratifiedSampler":
+        return cls(
+            EloBuckets.from_config(cfg),
+            max_games=cfg.max_games_per_elo_range,
+            scope=getattr(cfg, "elo_quota_scope", "chunk"),
+            chunk_games=getattr(cfg, "chunk_size", QUOTA_CHUNK_GAMES),
+            seed=getattr(cfg, "seed", 0)
+        )
+
+    def _remaining(self) -> np.ndarray:
+        if self.scope == "chunk":
+            return np.full((self.n_buckets, self.n_buckets), self.max_games, dtype=np.int64)
+        return np.maximum(self.max_games - self.counts, 0)
+
+    def wrap(self, game_filter: GameFilter) -> GameFilter:
+        """Appends the quota check to the header stage of `game_filter` (in place)."""
+        return game_filter.add("elo_quota", self.predicate)
+
+    def restore(self, counts: np.ndarray):
+        """Month counters of a resumed month, e.g. `GameMetadata.bucket_counts()`."""
+        if self.scope == "month":
+            self.counts = counts.astype(np.int64)
+            self.predicate.remaining = self._remaining()
+
+    def state(self) -> dict | None:
+        """Counters of the open quota chunk, for the checkpoint (None in month scope)."""
+        if self.scope != "chunk":
+            return None
+        return {"chunk": self.chunk, "counts": self.counts.tolist()}
+
+    def load_state(self, state: dict | None):
+        if self.scope == "chunk" and state:
+            self.chunk = state["chunk"]
+            self.counts = np.array(state["counts"], dtype=np.int64)
+
+    def chunk_starts(self, first_game: int, n_games: int) -> np.ndarray:
+        """Indices (0 excluded) among games `first_game`.. where a new quota chunk starts."""
+        if self.scope != "chunk":
+            return np.empty(0, dtype=np.int64)
+        first_start = -(-(first_game + 1) // self.chunk_games) * self.chunk_games
+        return np.arange(first_start, first_game + n_games, self.chunk_games) - first_game
+
+    def _ranks(self, pairs: np.ndarray, tiebreak: np.ndarray) -> np.ndarray:
+        """Rank of each game within its pair, ordered by `tiebreak`."""
+        order = np.lexsort((tiebreak, pairs))
+        sorted_pairs = pairs[order]
+        first_of_pair = np.searchsorted(sorted_pairs, sorted_pairs, side="left")
+        ranks = np.empty(len(pairs), dtype=np.int64)
+        ranks[order] = np.arange(len(pairs)) - first_of_pair
+        return ranks
+
+    def sample(self, metadata: np.ndarray, numbers: np.ndarray) -> np.ndarray:
+        """
+        Boolean mask of the rows (with their Elo buckets filled in) to keep. `numbers`
+        are the games' numbers in the dump, in increasing order.
+        """
+        self.candidates += len(metadata)
+        pairs = metadata["white_bucket"].astype(np.int64) * self.n_buckets + metadata["black_bucket"]
+        if self.scope == "month":
+            # Random rank of each game within its pair: keeping ranks below the room left
+            # is a uniform sample of that many games from the pipeline chunk
+            keep = self._ranks(pairs, self.rng.random(len(pairs))) < self._remaining().ravel()[pairs]
+            self.counts += self._count(pairs[keep])
+            # A new array, tasks being pickled keep a consistent snapshot
+            self.predicate.remaining = self._remaining()
+            return keep
+
+        keep = np.zeros(len(pairs), dtype=bool)
+        chunks = np.asarray(numbers) // self.chunk_games
+        for chunk in np.unique(chunks).tolist():
+            if chunk != self.chunk:
+                self.chunk, self.counts = chunk, np.zeros_like(self.counts)
+            rows = np.flatnonzero(chunks == chunk)
+            room = np.maximum(self.max_games - self.counts, 0).ravel()
+            keep[rows] = self._ranks(pairs[rows], rows) < room[pairs[rows]]
+            self.counts += self._count(pairs[rows][keep[rows]])
+        return keep
+
+    def _count(self, pairs: np.ndarray) -> np.ndarray:
+        kept = np.bincount(pairs, minlength=self.n_buckets * self.n_buckets)
+        self.kept += int(kept.sum())
+        return kept.reshape(self.n_buckets, self.n_buckets)
+
+    def stats(self) -> dict:
+        return {"scope": self.scope, "max_games": self.max_games, "candidates": self.candidates, "kept": self.kept}
+
+
+# Shared memory segments attached by this (worker) process, by name
+_ATTACHED_SEGMENTS: dict[str, shared_memory.SharedMemory] = {}
+MAX_ATTACHED_SEGMENTS = 4
+
+
+def _attach_shared_segment(name: str) -> shared_memory.SharedMemory:
+    segment = _ATTACHED_SEGMENTS.get(name)
+    if segment is None:
+        if len(_ATTACHED_SEGMENTS) >= MAX_ATTACHED_SEGMENTS:
+            # Segments are replaced when the main process grows them, drop the oldest mapping
+            _ATTACHED_SEGMENTS.pop(next(iter(_ATTACHED_SEGMENTS))).close()
+        segment = _ATTACHED_SEGMENTS[name] = shared_memory.SharedMemory(name=name)
+    return segment
+
+
+class SharedSegmentPool:
+    """Reusable shared memory segments that decompressed chunks are copied into for the workers."""
+    def __init__(self, headroom: float = 1.25):
+        self.headroom = headroom
+        self._free: list[shared_memory.SharedMemory] = []
+        self._all: list[shared_memory.SharedMemory] = []
+
+    def acquire(self, size: int) -> shared_memory.SharedMemory:
+        for segment in self._free:
+            if segment.size >= size:
+                self._free.remove(segment)
+                return segment
+        if self._free:
+            # Too small for this chunk, replace it with a bigger one
+            self._discard(self._free.pop())
+        segment = shared_memory.SharedMemory(create=True, size=max(1, int(size * self.headroom)))
+        self._all.append(segment)
+        return segment
+
+    def release(self, segment: shared_memory.SharedMemory):
+        self._free.append(segment)
+
+    def _discard(self, segment: shared_memory.SharedMemory):
+        self._all.remove(segment)
+        segment.close()
+        segment.unlink()
+
+    def close(self):
+        for segment in list(self._all):
+            self._discard(segment)
+        self._free.clear()
 
 
 class ParallelPgnProcessor:
-    def __init__(self, workers=None):
-        self.executor = ProcessPoolExecutor(max_workers=workers or mp.cpu_count())
+    def __init__(self, workers=None, game_filter: GameFilter = None, use_shared_memory: bool = False,
+                 min_games_per_task: int = 512, executor: ProcessPoolExecutor = None):
+        # Several months can share one pool (see IngestionScheduler), only an own pool is shut down
+        self._owns_executor = executor is None
+        self.workers = workers or getattr(executor, "_max_workers", None) or mp.cpu_count()
+        # Workers must share our resource tracker, otherwise each worker's own tracker
+        # unlinks the shared memory segments it attached to when the worker exits
+        resource_tracker.ensure_running()
+        self.executor = executor or ProcessPoolExecutor(max_workers=self.workers)
+        self.game_filter = game_filter
+        self.use_shared_memory = use_shared_memory
+        self.min_games_per_task = min_games_per_task
+        self._segments = SharedSegmentPool()
         self._leftover = ""
 
     async def process_text(self, text: str):
@@ -253,12 +970,237 @@ class ParallelPgnProcessor:
         
         # Offload the list of strings to the process pool
         loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(self.executor, self._worker_batch, parts)
+        valid_games, stats = await loop.run_in_executor(self.executor, self._worker_batch, parts, self.game_filter)
+        if stats is not None:
+            self.game_filter.merge_stats(stats)
+        return valid_games
+
+    @staticmethod
+    def _worker_batch(game_list, game_filter: GameFilter = None):
+        # This runs in a separate process, on a pickled copy of the filter
+        if game_filter is None:
+            return [g for g in game_list if fast_filter_pgn_games(g)], None
+        game_filter.reset_stats()
+        return [g for g in game_list if game_filter(g)], game_filter.stats()
+
+    async def process_spans(
+        self,
+        buffer: bytearray,
+        spans: np.ndarray,
+        boundaries: np.ndarray = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Filters the games at `spans` ((start, end) offsets from `PgnByteSplitter`) in the
+        process pool. Returns the spans of the accepted games and their metadata rows
+        (`GAME_METADATA_DTYPE`, Elo buckets and offsets left for the writer to fill).
+        `boundaries` are span indices that must start a task, e.g. quota chunk starts.
+
+        The spans are split across the workers. By default each worker is sent the bytes
+        it covers as one blob; with `use_shared_memory` the chunk is copied once into a
+        shared memory segment and workers only receive the segment name and offsets.
+        """
+        if not len(spans):
+            return spans, np.empty(0, dtype=GAME_METADATA_DTYPE)
+        if self.game_filter is None:
+            self.game_filter = GameFilter.from_spec(DEFAULT_FILTER_SPEC)
+
+        base, end = int(spans[0, 0]), int(spans[-1, 1])
+        n_parts = max(1, min(self.workers, len(spans) // self.min_games_per_task))
+        parts = np.array_split(spans - base, n_parts)
+        if boundaries is not None and len(boundaries):
+            cuts = np.union1d(np.cumsum([len(part) for part in parts])[:-1], boundaries)
+            parts = np.split(spans - base, cuts)
+            n_parts = len(parts)
+
+        segment = None
+        if self.use_shared_memory:
+            segment = self._segments.acquire(end - base)
+            with memoryview(buffer) as view:
+                segment.buf[:end - base] = view[base:end]
+            sources = [segment.name] * n_parts
+        else:
+            sources = [buffer[base + int(part[0, 0]): base + int(part[-1, 1])] for part in parts]
+            parts = [part - part[0, 0] for part in parts]
+
+        loop = asyncio.get_running_loop()
+        try:
+            results = await asyncio.gather(*(
+                loop.run_in_executor(self.executor, self._worker_spans, source, part, self.game_filter)
+                for source, part in zip(sources, parts)
+            ))
+        finally:
+            if segment is not None:
+                self._segments.release(segment)
+
+        accepted, metadata = [], []
+        first_index = 0
+        for part, (part_accepted, part_metadata, stats) in zip(parts, results):
+            self.game_filter.merge_stats(stats)
+            # Workers return indices local to their part
+            accepted.append(part_accepted + first_index)
+            metadata.append(part_metadata)
+            first_index += len(part)
+        return spans[np.concatenate(accepted)], np.concatenate(metadata)
 
     @staticmethod
-    def _worker_batch(game_list):
-        # This runs in a separate process
-        return [g for g in game_list if fast_filter_pgn_games(g)]
+    def _worker_spans(source: bytes | str, spans: np.ndarray, game_filter: GameFilter):
+        """
+        Runs in a worker process. `source` is either the game bytes themselves or the name
+        of a shared memory segment holding them. Returns the indices of the accepted spans,
+        their metadata rows and the filter counters.
+        """
+        if isinstance(source, str):
+            # Copy only this worker's slice out of the segment, bytes gives us .find()
+            with memoryview(_attach_shared_segment(source).buf) as view:
+                source = bytes(view[int(spans[0, 0]): int(spans[-1, 1])])
+            spans = spans - spans[0, 0]
+
+        game_filter.reset_stats()
+        accepted, metadata = [], []
+        for idx, (start, end) in enumerate(spans.tolist()):
+            if game_filter.filter_span(source, start, end):
+                header = game_filter.last_header
+                header_end = source.find(b"\n\n", start, end)
+                n_plies = count_plies(source[header_end + 2: end].decode()) if header_end != -1 else 0
+                accepted.append(idx)
+                metadata.append((
+                    header.white_elo, header.black_elo, 0, 0,
+                    *parse_time_control(header.time_control),
+                    RESULT_CODES.get(header.result, UNKNOWN_RESULT),
+                    min(n_plies, np.iinfo(np.int16).max), 0
+                ))
+        return (
+            np.array(accepted, dtype=np.int64),
+            np.array(metadata, dtype=GAME_METADATA_DTYPE),
+            game_filter.stats()
+        )
+
+    def close(self):
+        if self._owns_executor:
+            self.executor.shutdown()
+        self._segments.close()
+
+
+class PgnByteSplitter:
+    """
+    Splits decompressed PGN bytes into games without building intermediate strings.
+
+    `feed()` appends a chunk to one reusable `bytearray` and returns the `(start, end)`
+    offsets of the complete games it now holds, found with `bytearray.find` on the
+    `\n[Event ` boundary. Spans are contiguous (each game keeps its trailing blank line)
+    and stay valid until the next `feed()`; any memoryview taken on `buffer` must be
+    released before then. Supports the same fast-forward as `PgnStreamParser`, plus
+    dropping `skip_bytes` leading bytes when a `FrameIndex` resumes mid-frame. Game
+    numbers (`total_seen`) count from `first_game`, the number of the first game in
+    the stream, so they stay absolute when decompression starts at an indexed frame.
+    """
+    GAME_START = b"\n[Event "
+
+    def __init__(self, skip_until_count: int = 0, skip_bytes: int = 0, first_game: int = 0):
+        self.buffer = bytearray()
+        self.stream_offset = 0             # Decompressed stream offset of buffer[0]
+        self.skip_bytes = skip_bytes
+        self._consumed = 0                 # Bytes at the front of the buffer already handed out
+        self._scan_from = 0                # Where the next boundary search starts
+        self._at_stream_start = True
+        self.first_game = first_game
+        self.games_emitted = 0
+        self.games_skipped = 0
+        self.skip_until_count = skip_until_count
+        self.is_fast_forwarding = skip_until_count > 0
+
+    def feed(self, data: bytes) -> np.ndarray:
+        if self.skip_bytes:
+            dropped = min(self.skip_bytes, len(data))
+            data, self.skip_bytes = data[dropped:], self.skip_bytes - dropped
+            self.stream_offset += dropped
+        if self._consumed:
+            # Dropping a bytearray prefix is cheap, only the partial tail game remains
+            del self.buffer[:self._consumed]
+            self._scan_from = max(0, self._scan_from - self._consumed)
+            self.stream_offset += self._consumed
+            self._consumed = 0
+        self.buffer += data
+
+        starts = [0]
+        find = self.buffer.find
+        pos = find(self.GAME_START, self._scan_from)
+        while pos != -1:
+            starts.append(pos + 1)
+            pos = find(self.GAME_START, pos + 1)
+        # A boundary may straddle the end of this chunk, rescan its last few bytes next time
+        self._scan_from = max(0, len(self.buffer) - len(self.GAME_START) + 1)
+
+        if len(starts) < 2:
+            return np.empty((0, 2), dtype=np.int64)
+
+        starts = np.array(starts, dtype=np.int64)
+        spans = np.stack([starts[:-1], starts[1:]], axis=1)
+        self._consumed = int(starts[-1])
+        return self._emit(spans)
+
+    def flush(self) -> np.ndarray:
+        """Returns the span of the last game, which has no boundary after it."""
+        if self._consumed:
+            del self.buffer[:self._consumed]
+            self.stream_offset += self._consumed
+            self._consumed = 0
+        spans = np.array([[0, len(self.buffer)]], dtype=np.int64)
+        self._consumed = len(self.buffer)
+        self._scan_from = 0
+        return self._emit(spans)
+
+    def _emit(self, spans: np.ndarray) -> np.ndarray:
+        if self._at_stream_start:
+            self._at_stream_start = False
+            # Resumed streams can start mid-game, keep the leading piece only if it holds anything
+            start, end = spans[0]
+            if not self.buffer.startswith(b"[Event ") and not self.buffer[start:end].strip():
+                spans = spans[1:]
+
+        # Fast Forward Logic
+        if self.is_fast_forwarding:
+            n_skip = min(self.skip_until_count - self.games_skipped, len(spans))
+            self.games_skipped += n_skip
+            spans = spans[n_skip:]
+            if self.games_skipped >= self.skip_until_count:
+                self.is_fast_forwarding = False
+                log.info(f"Fast-forward complete. Resuming emission at game {self.total_seen}")
+
+        self.games_emitted += len(spans)
+        return spans
+
+    def decode(self, start: int, end: int) -> str:
+        return self.buffer[start:end].decode()
+
+    @property
+    def total_seen(self):
+        """Number of the next game: `first_game` plus the games skipped and emitted."""
+        return self.first_game + self.games_skipped + self.games_emitted
+
+    @property
+    def tail_offset(self) -> int:
+        """Decompressed stream offset of the incomplete game left in the buffer."""
+        return self.stream_offset + self._consumed
+
+
+def write_spans(out, buffer: bytearray, spans: np.ndarray) -> int:
+    """
+    Writes `buffer[start:end]` for every span to the binary file `out`, merging runs of
+    adjacent spans into a single write. Returns the number of bytes written.
+    """
+    if not len(spans):
+        return 0
+    # A new run starts wherever a span does not begin where the previous one ended
+    run_starts = np.flatnonzero(spans[1:, 0] != spans[:-1, 1]) + 1
+    first = np.concatenate([[0], run_starts])
+    last = np.concatenate([run_starts - 1, [len(spans) - 1]])
+
+    written = 0
+    with memoryview(buffer) as view:
+        for start, end in zip(spans[first, 0].tolist(), spans[last, 1].tolist()):
+            written += out.write(view[start:end])
+    return written
     
 class PgnStreamParser:
     # Boundary marker for Lichess PGNs
@@ -300,13 +1242,20 @@ class PgnStreamParser:
                     continue  # Drop this game, we've already processed it
                 else:
                     self.is_fast_forwarding = False
-                    print(f"Fast-forward complete. Resuming emission at game {self.games_skipped}")
+                    log.info(f"Fast-forward complete. Resuming emission at game {self.games_skipped}")
 
             ready_to_process.append(game_text.strip())
             self.games_emitted += 1
 
         return ready_to_process
 
+    def flush(self) -> list[str]:
+        """Returns the buffered last game once the stream has ended."""
+        tail, self._buffer = self._buffer, ""
+        games = self.feed(tail + "\n[Event ") if tail.strip() else []
+        self._buffer = ""
+        return games
+
     @property
     def total_seen(self):
         """Total games encountered (skipped + emitted)."""
@@ -322,6 +1271,205 @@ def plan_request_ranges(start_byte: int, total_size: int, chunk_size: int):
         pos = end_byte + 1
         
 
+class AdaptiveRangePlanner:
+    """
+    Hands out byte ranges sized from the measured per-connection throughput, so one
+    request takes about `target_seconds`: small ranges while the rate is unknown or
+    low, larger ones on fast links. The rate is an EWMA over completed requests.
+    With `adaptive=False` every range is `chunk_size` bytes.
+    """
+    def __init__(
+        self,
+        start_byte: int,
+        total_size: int,
+        chunk_size: int,
+        min_chunk_size: int = 1 * MB,
+        max_chunk_size: int = None,
+        target_seconds: float = 4.0,
+        adaptive: bool = True,
+        alpha: float = 0.3
+    ):
+        self.pos = start_byte
+        self.total_size = total_size
+        self.chunk_size = chunk_size
+        self.min_chunk_size = min(min_chunk_size, chunk_size)
+        self.max_chunk_size = max_chunk_size or 2 * chunk_size
+        self.target_seconds = target_seconds
+        self.adaptive = adaptive
+        self.alpha = alpha
+        self.rate = None            # Bytes per second of one connection
+
+    def next_range(self) -> tuple[int, int] | None:
+        if self.pos >= self.total_size:
+            return None
+        end = min(self.pos + self.chunk_size, self.total_size) - 1
+        start, self.pos = self.pos, end + 1
+        return start, end
+
+    def record(self, n_bytes: int, seconds: float):
+        rate = n_bytes / max(seconds, 1e-3)
+        self.rate = rate if self.rate is None else self.alpha * rate + (1 - self.alpha) * self.rate
+        if self.adaptive:
+            size = int(self.rate * self.target_seconds)
+            self.chunk_size = max(self.min_chunk_size, min(self.max_chunk_size, size))
+
+    def expected_seconds(self, n_bytes: int) -> float | None:
+        return n_bytes / self.rate if self.rate else None
+
+
+class ConcurrencyTuner:
+    """
+    Hill-climbs the number of concurrent range requests on aggregate throughput: every
+    `interval` seconds one connection is added (or removed) and the step direction is
+    kept while throughput improves, reversed when it does not.
+    """
+    def __init__(self, initial: int, maximum: int, minimum: int = 1, interval: float = 5.0, adaptive: bool = True):
+        self.target = max(minimum, min(initial, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.interval = interval
+        self.adaptive = adaptive
+        self._direction = 1
+        self._last_rate = None
+        self._bytes = 0
+        self._since = time.monotonic()
+
+    def record(self, n_bytes: int):
+        self._bytes += n_bytes
+        now = time.monotonic()
+        elapsed = now - self._since
+        if not self.adaptive or elapsed < self.interval:
+            return
+        rate = self._bytes / elapsed
+        self._bytes, self._since = 0, now
+        if self._last_rate is not None and rate < self._last_rate * 1.05:
+            self._direction = -self._direction
+        self._last_rate = rate
+        self.target = max(self.minimum, min(self.maximum, self.target + self._direction))
+
+
+class RangeFetch:
+    """A range being downloaded, possibly by a hedged second request."""
+    def __init__(self, start: int, end: int):
+        self.start = start
+        self.end = end
+        self.started = time.monotonic()
+        self.tasks: set[asyncio.Task] = set()
+        self.hedged = False
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start + 1
+
+
+class SpilledRange(NamedTuple):
+    offset: int             # Position in the spill file
+    size: int
+
+
+class ReorderBuffer:
+    """
+    Completed ranges waiting for the emit cursor, keyed by remote offset.
+
+    At most `memory_limit` bytes are kept in RAM. With `spill=True`, a range that would
+    exceed it is written to an anonymous temp file (in `spill_dir`) by `store()` and
+    read back by `pop()`; the file is truncated whenever it has been fully drained.
+    File I/O runs in a thread so the event loop never blocks on disk.
+
+    `store()` reserves a range's memory or its place in the file before it returns (or
+    starts writing), and the reservation is held until `pop()` or `release()`, so
+    concurrent stores cannot overrun the limit or be handed the same file offset. The
+    file is only truncated once no spilled range is stored and no write is running.
+    """
+    def __init__(self, memory_limit: int, spill: bool = False, spill_dir: Path = None):
+        self.memory_limit = memory_limit
+        self.spill = spill
+        self.spill_dir = spill_dir
+        self.memory_bytes = 0
+        self.spilled_bytes = 0
+        self.peak_memory_bytes = 0
+        self.total_spilled = 0
+        self._ranges: dict[int, bytes | SpilledRange] = {}
+        self._file = None
+        self._file_end = 0
+        self._pending_writes = 0
+        self._lock = threading.Lock()       # Accounting and the file's extent
+        self._io_lock = threading.Lock()    # The file position
+
+    def __contains__(self, start: int) -> bool:
+        return start in self._ranges
+
+    def __len__(self) -> int:
+        return len(self._ranges)
+
+    async def store(self, data: bytes) -> bytes | SpilledRange:
+        """
+        Returns what `put()` should keep: the data itself, or where it was spilled. The
+        result is reserved; hand it to `put()`, or to `release()` when it is dropped.
+        """
+        with self._lock:
+            if not self.spill or self.memory_bytes + len(data) <= self.memory_limit:
+                self.memory_bytes += len(data)
+                self.peak_memory_bytes = max(self.peak_memory_bytes, self.memory_bytes)
+                return data
+            if self._file is None:
+                self._file = tempfile.TemporaryFile(dir=self.spill_dir)
+            ref = SpilledRange(self._file_end, len(data))
+            self._file_end += len(data)
+            self.spilled_bytes += len(data)
+            self.total_spilled += len(data)
+            self._pending_writes += 1
+        try:
+            await asyncio.to_thread(self._write, ref.offset, data)
+        except BaseException:
+            # The write thread may still be running; it clears its pending count itself
+            self.release(ref)
+            raise
+        return ref
+
+    def _write(self, offset: int, data: bytes):
+        try:
+            with self._io_lock:
+                self._file.seek(offset)
+                self._file.write(data)
+        finally:
+            with self._lock:
+                self._pending_writes -= 1
+
+    def _read(self, ref: SpilledRange) -> bytes:
+        with self._io_lock:
+            self._file.seek(ref.offset)
+            return self._file.read(ref.size)
+
+    def put(self, start: int, payload: bytes | SpilledRange):
+        self._ranges[start] = payload
+
+    def release(self, payload: bytes | SpilledRange):
+        """Gives back the reservation of a `store()` result that will not be `put()`."""
+        with self._lock:
+            if not isinstance(payload, SpilledRange):
+                self.memory_bytes -= len(payload)
+                return
+            self.spilled_bytes -= payload.size
+            if not self.spilled_bytes and not self._pending_writes:
+                self._file.truncate(0)
+                self._file_end = 0
+
+    async def pop(self, start: int) -> bytes:
+        payload = self._ranges.pop(start)
+        if not isinstance(payload, SpilledRange):
+            self.release(payload)
+            return payload
+        data = await asyncio.to_thread(self._read, payload)
+        self.release(payload)
+        return data
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
 async def async_parallel_stream(
     url: str,
     expected_size: int,
@@ -329,11 +1477,53 @@ async def async_parallel_stream(
     expected_sha256: str = None,
     chunk_size: int = 4 * 1024 * 1024, # Ensure MB is defined
     workers: int = 6,
-    max_retries: int = 3
+    max_retries: int = 3,
+    connection_budget: asyncio.Semaphore = None,
+    max_workers: int = None,
+    adaptive: bool = True,
+    hedge_factor: float = 3.0,
+    max_buffer_bytes: int = 256 * MB,
+    spill: bool = False,
+    spill_dir: Path = None,
+    max_window_bytes: int = None,
+    verifier: StreamVerifier = None
 ):
-    connector = aiohttp.TCPConnector(limit=workers * 2)
-    stop_event = asyncio.Event()
-    sha256_hash = hashlib.sha256()
+    """
+    Downloads `url` from `start_byte` with concurrent range requests and yields
+    `(offset, bytes)` in order. `connection_budget` caps the requests in flight across
+    every stream sharing it (one per month in `IngestionScheduler`).
+
+    With `adaptive`, range sizes follow the measured per-connection throughput
+    (`AdaptiveRangePlanner`) and the number of connections moves between 1 and
+    `max_workers` (`ConcurrencyTuner`), starting at `workers`. A range that holds up
+    the output for `hedge_factor` times its expected duration is requested a second
+    time and the first response wins. The emitter sleeps until a range completes or a
+    hedge is due instead of polling.
+
+    Ranges are only requested within `max_window_bytes` of the emit cursor, so a slow
+    range cannot make finished ones pile up. Without `spill` the window equals
+    `max_buffer_bytes`, which then bounds every downloaded-but-unemitted byte (in
+    flight or waiting). With `spill` the window defaults to 4x larger and waiting
+    ranges beyond `max_buffer_bytes` go to a temp file (see `ReorderBuffer`).
+
+    Bytes are only hashed when `expected_sha256` or a `verifier` is given, in the
+    verifier's thread; a pipeline hashes in its decompress stage instead. A stream
+    resumed at `start_byte` can only be verified with a verifier that covers the
+    bytes before it.
+    """
+    max_workers = max_workers or (workers * 2 if adaptive else workers)
+    max_window_bytes = max_window_bytes or (4 * max_buffer_bytes if spill else max_buffer_bytes)
+    # A single range has to fit the window or the cursor could never advance
+    chunk_size = min(chunk_size, max_window_bytes)
+    planner = AdaptiveRangePlanner(
+        start_byte, expected_size, chunk_size, adaptive=adaptive,
+        max_chunk_size=min(2 * chunk_size, max_window_bytes)
+    )
+    tuner = ConcurrencyTuner(workers, max_workers, adaptive=adaptive)
+    connection_budget = connection_budget or asyncio.Semaphore(max_workers + 1)
+    connector = aiohttp.TCPConnector(limit=max_workers * 2)
+    if verifier is None and expected_sha256:
+        verifier = StreamVerifier()
     
     pbar = tqdm.tqdm(
         total=expected_size - start_byte,
@@ -342,113 +1532,809 @@ async def async_parallel_stream(
         desc="Downloading & Hashing".rjust(25),
         leave=True
     )
+
+    inflight: dict[int, RangeFetch] = {}
+    ready = ReorderBuffer(max_buffer_bytes, spill=spill, spill_dir=spill_dir)
+    wakeup = asyncio.Event()
+    failure = None
     
     async with aiohttp.ClientSession(connector=connector) as session:
-        queue = asyncio.PriorityQueue(maxsize=workers * 2)
-        range_gen = plan_request_ranges(start_byte, expected_size, chunk_size)
+
+        async def fetch(start: int, end: int) -> bytes:
+            async with connection_budget:
+                started = time.monotonic()
+                headers = {"Range": f"bytes={start}-{end}"}
+                timeout = aiohttp.ClientTimeout(sock_connect=30, sock_read=30)
+                async with session.get(url, headers=headers, timeout=timeout) as response:
+                    if response.status not in (200, 206):
+                        raise RuntimeError(f"Error: HTTP {response.status}")
+                    data = await response.read()
+            if response.status == 200 and start > 0:
+                raise RuntimeError("Server ignored the Range header")
+            if len(data) < end - start + 1:
+                raise aiohttp.ClientPayloadError(f"Short read for bytes {start}-{end}: {len(data)} bytes")
+            data = data[:end - start + 1]
+            planner.record(len(data), time.monotonic() - started)
+            tuner.record(len(data))
+            return data
+
+        async def download(start: int, end: int, worker_id: str) -> bytes | SpilledRange:
+            for attempt in range(max_retries + 1):
+                try:
+                    return await ready.store(await fetch(start, end))
+                except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError):
+                    if attempt == max_retries:
+                        raise
+                    wait = (2 ** attempt) + random.uniform(0, 1)
+                    pbar.set_postfix_str(f"Retry {worker_id} in {wait:.1f}s")
+                    await asyncio.sleep(wait)
+
+        def on_done(rng: RangeFetch, task: asyncio.Task):
+            nonlocal failure
+            rng.tasks.discard(task)
+            if task.cancelled():
+                return
+            if inflight.get(rng.start) is not rng:
+                if task.exception() is None:
+                    ready.release(task.result())
+                return
+            if task.exception() is None:
+                ready.put(rng.start, task.result())
+                del inflight[rng.start]
+                # The first response wins, drop the hedged twin
+                for other in rng.tasks:
+                    other.cancel()
+            elif not rng.tasks:
+                failure = task.exception()
+            wakeup.set()
+
+        def launch(rng: RangeFetch, worker_id: str):
+            task = asyncio.create_task(download(rng.start, rng.end, worker_id), name=worker_id)
+            rng.tasks.add(task)
+            task.add_done_callback(lambda t: on_done(rng, t))
+
+        def hedge_delay(rng: RangeFetch) -> float | None:
+            """Seconds until the range at the emit cursor should be requested again."""
+            expected = planner.expected_seconds(rng.size)
+            if not adaptive or rng.hedged or expected is None:
+                return None
+            return max(1.0, hedge_factor * expected) - (time.monotonic() - rng.started)
+
         expected_pos = start_byte
-        
-        async def fetch_worker(worker_id):
-            for start, end in range_gen:
-                if stop_event.is_set():
-                    break
-                
-                for attempt in range(max_retries + 1):
-                    if stop_event.is_set():
-                        return
-                    
-                    try:
-                        headers = {"Range": f"bytes={start}-{end}"}
-                        
-                        async with session.get(url, headers=headers, timeout=30) as response:
-                            if response.status not in (200, 206):
-                                raise RuntimeError(f"Error: HTTP {response.status}")
-
-                            data = await response.read()
-                            await queue.put((start, data))
-                            break 
-                    except (aiohttp.TimeoutError, aiohttp.ClientError):
-                        if attempt == max_retries:
-                            stop_event.set()
-                            return
-                        
-                        wait = (2 ** attempt) + random.uniform(0, 1)
-                        pbar.set_postfix_str(f"Retry W-{worker_id} in {wait:.1f}s")
-                        await asyncio.sleep(wait)
-                        
-        worker_tasks = [
-            asyncio.create_task(fetch_worker(worker_id=i), name=f"W-{i}")
-            for i in range(workers)
-        ]
-        heap = []
-        
         try:
             while expected_pos < expected_size:
-                workers_done = all(t.done() for t in worker_tasks)
-                if workers_done and queue.empty() and not heap:
-                    break
-                
-                try:
-                    start, data = await asyncio.wait_for(queue.get(), timeout=0.2)
-                    heapq.heappush(heap, (start, data))
-                except asyncio.TimeoutError:
-                    continue
-            
-                while heap and heap[0][0] == expected_pos:
-                    s, chunk = heapq.heappop(heap)
-                    
-                    if expected_pos + len(chunk) > expected_size:
-                        chunk = chunk[:expected_size - expected_pos]
-                    
-                    sha256_hash.update(chunk)
-                    yield s, chunk
-                        
+                if failure is not None:
+                    raise RuntimeError(f"Range download failed after {max_retries} retries: {failure}") from failure
+
+                # Keep up to tuner.target ranges downloading, all within the window ahead of the cursor
+                while len(inflight) < tuner.target:
+                    if planner.pos + planner.chunk_size - expected_pos > max_window_bytes and planner.pos > expected_pos:
+                        break
+                    rng = planner.next_range()
+                    if rng is None:
+                        break
+                    inflight[rng[0]] = RangeFetch(*rng)
+                    launch(inflight[rng[0]], f"R-{rng[0]}")
+
+                if expected_pos in ready:
+                    chunk = await ready.pop(expected_pos)
+                    if verifier is not None:
+                        await verifier.submit(chunk, expected_pos)
+                    yield expected_pos, chunk
                     expected_pos += len(chunk)
                     pbar.update(len(chunk))
-                    
-                    if expected_pos >= expected_size:
-                        stop_event.set()
-                        break
+                    continue
+
+                timeout = None
+                head = inflight.get(expected_pos)
+                if head is not None:
+                    timeout = hedge_delay(head)
+                    if timeout is not None and timeout <= 0:
+                        head.hedged = True
+                        pbar.set_postfix_str(f"Hedging bytes {head.start}-{head.end}")
+                        launch(head, f"H-{head.start}")
+                        continue
+
+                wakeup.clear()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
             
             if expected_sha256:
-                actual_hash = sha256_hash.hexdigest()
-                if expected_sha256.lower() == actual_hash:
+                await verifier.drain()
+                verified = verifier.verify(expected_sha256, expected_size)
+                if verified:
                     pbar.set_postfix_str("Verified ✓")
+                elif verified is None:
+                    log.warning(f"{url} was not hashed from its first byte, it cannot be verified")
                 else:
                     raise ValueError(f"Hash Mismatch!")
         finally:
             pbar.close()
-            stop_event.set()
-            for t in worker_tasks:
-                if not t.done():
-                    t.cancel()
-            await asyncio.gather(*worker_tasks, return_exceptions=True)
+            tasks = [task for rng in inflight.values() for task in rng.tasks]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            log.info(
+                f"Reorder buffer peak {ready.peak_memory_bytes / MB:.1f} MB in memory"
+                + (f", {ready.total_spilled / MB:.1f} MB spilled to disk" if spill else "")
+            )
+            ready.close()
+            if verifier is not None:
+                verifier.close()
+
+
+class CachedDumpWriter:
+    """
+    Appends a dump's compressed bytes to its partial file in a `DumpCache` as they
+    stream past, hashing them with a `StreamVerifier` and syncing the partial file every
+    `persist_every` bytes. A continued download hashes the partial file again first.
+    Chunks that overlap what is already on disk are trimmed; a gap (the stream started
+    past the partial file) disables it.
+
+    Passing a pipeline checkpoint's `verifier` shares one hash between the two, so
+    each byte is hashed once. A complete dump that does not match its published
+    SHA-256 is marked `corrupt` and can be mended with `repair()`.
+    """
+    def __init__(
+        self,
+        cache: DumpCache,
+        url: str,
+        metadata: dict,
+        persist_every: int = 256 * MB,
+        verifier: StreamVerifier = None
+    ):
+        self.cache = cache
+        self.url = url
+        self.metadata = metadata
+        self.persist_every = persist_every
+        self.path = cache.partial_path(url, metadata)
+        self.size = self.path.stat().st_size if self.path.exists() else 0
+        self.enabled = True
+        self.corrupt = False
+        self.verifier = verifier if verifier is not None and verifier.valid else StreamVerifier()
+        self._file = open(self.path, "ab")
+        self._catch_up()
+        self._persisted = self.size
+
+    def _catch_up(self):
+        """Hashes the part of the file the verifier has not seen yet, once."""
+        with open(self.path, "rb") as file:
+            file.seek(self.verifier.hashed_bytes)
+            while self.verifier.hashed_bytes < self.size and (block := file.read(16 * MB)):
+                self.verifier.update(block)
+
+    def write(self, pos: int, chunk: bytes):
+        if not self.enabled or pos + len(chunk) <= self.size:
+            return
+        if pos > self.size:
+            log.warning(f"Stream for {self.url} starts past its cached part ({pos} > {self.size}), not caching it")
+            self.enabled = False
+            return
+        chunk = chunk[self.size - pos:]
+        self._file.write(chunk)
+        self.verifier.update(chunk, self.size)
+        self.size += len(chunk)
+        if self.size - self._persisted >= self.persist_every:
+            self._persist()
+
+    def _persist(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._persisted = self.size
+
+    def _digest(self) -> str:
+        if self.verifier.valid and self.verifier.hashed_bytes == self.size:
+            return self.verifier.hexdigest()
+        self.verifier = StreamVerifier()
+        self._catch_up()
+        return self.verifier.hexdigest()
+
+    def close(self, expected_sha256: str = None) -> Path | None:
+        """Moves the dump into the cache if it is complete and verified; returns its path."""
+        if self._file.closed:
+            return None
+        self._persist()
+        self._file.close()
+        if not self.enabled or self.size != self.metadata.get("content_length"):
+            return None
+        sha256 = self._digest()
+        if expected_sha256 and expected_sha256.lower() != sha256:
+            log.error(f"Hash Mismatch for {self.url}: expected {expected_sha256}, got {sha256}")
+            self.corrupt = True
+            return None
+        return self.cache.finalize(self.url, self.metadata, sha256)
+
+    async def repair(self, expected_sha256: str, executor: Executor = None) -> Path:
+        """
+        Re-fetches only the frames of a `corrupt` dump that fail their zstd checksum,
+        then hashes it again. Raises ValueError (and sets the file aside as `.corrupt`)
+        if that does not make it match `expected_sha256`.
+        """
+        ranges = await asyncio.to_thread(find_corrupt_frames, self.path, executor=executor)
+        if len(ranges):
+            refetched = await repair_dump(self.url, self.path, ranges)
+            log.info(f"Re-fetched {len(ranges)} corrupt ranges ({refetched} bytes) of {self.url}")
+            self.verifier = StreamVerifier()
+            await asyncio.to_thread(self._catch_up)
+            sha256 = self.verifier.hexdigest()
+            if sha256 == expected_sha256.lower():
+                self.corrupt = False
+                return await asyncio.to_thread(self.cache.finalize, self.url, self.metadata, sha256)
+        self.path.rename(self.path.with_suffix(".corrupt"))
+        raise ValueError(f"Hash Mismatch for {self.url}: {len(ranges)} corrupt ranges found, could not repair it")
+
+
+async def repair_dump(url: str, path: Path, ranges: np.ndarray, max_retries: int = 3) -> int:
+    """Overwrites each `(offset, size)` range of `path` with the same bytes of `url`; returns bytes fetched."""
+    fetched = 0
+    timeout = aiohttp.ClientTimeout(total=None, sock_read=60)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        for offset, size in ranges.tolist():
+            headers = {"Range": f"bytes={offset}-{offset + size - 1}"}
+            for attempt in range(max_retries):
+                try:
+                    async with session.get(url, headers=headers) as response:
+                        response.raise_for_status()
+                        data = await response.read()
+                    if len(data) != size:
+                        raise aiohttp.ClientPayloadError(f"Expected {size} bytes, got {len(data)}")
+                    break
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if attempt == max_retries - 1:
+                        raise
+                    log.warning(f"Repair range {offset}-{offset + size - 1} failed ({e}), retrying")
+                    await asyncio.sleep(2 ** attempt)
+            await asyncio.to_thread(_write_at, path, offset, data)
+            fetched += size
+    return fetched
+
+
+def _write_at(path: Path, offset: int, data: bytes):
+    with open(path, "r+b") as file:
+        file.seek(offset)
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+
+
+async def tee_to_cache(chunks, writer: CachedDumpWriter, expected_sha256: str = None):
+    """
+    Passes `(pos, bytes)` chunks through while `writer` stores them, off the event loop.
+    A complete dump failing `expected_sha256` is repaired range by range.
+    """
+    try:
+        async for pos, chunk in chunks:
+            await asyncio.to_thread(writer.write, pos, chunk)
+            yield pos, chunk
+    finally:
+        if hasattr(chunks, "aclose"):
+            await chunks.aclose()
+        path = await asyncio.to_thread(writer.close, expected_sha256)
+        if writer.corrupt:
+            path = await writer.repair(expected_sha256)
+        if path is not None:
+            log.info(f"Cached {writer.url} as {path}")
+
+
+async def fetch_dump(url: str, cache: DumpCache, verify: bool = True, **stream_kwargs) -> Path:
+    """
+    Returns the local copy of `url`, downloading it into `cache` first if needed. A
+    partial download is continued from where it stopped with range requests.
+    """
+    metadata = await asyncio.to_thread(cache.metadata, url)
+    cached = cache.lookup(url, metadata)
+    if cached is not None:
+        return cached
+    if not metadata.get("content_length"):
+        raise RuntimeError(f"No metadata for {url}, cannot download it")
+
+    # Hashes the partial download, if any, off the event loop
+    writer = await asyncio.to_thread(CachedDumpWriter, cache, url, metadata)
+    if writer.size:
+        log.info(f"Continuing {url} from byte {writer.size}")
+    stream = async_parallel_stream(url, metadata["content_length"], start_byte=writer.size, **stream_kwargs)
+    expected_sha256 = await asyncio.to_thread(cache.expected_sha256, url) if verify else None
+    async for _ in tee_to_cache(stream, writer, expected_sha256):
+        pass
+    path = cache.lookup(url, metadata)
+    if path is None:
+        raise RuntimeError(f"Download of {url} stopped at byte {writer.size}")
+    return path
+
+
+class PipelineChunk(NamedTuple):
+    seq: int                        # Chunk number, keeps the stages in download order
+    next_byte: int                  # Remote byte position right after this chunk
+    is_sync: bool = False
+    data: bytes = b""               # Decompressed bytes (decompress -> split) or the games blob (split -> writer)
+    spans: np.ndarray = None        # Game spans into `data`
+    games_count: int = 0            # splitter.total_seen once this chunk was split
+    metadata: np.ndarray = None     # `GAME_METADATA_DTYPE` rows of the accepted games
+    numbers: np.ndarray = None      # Numbers (as in `games_count`) of the accepted games
+    final: bool = False             # Last chunk of the stream (decompressor / splitter flushed)
+    frames: np.ndarray = None       # Zstd frames starting in this chunk, see `FrameTracker`
+
+
+class StageStats:
+    """Wall time a pipeline stage spent working, waiting for input, and blocked on a full output queue."""
+    def __init__(self, name: str):
+        self.name = name
+        self.busy = 0.0
+        self.idle = 0.0
+        self.blocked = 0.0
+        self.items = 0
+
+    def as_dict(self) -> dict:
+        return {"busy": round(self.busy, 3), "idle": round(self.idle, 3), "blocked": round(self.blocked, 3), "items": self.items}
+
+
+class IngestionPipeline:
+    """
+    fetch -> decompress -> split -> filter -> write, every stage running as its own task
+    and connected to the next by a bounded `AsyncOrderedQueue` (`queue_size` chunks), so
+    a slow stage applies backpressure instead of buffering unbounded data.
+
+    Decompression and writing run in their own executor threads (pyzstd releases the GIL),
+    up to `filter_concurrency` chunks are in the process pool at once, and the writer puts
+    chunks back in download order before writing and committing the checkpoint.
+    `stats()` reports per-stage busy/idle/blocked seconds to size each stage.
+
+    With an `index_path`, a run from the start of the stream also records where every
+    zstd frame starts and which game comes first in it (`FrameIndex`), saved next to the
+    checkpoint whenever a chunk starts new frames.
+    """
+    STAGES = ("fetch", "decompress", "split", "filter", "write")
+
+    def __init__(
+        self,
+        processor: ParallelPgnProcessor,
+        splitter: PgnByteSplitter,
+        zstream: ZstdUtf8Stream,
+        checkpoint: DownloadCheckpoint,
+        out,
+        metadata_out: GameMetadataWriter,
+        queue_size: int = 2,
+        filter_concurrency: int = 2,
+        pbar: tqdm.tqdm = None,
+        index_path: Path = None,
+        elo_buckets: EloBuckets = None,
+        sampler: EloStratifiedSampler = None
+    ):
+        self.processor = processor
+        self.splitter = splitter
+        self.zstream = zstream
+        self.checkpoint = checkpoint
+        self.out = out
+        self.metadata_out = metadata_out
+        self.elo_buckets = elo_buckets or (sampler.elo_buckets if sampler is not None else ELO_BUCKETS)
+        self.sampler = sampler
+        self.queue_size = queue_size
+        self.filter_concurrency = filter_concurrency
+        self.pbar = pbar
+        self.index_path = index_path
+        # Frame offsets are only known when decompression starts at byte 0
+        self.index_builder = FrameIndexBuilder() if index_path is not None and checkpoint.next_byte == 0 else None
+        self.frame_tracker = FrameTracker() if self.index_builder is not None else None
+        self._stats = {name: StageStats(name) for name in self.STAGES}
+        self._decompress_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="decompress")
+        self._write_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="write")
+        self._outputs = {"pgn": out, **metadata_outputs(metadata_out.files)}
+        self.completed = False
+
+    def stats(self) -> dict:
+        return {name: stage.as_dict() for name, stage in self._stats.items()}
+
+    async def run(self, chunks, should_stop=lambda: False, decompressed: bool = False) -> dict:
+        """
+        Drives `chunks`, an async iterator of (byte position, compressed bytes), through all stages.
+
+        With `decompressed=True` the chunks are (end byte position, decompressed bytes, frames),
+        e.g. from `parallel_decompress_file`, and the decompress stage passes them through.
+        """
+        queues = [AsyncOrderedQueue(max_chunks=self.queue_size) for _ in range(4)]
+        stages = [
+            self._fetch(chunks, queues[0], should_stop, decompressed),
+            self._decompress(queues[0], queues[1], decompressed),
+            self._split(queues[1], queues[2]),
+            self._filter(queues[2], queues[3]),
+            self._write(queues[3]),
+        ]
+        tasks = [asyncio.create_task(stage, name=name) for stage, name in zip(stages, self.STAGES)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # A cancelled stage may block again closing its full output queue, so keep cancelling
+            pending = [task for task in tasks if not task.done()]
+            while pending:
+                for task in pending:
+                    task.cancel()
+                _, pending = await asyncio.wait(pending, timeout=0.1)
+            self._decompress_thread.shutdown()
+            self._write_thread.shutdown()
+        return self.stats()
+
+    async def _get(self, stage: StageStats, queue: AsyncOrderedQueue):
+        start = time.perf_counter()
+        try:
+            return await queue.get()
+        finally:
+            stage.idle += time.perf_counter() - start
 
+    async def _put(self, stage: StageStats, queue: AsyncOrderedQueue, chunk: PipelineChunk):
+        start = time.perf_counter()
+        await queue.put(chunk.seq, chunk)
+        stage.blocked += time.perf_counter() - start
+        stage.items += 1
 
-async def process_lichess_pgn_database(year: int, month: int):
-    url = (
-        f"https://database.lichess.org/standard/"
-        f"lichess_db_standard_rated_{year}-{month:02d}.pgn.zst"
-    )
+    async def _fetch(self, chunks, out_q: AsyncOrderedQueue, should_stop, decompressed: bool = False):
+        stage = self._stats["fetch"]
+        seq, stopped, next_byte = 0, False, self.checkpoint.next_byte
+        try:
+            start = time.perf_counter()
+            async for pos, raw_chunk, *frames in chunks:
+                stage.busy += time.perf_counter() - start
+                if should_stop():
+                    stopped = True
+                    break
+                next_byte = pos if decompressed else pos + len(raw_chunk)
+                frames = frames[0] if frames else None
+                await self._put(stage, out_q, PipelineChunk(seq, next_byte, data=raw_chunk, frames=frames))
+                seq += 1
+                start = time.perf_counter()
+            if not stopped:
+                await self._put(stage, out_q, PipelineChunk(seq, next_byte, final=True))
+        finally:
+            if hasattr(chunks, "aclose"):
+                await chunks.aclose()
+            await out_q.close()
+
+    async def _decompress(self, in_q: AsyncOrderedQueue, out_q: AsyncOrderedQueue, decompressed: bool = False):
+        stage = self._stats["decompress"]
+        loop = asyncio.get_running_loop()
+
+        def decompress(chunk: PipelineChunk) -> PipelineChunk:
+            if decompressed:
+                return chunk
+            if chunk.final:
+                return chunk._replace(data=self.zstream.flush_bytes())
+            # Update rolling hash first
+            self.checkpoint.update_hash(chunk.data, chunk.next_byte - len(chunk.data))
+            if self.frame_tracker is not None:
+                data, frames = self.frame_tracker.decompress(chunk.data, self.zstream.feed_bytes)
+                return chunk._replace(data=data, is_sync=self.zstream.just_synced(), frames=frames)
+            data = self.zstream.feed_bytes(chunk.data)
+            return chunk._replace(data=data, is_sync=self.zstream.just_synced())
+
+        try:
+            while True:
+                try:
+                    _, chunk = await self._get(stage, in_q)
+                except StopAsyncIteration:
+                    break
+                start = time.perf_counter()
+                chunk = await loop.run_in_executor(self._decompress_thread, decompress, chunk)
+                stage.busy += time.perf_counter() - start
+                await self._put(stage, out_q, chunk)
+        finally:
+            await out_q.close()
 
-    meta = get_lichess_database_metadata(year, month)
-    expected_size = meta["content_length"]
+    async def _split(self, in_q: AsyncOrderedQueue, out_q: AsyncOrderedQueue):
+        stage = self._stats["split"]
+        try:
+            while True:
+                try:
+                    _, chunk = await self._get(stage, in_q)
+                except StopAsyncIteration:
+                    break
+                start = time.perf_counter()
+                spans = self.splitter.feed(chunk.data)
+                if chunk.final:
+                    spans = np.concatenate([spans, self.splitter.flush()])
+                if self.index_builder is not None:
+                    self._index_chunk(chunk, spans)
+                # The splitter reuses its buffer, so later stages get their own copy of the games
+                if len(spans):
+                    base = int(spans[0, 0])
+                    blob, spans = bytes(self.splitter.buffer[base: int(spans[-1, 1])]), spans - base
+                else:
+                    blob = b""
+                chunk = chunk._replace(data=blob, spans=spans, games_count=self.splitter.total_seen)
+                stage.busy += time.perf_counter() - start
+                await self._put(stage, out_q, chunk)
+        finally:
+            await out_q.close()
+
+    def _index_chunk(self, chunk: PipelineChunk, spans: np.ndarray):
+        """Feeds the frames and game starts of a freshly split chunk to the index builder."""
+        if chunk.frames is not None:
+            self.index_builder.add_frames(chunk.frames, len(chunk.data))
+        game_starts = spans[:, 0] + self.splitter.stream_offset
+        first_number = self.splitter.total_seen - len(spans)
+        self.index_builder.add_games(game_starts, first_number, self.splitter.tail_offset, self.splitter.total_seen)
+        if chunk.final:
+            self.index_builder.finish(self.splitter.total_seen)
+
+    async def _filter(self, in_q: AsyncOrderedQueue, out_q: AsyncOrderedQueue):
+        stage = self._stats["filter"]
+        slots = asyncio.Semaphore(self.filter_concurrency)
+
+        async def filter_chunk(chunk: PipelineChunk):
+            try:
+                start = time.perf_counter()
+                first_game = chunk.games_count - len(chunk.spans)
+                # Tasks must not straddle quota chunks, see `EloQuotaPredicate`
+                boundaries = self.sampler.chunk_starts(first_game, len(chunk.spans)) if self.sampler is not None else None
+                valid_spans, metadata = await self.processor.process_spans(chunk.data, chunk.spans, boundaries)
+                numbers = first_game + np.searchsorted(chunk.spans[:, 0], valid_spans[:, 0])
+                stage.busy += time.perf_counter() - start
+                await self._put(stage, out_q, chunk._replace(spans=valid_spans, metadata=metadata, numbers=numbers))
+            finally:
+                slots.release()
+
+        in_flight = set()
+        try:
+            while True:
+                try:
+                    _, chunk = await self._get(stage, in_q)
+                except StopAsyncIteration:
+                    break
+                start = time.perf_counter()
+                await slots.acquire()
+                stage.blocked += time.perf_counter() - start
+                task = asyncio.create_task(filter_chunk(chunk))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            await asyncio.gather(*in_flight)
+        finally:
+            for task in in_flight:
+                task.cancel()
+            await out_q.close()
 
+    async def _write(self, in_q: AsyncOrderedQueue):
+        stage = self._stats["write"]
+        loop = asyncio.get_running_loop()
+        pending, next_seq = {}, 0
+
+        def write(chunk: PipelineChunk, index_rows: np.ndarray = None):
+            if index_rows is not None:
+                FrameIndexBuilder.save(index_rows, self.index_path)
+            spans, metadata = chunk.spans, chunk.metadata
+            if len(spans):
+                metadata["white_bucket"] = self.elo_buckets.buckets(metadata["white_elo"])
+                metadata["black_bucket"] = self.elo_buckets.buckets(metadata["black_elo"])
+                if self.sampler is not None:
+                    keep = self.sampler.sample(metadata, chunk.numbers)
+                    spans, metadata = spans[keep], metadata[keep]
+            if len(spans):
+                lengths = spans[:, 1] - spans[:, 0]
+                metadata["offset"] = self.out.tell() + np.cumsum(lengths) - lengths
+                write_spans(self.out, chunk.data, spans)
+                self.metadata_out.append(metadata)
+            if self.sampler is not None:
+                self.checkpoint.state["elo_quota"] = self.sampler.state()
+            # Persisted in batches, fsyncing the outputs first
+            self.checkpoint.commit(
+                next_byte=chunk.next_byte,
+                games_count=chunk.games_count,
+                is_sync_point=chunk.is_sync,
+                complete=chunk.final,
+                outputs=self._outputs
+            )
+
+        while True:
+            try:
+                _, chunk = await self._get(stage, in_q)
+            except StopAsyncIteration:
+                break
+            # Filtering can finish out of order, hold chunks until their turn
+            pending[chunk.seq] = chunk
+            while next_seq in pending:
+                chunk = pending.pop(next_seq)
+                start = time.perf_counter()
+                # Snapshot on the event loop, the split stage keeps appending rows
+                new_frames = chunk.final or (chunk.frames is not None and len(chunk.frames) > 0)
+                index_rows = self.index_builder.snapshot() if self.index_builder is not None and new_frames else None
+                await loop.run_in_executor(self._write_thread, write, chunk, index_rows)
+                stage.busy += time.perf_counter() - start
+                stage.items += 1
+                next_seq += 1
+                self.completed = chunk.final
+                if self.pbar is not None:
+                    self.pbar.update(max(0, chunk.next_byte - self.pbar.n))
+        # Stopped early: keep everything written so far
+        if not self.completed:
+            await loop.run_in_executor(self._write_thread, self.checkpoint.persist, self._outputs)
+
+
+def output_paths(year: int, month: int) -> tuple[Path, Path, Path]:
+    """Filtered PGN, game metadata directory and checkpoint paths of a month in the data directory."""
     data_dir = setup_data_directory()
     processed_data = data_dir / f"lichess_blitz_games_{year}_{month:02d}.pgn"
-    ratings_data = data_dir / f"blitz_ratings_{year}_{month:02d}.txt"
+    metadata_dir = data_dir / f"lichess_blitz_metadata_{year}_{month:02d}"
     checkpoint_path = data_dir / f"lichess_{year}_{month:02d}.checkpoint.json"
+    return processed_data, metadata_dir, checkpoint_path
+
+
+def metadata_outputs(columns: dict) -> dict:
+    """Checkpoint output names (`metadata/<column>`) of the metadata column files or paths."""
+    return {f"metadata/{name}": value for name, value in columns.items()}
+
+
+def restore_month_outputs(checkpoint: DownloadCheckpoint, processed_data: Path, metadata_dir: Path) -> bool:
+    """
+    `DownloadCheckpoint.restore_outputs` for the PGN and the metadata columns. A
+    checkpoint from before the metadata columns existed cannot be resumed.
+    """
+    columns = metadata_outputs(column_paths(metadata_dir))
+    if checkpoint.state["processed_games"] > 0 and not columns.keys() <= checkpoint.state["output_offsets"].keys():
+        log.warning(f"Checkpoint {checkpoint.path} has no game metadata. Starting over.")
+        checkpoint.reset()
+        return False
+    return checkpoint.restore_outputs({"pgn": processed_data, **columns})
+
+
+def frame_index_path(year: int, month: int) -> Path:
+    """Sidecar `FrameIndex` of a month's `.pgn.zst` in the data directory."""
+    return setup_data_directory() / f"lichess_{year}_{month:02d}.frames.npy"
+
+
+def resume_position(checkpoint: DownloadCheckpoint, index_path: Path) -> tuple[int, int, int, int]:
+    """
+    Where to restart a month: `(compressed byte, decompressed bytes to drop, number of
+    the first game there, games to skip)`. With a frame index this is the frame holding
+    the next unprocessed game, otherwise the last sync point followed by a fast-forward
+    over the processed games.
+    """
+    processed_games = checkpoint.state["processed_games"]
+    if processed_games > 0 and index_path.exists():
+        offset, skip_bytes, skip_games = FrameIndex.load(index_path).locate_game(processed_games)
+        return offset, skip_bytes, processed_games - skip_games, skip_games
+    return checkpoint.last_sync_point, 0, 0, processed_games
+
+
+def attach_sampler(
+    sampler: EloStratifiedSampler,
+    game_filter: GameFilter,
+    metadata_dir: Path,
+    checkpoint: DownloadCheckpoint
+) -> GameFilter:
+    """
+    Adds the sampler's quota check to `game_filter`. On resume, month counters are
+    restored from the written metadata and chunk counters from the checkpoint.
+    """
+    if checkpoint.state["processed_games"] > 0:
+        if sampler.scope == "month":
+            sampler.restore(GameMetadata(metadata_dir).bucket_counts(sampler.n_buckets))
+        sampler.load_state(checkpoint.state["elo_quota"])
+    return sampler.wrap(game_filter or GameFilter.from_spec(DEFAULT_FILTER_SPEC))
+
+
+async def process_local_pgn_database(
+    zst_path: Path,
+    year: int,
+    month: int,
+    game_filter: GameFilter = None,
+    workers: int = None,
+    frames_per_task_size: int = 32 * MB,
+    queue_size: int = 2,
+    filter_concurrency: int = 2,
+    executor: ProcessPoolExecutor = None,
+    elo_buckets: EloBuckets = None,
+    sampler: EloStratifiedSampler = None
+) -> dict:
+    """
+    Same as `process_lichess_pgn_database` for an already downloaded `.pgn.zst` file,
+    decompressing groups of zstd frames in parallel instead of one serial stream.
+    """
+    processed_data, metadata_dir, checkpoint_path = output_paths(year, month)
+    index_path = frame_index_path(year, month)
+    checkpoint = DownloadCheckpoint(checkpoint_path, processed_data)
+    restore_month_outputs(checkpoint, processed_data, metadata_dir)
+    file_mode = "a" if checkpoint.state["processed_games"] > 0 else "w"
+    if sampler is not None:
+        game_filter = attach_sampler(sampler, game_filter, metadata_dir, checkpoint)
+    processor = ParallelPgnProcessor(workers=workers, game_filter=game_filter, use_shared_memory=True, executor=executor)
+    resume_byte, skip_bytes, first_game, skip_games = resume_position(checkpoint, index_path)
+    splitter = PgnByteSplitter(skip_until_count=skip_games, skip_bytes=skip_bytes, first_game=first_game)
+
+    try:
+        with (
+            open(processed_data, file_mode + "b") as out,
+            GameMetadataWriter(metadata_dir, file_mode) as metadata_out
+        ):
+            pipeline = IngestionPipeline(
+                processor, splitter, ZstdUtf8Stream(), checkpoint, out, metadata_out,
+                queue_size=queue_size, filter_concurrency=filter_concurrency, index_path=index_path,
+                elo_buckets=elo_buckets, sampler=sampler
+            )
+            # Decompression shares the filter pool, both are CPU bound
+            chunks = parallel_decompress_file(
+                zst_path, start_byte=resume_byte, target_size=frames_per_task_size, executor=processor.executor
+            )
+            stage_stats = await pipeline.run(chunks, decompressed=True)
+            log.info(f"Pipeline stage times for {zst_path}: {stage_stats}")
+            return stage_stats
+    finally:
+        processor.close()
+
+
+async def process_lichess_pgn_database(
+    year: int,
+    month: int,
+    game_filter: GameFilter = None,
+    use_shared_memory: bool = True,
+    queue_size: int = 2,
+    filter_concurrency: int = 2,
+    expected_size: int = None,
+    executor: ProcessPoolExecutor = None,
+    connection_budget: asyncio.Semaphore = None,
+    should_stop=None,
+    cache: DumpCache = None,
+    expected_sha256: str = None,
+    elo_buckets: EloBuckets = None,
+    sampler: EloStratifiedSampler = None
+):
+    """
+    Downloads, filters and writes one month. When run by `IngestionScheduler` the month
+    gets the scheduler's process pool, connection budget and stop flag instead of its
+    own pool and signal handlers.
+
+    With a `cache`, a month already in it is processed from the local file without any
+    network access, otherwise the downloaded bytes are also stored in the cache (and a
+    partial copy keeps growing across runs) so the next run can re-filter locally.
+
+    The compressed stream is hashed once, in the decompress stage, and checked against
+    `expected_sha256` (by default the published checksum when caching) once complete.
+    An `EloStratifiedSampler` caps the games written per Elo bucket pair.
+    """
+    url = (
+        f"https://database.lichess.org/standard/"
+        f"lichess_db_standard_rated_{year}-{month:02d}.pgn.zst"
+    )
+
+    writer = None
+    if cache is not None:
+        metadata = await asyncio.to_thread(cache.metadata, url)
+        cached = cache.lookup(url, metadata)
+        if cached is not None:
+            log.info(f"Processing {year}-{month:02d} from the local copy {cached}")
+            return await process_local_pgn_database(
+                cached, year, month, game_filter=game_filter, queue_size=queue_size,
+                filter_concurrency=filter_concurrency, executor=executor, elo_buckets=elo_buckets,
+                sampler=sampler
+            )
+        expected_size = expected_size or metadata.get("content_length")
+        if expected_sha256 is None:
+            expected_sha256 = await asyncio.to_thread(cache.expected_sha256, url)
+
+    if expected_size is None:
+        meta = get_lichess_database_metadata(year, month)
+        expected_size = meta["content_length"]
+
+    processed_data, metadata_dir, checkpoint_path = output_paths(year, month)
+
+    index_path = frame_index_path(year, month)
 
     checkpoint = DownloadCheckpoint(checkpoint_path, processed_data)
-    resume_byte = checkpoint.last_sync_point if checkpoint.last_sync_point > 0 else 0
+    # Drop whatever was written after the last persisted commit
+    restore_month_outputs(checkpoint, processed_data, metadata_dir)
+    resume_byte, skip_bytes, first_game, skip_games = resume_position(checkpoint, index_path)
     
     # FIX: Open in Append mode ("a") to prevent wiping progress on resume
-    # If it's a fresh start (resume_byte == 0), the file will just be created.
-    file_mode = "a" if resume_byte > 0 else "w"
+    # If it's a fresh start (no processed games), the file will just be created.
+    file_mode = "a" if checkpoint.state["processed_games"] > 0 else "w"
+    if sampler is not None:
+        game_filter = attach_sampler(sampler, game_filter, metadata_dir, checkpoint)
     
-    processor = ParallelPgnProcessor()
-    # If resuming, tell the parser how many games to ignore to avoid duplicates
-    parser = PgnStreamParser(skip_until_count=checkpoint.state["processed_games"])
+    if cache is not None and metadata.get("content_length") == expected_size:
+        # Hashes the cached bytes before `resume_byte` into the checkpoint's verifier
+        writer = await asyncio.to_thread(CachedDumpWriter, cache, url, metadata, verifier=checkpoint.verifier)
+
+    processor = ParallelPgnProcessor(game_filter=game_filter, use_shared_memory=use_shared_memory, executor=executor)
+    # If resuming, tell the splitter how many games to ignore to avoid duplicates
+    splitter = PgnByteSplitter(skip_until_count=skip_games, skip_bytes=skip_bytes, first_game=first_game)
     zstream = ZstdUtf8Stream()
     
     # Variable to track if we should shut down gracefully
@@ -459,79 +2345,67 @@ async def process_lichess_pgn_database(year: int, month: int):
         print("\nShutdown signal received. Finishing current chunk and saving...")
         keep_running = False
 
-    # Attach signal listeners for Ctrl+C (SIGINT) and Kill (SIGTERM)
-    signal.signal(signal.SIGINT, handle_exit)
-    signal.signal(signal.SIGTERM, handle_exit)
+    if should_stop is None:
+        should_stop = lambda: not keep_running
+        # Attach signal listeners for Ctrl+C (SIGINT) and Kill (SIGTERM)
+        signal.signal(signal.SIGINT, handle_exit)
+        signal.signal(signal.SIGTERM, handle_exit)
 
     try:
         with (
-            open(processed_data, file_mode, encoding="utf-8") as out,
-            open(ratings_data, file_mode, encoding="utf-8") as ratings_out,
+            open(processed_data, file_mode + "b") as out,
+            GameMetadataWriter(metadata_dir, file_mode) as metadata_out,
             tqdm.tqdm(total=expected_size, unit="B", unit_scale=True, 
                       initial=resume_byte, desc=f"Processing {year}-{month:02d}".rjust(25)) as pbar
         ):
-            async for pos, raw_chunk in async_parallel_stream(
-                url, expected_size, resume_byte, chunk_size=32*1024*1024
-            ):
-                if not keep_running:
-                    break
-                
-                # Update rolling hash first
-                checkpoint.update_hash(raw_chunk)
-                
-                # Decompress
-                text_data = zstream.feed(raw_chunk)
-                is_sync = zstream.just_synced()
-                
-                # Parse with Fast-Forward (removes duplicates from the overlap)
-                games_to_process = parser.feed(text_data)
-                
-                # Filter & Write
-                if games_to_process:
-                    valid_games = await processor.process_text("\n\n".join(games_to_process))
-                    if valid_games:
-                        out.write("\n\n".join(valid_games) + "\n\n")
-                        out.flush() # Ensure it hits the disk
-
-                # Commit state
-                checkpoint.commit(
-                    next_byte=pos + len(raw_chunk),
-                    games_count=parser.total_seen,
-                    is_sync_point=is_sync
-                )
-                
-                pbar.update(len(raw_chunk))
-
-            # Final Flush
-            if keep_running:
-                final_text = zstream.flush()
-                valid_games = await processor.process_text(final_text)
-                if valid_games:
-                    with open(processed_data, "a", encoding="utf-8") as out:
-                        out.write("\n\n".join(valid_games) + "\n\n")
-                        out.flush()
-                checkpoint.commit(next_byte=expected_size, complete=True)
+            pipeline = IngestionPipeline(
+                processor, splitter, zstream, checkpoint, out, metadata_out,
+                queue_size=queue_size, filter_concurrency=filter_concurrency, pbar=pbar,
+                index_path=index_path, elo_buckets=elo_buckets, sampler=sampler
+            )
+            chunks = async_parallel_stream(
+                url, expected_size, resume_byte, chunk_size=32*1024*1024, connection_budget=connection_budget
+            )
+            if writer is not None:
+                chunks = tee_to_cache(chunks, writer, expected_sha256)
+            stage_stats = await pipeline.run(chunks, should_stop=should_stop)
+            log.info(f"Pipeline stage times for {year}-{month:02d}: {stage_stats}")
+
+            if checkpoint.is_complete and expected_sha256:
+                verified = checkpoint.verify(expected_sha256, expected_size)
+                checkpoint.persist()
+                if verified is False:
+                    log.error(f"Hash Mismatch for {year}-{month:02d}, its outputs may hold corrupt games")
+                elif verified is None:
+                    log.warning(f"{year}-{month:02d} was not hashed in one piece, it cannot be verified")
+
+            if processor.game_filter is not None:
+                log.info(f"Game filter stats for {year}-{month:02d}: {processor.game_filter.stats()}")
+            if sampler is not None:
+                log.info(f"Elo sampler stats for {year}-{month:02d}: {sampler.stats()}")
+            return stage_stats
 
     except Exception as e:
         print(f"An error occurred: {e}")
-        # Final emergency checkpoint save
-        checkpoint.commit(next_byte=checkpoint.next_byte, complete=False)
+        # Final emergency checkpoint save, the outputs are truncated back to it on resume
+        checkpoint.persist()
         raise
+    finally:
+        processor.close()
 
 
-def download_lichess_database(year: int, month: int) -> None:
-    data_dir = setup_data_directory()
-
-    if any(data_dir.glob(f"*{year}-{month:02d}.pgn*")):
-        print(f"Lichess database for {year}-{month:02d} already exists in the data directory.")
-        return
-    
+def download_lichess_database(year: int, month: int, cache: DumpCache = None) -> Path:
+    """
+    Downloads a month's dump into the local `DumpCache` (continuing a partial download)
+    and returns its path. Nothing is downloaded if an up-to-date copy is cached.
+    """
+    cache = cache or DumpCache()
     url = f"https://database.lichess.org/standard/lichess_db_standard_rated_{year}-{month:02d}.pgn.zst"
-    filename = f"lichess_db_standard_rated_{year}-{month:02d}.pgn.zst"
-    file_path = data_dir / filename
 
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
+    cached = cache.lookup(url)
+    if cached is not None:
+        print(f"Lichess database for {year}-{month:02d} already exists in the data directory.")
+        return cached
 
     metadata = get_lichess_database_metadata(year, month)
     content_type = metadata.get("content_type", "unknown")
@@ -543,7 +2417,6 @@ def download_lichess_database(year: int, month: int) -> None:
     ip_address = metadata.get("ip_address", "unknown")
     port = metadata.get("port", "unknown")
     status_code = metadata.get("status_code", "unknown")
-    block_size = 1024  # 1 Kilobyte
 
     info = (
         f"Data for {year}-{month:02d} is available. Downloading ...\n"
@@ -553,17 +2426,10 @@ def download_lichess_database(year: int, month: int) -> None:
         f"Resolved <domain>::<ip_address>::<port> {domain}::{ip_address}::{port}\n"
         f"HTTP request sent, response ... {status_code} OK\n"
         f"Length: {total_size_in_bytes} ({round(total_size_in_bytes)}) [{content_type}]\n"
-        f"Saving to: `{str(file_path)}`\n"
+        f"Saving to: `{str(cache.root)}`\n"
         )
     print(info)
 
-    with tqdm(total=total_size_in_bytes, unit='iB', unit_scale=True, colour='green') as progress_bar:
-        with open(file_path, 'wb') as file:
-            for data in response.iter_content(block_size):
-                file.write(data)
-                progress_bar.update(len(data))
-
-    if total_size_in_bytes != 0 and progress_bar.n != total_size_in_bytes:
-        log.error("ERROR, something went wrong")
-    else:
-        log.info(f"\nDownloaded Lichess database for {year}-{month:02d} successfully.")
+    file_path = asyncio.run(fetch_dump(url, cache))
+    log.info(f"\nDownloaded Lichess database for {year}-{month:02d} successfully to {file_path}.")
+    return file_path
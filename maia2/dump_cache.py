@@ -0,0 +1,156 @@
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+from maia2.logger import get_logger
+from maia2.utils import setup_data_directory
+
+log = get_logger("data")
+
+METADATA_TTL: float = 24 * 3600     # Seconds a cached HEAD response stays fresh
+
+
+class DumpCache:
+    """
+    Local mirror of the Lichess database dumps.
+
+    A dump is identified by its URL plus the server's Last-Modified and ETag headers
+    (so a re-published month is fetched again) and stored under its SHA-256 once
+    complete. Unfinished downloads live in `partial/` and are continued with range
+    requests. HEAD responses and the published
+    `sha256sums.txt` are cached in `index.json` for `metadata_ttl` seconds. Index updates
+    are safe across threads and processes: each one re-reads the index under a lock
+    (`index.lock`) and replaces it through a unique temp file.
+
+        <root>/index.json
+        <root>/<sha256>.pgn.zst
+        <root>/partial/<key>.pgn.zst.part
+    """
+    def __init__(self, root: Path = None, metadata_ttl: float = METADATA_TTL):
+        self.root = Path(root) if root is not None else setup_data_directory() / "dumps"
+        (self.root / "partial").mkdir(parents=True, exist_ok=True)
+        self.metadata_ttl = metadata_ttl
+        self._index_path = self.root / "index.json"
+        self._lock_path = self.root / "index.lock"
+        self._lock = threading.Lock()
+        self._index = self._load_index()
+
+    def _load_index(self) -> dict:
+        index = {"metadata": {}, "entries": {}, "sha256sums": {}}
+        if self._index_path.exists():
+            try:
+                index.update(json.loads(self._index_path.read_text()))
+            except json.JSONDecodeError as e:
+                log.error(f"Dump cache index corrupted ({e}), starting a new one")
+        return index
+
+    def _update_index(self, section: str, key: str, record: dict):
+        """Sets `index[section][key]`, merged into the index on disk, which may have changed."""
+        with self._lock, open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            index = self._load_index()
+            index[section][key] = record
+            _write_json(self._index_path, index)
+            self._index = index
+
+    def _fresh(self, record: dict) -> bool:
+        return record is not None and time.time() - record.get("fetched", 0) < self.metadata_ttl
+
+    def metadata(self, url: str, refresh: bool = False) -> dict:
+        """
+        `content_length`, `last_modified` and `etag` of `url` from a cached HEAD request.
+        Falls back to the last known values when the server cannot be reached.
+        """
+        cached = self._index["metadata"].get(url)
+        if not refresh and self._fresh(cached):
+            return cached
+        try:
+            response = requests.head(url, allow_redirects=True, timeout=10)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            log.error(f"HEAD request failed for {url}: {e}")
+            return cached or {}
+
+        record = {
+            "url": url,
+            "content_length": int(response.headers.get("content-length", 0)),
+            "last_modified": response.headers.get("Last-Modified"),
+            "etag": response.headers.get("ETag"),
+            "fetched": time.time(),
+        }
+        self._update_index("metadata", url, record)
+        return record
+
+    def expected_sha256(self, url: str) -> str | None:
+        """SHA-256 of `url` from the `sha256sums.txt` published next to it, if any."""
+        base, _, filename = url.rpartition("/")
+        sums_url = f"{base}/sha256sums.txt"
+        record = self._index["sha256sums"].get(sums_url)
+        if not self._fresh(record):
+            try:
+                response = requests.get(sums_url, timeout=30)
+                response.raise_for_status()
+                sums = {}
+                for line in response.text.splitlines():
+                    digest, _, name = line.strip().partition("  ")
+                    sums[name.strip()] = digest
+                record = {"sums": sums, "fetched": time.time()}
+                self._update_index("sha256sums", sums_url, record)
+            except requests.exceptions.RequestException as e:
+                log.error(f"Could not fetch {sums_url}: {e}")
+        return record["sums"].get(filename) if record else None
+
+    @staticmethod
+    def cache_key(url: str, metadata: dict) -> str:
+        version = f"{url}\n{metadata.get('last_modified')}\n{metadata.get('etag')}"
+        return hashlib.sha256(version.encode()).hexdigest()[:24]
+
+    def lookup(self, url: str, metadata: dict = None) -> Path | None:
+        """Path of the complete local copy of `url` matching `metadata` (default: cached HEAD)."""
+        entry = self._index["entries"].get(url)
+        if entry is None:
+            return None
+        metadata = metadata if metadata is not None else self.metadata(url)
+        if metadata and self.cache_key(url, metadata) != entry["key"]:
+            log.info(f"{url} changed on the server since it was cached")
+            return None
+        path = self.root / entry["path"]
+        if not path.exists() or path.stat().st_size != entry["size"]:
+            return None
+        return path
+
+    def partial_path(self, url: str, metadata: dict) -> Path:
+        return self.root / "partial" / f"{self.cache_key(url, metadata)}.pgn.zst.part"
+
+    def finalize(self, url: str, metadata: dict, sha256: str) -> Path:
+        """Moves a completed partial download to its content-addressed path."""
+        partial = self.partial_path(url, metadata)
+        path = self.root / f"{sha256}.pgn.zst"
+        if path.exists() and path.stat().st_size == partial.stat().st_size:
+            partial.unlink()
+        else:
+            os.replace(partial, path)
+
+        self._update_index("entries", url, {
+            "key": self.cache_key(url, metadata),
+            "path": path.name,
+            "size": path.stat().st_size,
+            "sha256": sha256,
+            "last_modified": metadata.get("last_modified"),
+            "etag": metadata.get("etag"),
+        })
+        return path
+
+
+def _write_json(path: Path, data: dict):
+    """Atomically replaces `path`, through a temp file of its own so concurrent writers never share one."""
+    with tempfile.NamedTemporaryFile("w", dir=path.parent, prefix=f"{path.name}.", suffix=".tmp", delete=False) as file:
+        json.dump(data, file, indent=4)
+    os.replace(file.name, path)
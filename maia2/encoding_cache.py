@@ -0,0 +1,300 @@
+import hashlib
+import os
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+
+import chess
+import chess.polyglot
+import numpy as np
+import torch
+from torch.utils.data import get_worker_info
+
+from maia2.move_masks import MASK_SIZE, PACKED_MASK_SIZE, indices_to_masks, legal_move_indices, unpack_masks
+from maia2.position_shards import PACKED_PLANES_SIZE, mirror_bitboards, pack_planes, unpack_planes
+from maia2.utils import Config, _board_bitboards
+
+MB: int = 1024 * 1024
+WAYS: int = 8                   # Entries per set, CLOCK eviction runs within a set
+WORKER_ROWS: int = 64           # Counter rows of forked DataLoader workers, by worker id
+COPY_ROWS: int = 64             # Counter rows handed to pickled copies (pool tasks), in turn
+COUNTER_ROWS: int = 1 + WORKER_ROWS + COPY_ROWS
+HITS, MISSES, EVICTIONS = range(3)
+
+# Polyglot hashes only count en passant squares where a capture is possible, while the
+# planes mark every en passant square, so the square gets its own random key
+EP_KEYS = np.random.default_rng(0x6d61696132).integers(1, 1 << 63, 64).tolist()
+
+
+def position_key(board: chess.Board) -> int:
+    """`chess.polyglot.zobrist_hash` of the position plus its en passant square; never 0."""
+    key = chess.polyglot.zobrist_hash(board)
+    if board.ep_square is not None:
+        key ^= EP_KEYS[board.ep_square]
+    return key or 1
+
+
+class EncodingCache:
+    """
+    Packed legal-move masks and packed planes (`pack_planes`, mirrored for black to
+    move) of positions, keyed by `position_key`. Openings repeat across games, so most
+    early plies are hits that skip move generation. It is a legal-mask cache for the
+    training paths (`replay_movetext`, only with `legal_masks`): hashing a position
+    costs more than packing its planes in a batch, so there the planes are stored but
+    only `encode()` serves them, for inference batches that need masks anyway.
+
+    Entries live in `n_sets` sets of `WAYS` slots (a slot's set is `key % n_sets`) in
+    one flat buffer, and each set evicts with CLOCK: hits set a slot's referenced bit,
+    the set's hand clears bits until it finds an unreferenced slot. The size is bounded
+    by `max_entries` or `max_bytes`. With `shared` the buffer is a SharedMemory block
+    that DataLoader workers and process pools attach to when the cache is pickled into
+    them; without it every process fills a private cache. No lock is taken: writers
+    blank a slot's key while they fill it, then store a digest of the key and payload
+    before the key, and readers check the key again and verify the digest after
+    copying. Two processes writing the same slot at once leave an entry that reads as
+    a miss (and is dropped), never a position with another position's mask. Hit, miss and eviction counts are kept in one row per process (the creator,
+    each DataLoader worker, each pickled copy of up to `COPY_ROWS` in use at once) and
+    summed by `stats`. The creating process unlinks a shared block in `close()`, on
+    leaving a `with` block, or at exit at the latest.
+    """
+    def __init__(self, max_entries: int = None, max_bytes: int = 256 * MB, shared: bool = False):
+        entry_bytes = 8 + 2 + PACKED_PLANES_SIZE + PACKED_MASK_SIZE
+        entries = max_entries if max_entries is not None else max_bytes // entry_bytes
+        self.n_sets = max(entries // WAYS, 1)
+        self.shared = shared
+        self._shm = None
+        self._owner_pid = os.getpid()
+        self._layout()
+        if shared:
+            # Workers must share our resource tracker, otherwise each worker's own tracker
+            # unlinks the block when the worker exits
+            resource_tracker.ensure_running()
+            self._shm = shared_memory.SharedMemory(create=True, size=self.nbytes)
+            self._buffer = self._shm.buf
+            # Closing needs the arrays gone first, at exit only the unlink matters
+            self._finalizer = weakref.finalize(self, _unlink, self._shm, self._owner_pid)
+        else:
+            self._buffer = bytearray(self.nbytes)
+        self._map()
+        self._counters[:] = 0
+        self._row_pid, self._row, self._copies = os.getpid(), 0, 0
+
+    @classmethod
+    def from_config(cls, cfg: Config, shared: bool = None) -> "EncodingCache":
+        """The cache sized by `encoding_cache_mb`, or None when it is 0 or missing; for use with `legal_masks`."""
+        size_mb = getattr(cfg, "encoding_cache_mb", 0)
+        if not size_mb:
+            return None
+        if shared is None:
+            shared = getattr(cfg, "encoding_cache_shared", False)
+        return cls(max_bytes=size_mb * MB, shared=shared)
+
+    def _layout(self):
+        self._fields = [
+            ("keys", np.uint64, (self.n_sets, WAYS)),
+            ("digests", np.uint64, (self.n_sets, WAYS)),
+            ("counters", np.int64, (COUNTER_ROWS, 3)),
+            ("planes", np.uint8, (self.n_sets, WAYS, PACKED_PLANES_SIZE)),
+            ("masks", np.uint8, (self.n_sets, WAYS, PACKED_MASK_SIZE)),
+            ("has_planes", np.uint8, (self.n_sets, WAYS)),
+            ("referenced", np.uint8, (self.n_sets, WAYS)),
+            ("hands", np.uint8, (self.n_sets,)),
+        ]
+        self.nbytes = sum(np.dtype(dtype).itemsize * int(np.prod(shape)) for _, dtype, shape in self._fields)
+        self.capacity = self.n_sets * WAYS
+
+    def _map(self):
+        offset = 0
+        for name, dtype, shape in self._fields:
+            array = np.ndarray(shape, dtype=dtype, buffer=self._buffer, offset=offset)
+            setattr(self, f"_{name}", array)
+            offset += array.nbytes
+
+    def _count(self, counter: int):
+        # DataLoader workers may be forked rather than unpickled, so they find their row
+        if self._row_pid != os.getpid():
+            worker = get_worker_info()
+            self._row_pid, self._row = os.getpid(), 1 + worker.id % WORKER_ROWS if worker is not None else 0
+        self._counters[self._row, counter] += 1
+
+    def __getstate__(self) -> dict:
+        # Every copy (one per pool task) gets its own counter row from the process pickling it
+        self._copies += 1
+        return {
+            "n_sets": self.n_sets,
+            "shared": self.shared,
+            "name": self._shm.name if self._shm else None,
+            "row": 1 + WORKER_ROWS + self._copies % COPY_ROWS
+        }
+
+    def __setstate__(self, state: dict):
+        self.n_sets, self.shared = state["n_sets"], state["shared"]
+        self._layout()
+        if self.shared:
+            # Registers the block with the creator's resource tracker, which the pool
+            # shares (see `__init__`); only the creator unlinks it
+            self._shm = shared_memory.SharedMemory(name=state["name"])
+            self._buffer, self._owner_pid = self._shm.buf, None
+        else:
+            self._shm, self._buffer, self._owner_pid = None, bytearray(self.nbytes), os.getpid()
+        self._map()
+        if not self.shared:
+            self._counters[:] = 0
+        self._row_pid, self._row, self._copies = os.getpid(), state["row"], 0
+
+    key = staticmethod(position_key)
+
+    def get(self, key: int) -> tuple[np.ndarray | None, np.ndarray] | None:
+        """Copies of the packed planes (None until they are stored) and mask of `key`, or None."""
+        set_id = key % self.n_sets
+        ways = self._keys[set_id].tolist()
+        if key not in ways:
+            self._count(MISSES)
+            return None
+        slot = (set_id, ways.index(key))
+        planes = self._planes[slot].copy() if self._has_planes[slot] else None
+        mask = self._masks[slot].copy()
+        digest = int(self._digests[slot])
+        if int(self._keys[slot]) != key:
+            # Overwritten by another process while copying
+            self._count(MISSES)
+            return None
+        if digest != _digest(key, planes, mask):
+            # Filled by two writers at once, or half-written when copied
+            if digest == int(self._digests[slot]):
+                self._keys[slot] = 0
+            self._count(MISSES)
+            return None
+        self._referenced[slot] = 1
+        self._count(HITS)
+        return planes, mask
+
+    def legal_indices(self, key: int) -> np.ndarray | None:
+        """The cached legal-move mask of `key` as vocabulary indices, like `legal_move_indices`."""
+        entry = self.get(key)
+        if entry is None:
+            return None
+        return np.flatnonzero(np.unpackbits(entry[1], count=MASK_SIZE, bitorder="little")).astype(np.int16)
+
+    def put(self, key: int, planes: np.ndarray | None, mask: np.ndarray):
+        """
+        Stores an entry, evicting with the set's CLOCK hand. Replay stores masks as soon
+        as they are computed and the batch's planes later, so `planes` may be None and
+        an entry without planes is rewritten once they come.
+        """
+        set_id = key % self.n_sets
+        keys = self._keys[set_id]
+        ways = keys.tolist()
+        if key in ways:
+            way = ways.index(key)
+            if planes is None or self._has_planes[set_id, way]:
+                return
+        elif 0 in ways:
+            way = ways.index(0)
+        else:
+            referenced, hand = self._referenced[set_id], int(self._hands[set_id])
+            while referenced[hand]:
+                referenced[hand] = 0
+                hand = (hand + 1) % WAYS
+            way = hand
+            self._hands[set_id] = (hand + 1) % WAYS
+            self._count(EVICTIONS)
+        keys[way] = 0
+        if planes is not None:
+            self._planes[set_id, way] = planes
+        self._has_planes[set_id, way] = planes is not None
+        self._masks[set_id, way] = mask
+        self._referenced[set_id, way] = 0
+        self._digests[set_id, way] = _digest(key, planes, mask)
+        keys[way] = key
+
+    def put_indices(self, key: int, indices: np.ndarray):
+        """Stores the mask of `legal_move_indices` output, planes to follow."""
+        mask = np.zeros(MASK_SIZE, dtype=bool)
+        mask[indices] = True
+        self.put(key, None, np.packbits(mask, bitorder="little"))
+
+    def put_many(self, keys: list[int], planes: np.ndarray, masks: np.ndarray):
+        for idx, key in enumerate(keys):
+            self.put(key, planes[idx], masks[idx])
+
+    def encode(self, boards: list[chess.Board]) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        `(N, 18, 8, 8)` float planes and `(N, MASK_SIZE)` bool legal-move masks of a
+        batch of boards for inference, black to move mirrored as in position shards.
+        Only what the cache is missing is computed (planes in one `pack_planes` call)
+        and then cached.
+        """
+        keys = [position_key(board) for board in boards]
+        planes = np.empty((len(boards), PACKED_PLANES_SIZE), dtype=np.uint8)
+        masks = np.empty((len(boards), PACKED_MASK_SIZE), dtype=np.uint8)
+        missing_planes, missing_masks = [], []
+        for idx, key in enumerate(keys):
+            entry = self.get(key)
+            if entry is None:
+                missing_planes.append(idx), missing_masks.append(idx)
+                continue
+            if entry[0] is None:
+                missing_planes.append(idx)
+            else:
+                planes[idx] = entry[0]
+            masks[idx] = entry[1]
+        if missing_masks:
+            masks[missing_masks] = indices_to_masks([legal_move_indices(boards[idx]) for idx in missing_masks])
+        if missing_planes:
+            positions = [_board_bitboards(boards[idx]) for idx in missing_planes]
+            bitboards = np.array([position[0] for position in positions], dtype=np.uint64)
+            turns = np.array([position[1] for position in positions])
+            castling = np.array([position[2] for position in positions])
+            ep_squares = np.array([position[3] for position in positions], dtype=np.int16)
+            black = ~turns
+            bitboards[black], turns[black], castling[black], ep_squares[black] = mirror_bitboards(
+                bitboards[black], turns[black], castling[black], ep_squares[black]
+            )
+            planes[missing_planes] = pack_planes(bitboards, turns, castling, ep_squares)
+            self.put_many([keys[idx] for idx in missing_planes], planes[missing_planes], masks[missing_planes])
+        return unpack_planes(planes), unpack_masks(masks)
+
+    def stats(self) -> dict:
+        """Hit/miss/eviction counts summed over every process using the cache."""
+        hits, misses, evictions = self._counters.sum(axis=0).tolist()
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "evictions": evictions,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": int(np.count_nonzero(self._keys)),
+            "capacity": self.capacity,
+        }
+
+    def close(self):
+        """Detaches from the shared block; the process that created it also unlinks it."""
+        if self._shm is None:
+            return
+        for name, _, _ in self._fields:
+            setattr(self, f"_{name}", None)
+        self._buffer = None
+        self._shm.close()
+        if self._owner_pid == os.getpid():
+            self._finalizer.detach()
+            self._shm.unlink()
+        self._shm = None
+
+    def __enter__(self) -> "EncodingCache":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _digest(key: int, planes: np.ndarray | None, mask: np.ndarray) -> int:
+    digest = hashlib.blake2b(key.to_bytes(8, "little"), digest_size=8)
+    if planes is not None:
+        digest.update(planes)
+    digest.update(mask)
+    return int.from_bytes(digest.digest(), "little")
+
+
+def _unlink(shm: shared_memory.SharedMemory, owner_pid: int):
+    if os.getpid() == owner_pid:
+        shm.unlink()
@@ -0,0 +1,145 @@
+import os
+from pathlib import Path
+
+import numpy as np
+
+# Per-game metadata written next to the filtered PGN, one `.npy` file per column
+GAME_METADATA_DTYPE = np.dtype([
+    ("white_elo", np.int16),        # -1 when missing
+    ("black_elo", np.int16),
+    ("white_bucket", np.int8),      # `EloBuckets` ids
+    ("black_bucket", np.int8),
+    ("base_time", np.int32),        # TimeControl seconds, -1 for correspondence ("-")
+    ("increment", np.int16),
+    ("result", np.int8),            # 1 white wins, 0 draw, -1 black wins, -2 unfinished
+    ("n_plies", np.int16),
+    ("offset", np.int64),           # Byte offset of the game in the filtered PGN
+])
+COLUMNS: tuple[str, ...] = GAME_METADATA_DTYPE.names
+
+RESULT_CODES = {"1-0": 1, "1/2-1/2": 0, "0-1": -1}
+UNKNOWN_RESULT = -2
+
+# Every column file starts with a fixed size .npy header, so the row count in it can be
+# rewritten in place as rows are appended
+NPY_HEADER_SIZE = 128
+
+
+def parse_time_control(time_control: str) -> tuple[int, int]:
+    """`"300+3"` -> `(300, 3)`; `(-1, 0)` for `"-"` or anything unparsable."""
+    base, _, increment = time_control.partition("+")
+    try:
+        return int(base), int(increment or 0)
+    except ValueError:
+        return -1, 0
+
+
+def column_paths(directory: Path) -> dict[str, Path]:
+    return {name: Path(directory) / f"{name}.npy" for name in COLUMNS}
+
+
+def _npy_header(dtype: np.dtype, rows: int) -> bytes:
+    header = repr({"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (rows,)})
+    preamble = b"\x93NUMPY\x01\x00" + (NPY_HEADER_SIZE - 10).to_bytes(2, "little")
+    return preamble + header.encode("latin1").ljust(NPY_HEADER_SIZE - 11) + b"\n"
+
+
+class GameMetadataWriter:
+    """
+    Appends batches of `GAME_METADATA_DTYPE` rows to one growing `.npy` file per column
+    in `directory`. Each file stays a valid `.npy` (its header holds the row count), so
+    readers can `np.load(..., mmap_mode="r")` a single column without touching the
+    others. `files` are plain append-only outputs: a `DownloadCheckpoint` records and
+    truncates them like the PGN, and reopening with `mode="a"` fixes the headers.
+    """
+    def __init__(self, directory: Path, mode: str = "w"):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.files = {}
+        self.rows = 0
+        for name, path in column_paths(self.directory).items():
+            itemsize = GAME_METADATA_DTYPE[name].itemsize
+            if mode == "a" and path.exists() and path.stat().st_size >= NPY_HEADER_SIZE:
+                file = open(path, "r+b")
+                rows = (file.seek(0, os.SEEK_END) - NPY_HEADER_SIZE) // itemsize
+            else:
+                file = open(path, "w+b")
+                file.write(_npy_header(GAME_METADATA_DTYPE[name], 0))
+                rows = 0
+            self.files[name] = file
+            self.rows = rows if name == COLUMNS[0] else min(self.rows, rows)
+        # Columns interrupted mid-batch are cut back to the rows all of them hold
+        for name, file in self.files.items():
+            file.truncate(NPY_HEADER_SIZE + self.rows * GAME_METADATA_DTYPE[name].itemsize)
+            file.seek(0, os.SEEK_END)
+        self._write_headers()
+
+    def append(self, rows: np.ndarray):
+        """Writes a batch of `GAME_METADATA_DTYPE` rows, column by column."""
+        if not len(rows):
+            return
+        for name, file in self.files.items():
+            file.write(np.ascontiguousarray(rows[name]).tobytes())
+        self.rows += len(rows)
+        self._write_headers()
+
+    def _write_headers(self):
+        for name, file in self.files.items():
+            os.pwrite(file.fileno(), _npy_header(GAME_METADATA_DTYPE[name], self.rows), 0)
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GameMetadata:
+    """
+    Memory-mapped view of a metadata directory written by `GameMetadataWriter`.
+    Columns are loaded lazily, so e.g. plotting ratings never reads the offsets.
+    """
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self._paths = column_paths(self.directory)
+        self._columns = {}
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name not in self._columns:
+            path = self._paths[name]
+            dtype = GAME_METADATA_DTYPE[name]
+            rows = (path.stat().st_size - NPY_HEADER_SIZE) // dtype.itemsize
+            # Sized from the file rather than its header: a checkpoint restore truncates
+            # the columns before `GameMetadataWriter` rewrites the row counts. numpy also
+            # refuses to map an empty file region
+            self._columns[name] = (
+                np.memmap(path, dtype=dtype, mode="r", offset=NPY_HEADER_SIZE, shape=(rows,))
+                if rows > 0 else np.empty(0, dtype)
+            )
+        return self._columns[name]
+
+    def __len__(self) -> int:
+        return len(self["offset"])
+
+    def ratings(self) -> np.ndarray:
+        """White and black Elos of every game, missing ratings dropped."""
+        ratings = np.concatenate([self["white_elo"], self["black_elo"]])
+        return ratings[ratings >= 0]
+
+    def bucket_counts(self, n_buckets: int) -> np.ndarray:
+        """`(n_buckets, n_buckets)` game counts by (white bucket, black bucket)."""
+        pairs = self["white_bucket"].astype(np.int64) * n_buckets + self["black_bucket"]
+        return np.bincount(pairs, minlength=n_buckets * n_buckets).reshape(n_buckets, n_buckets)
+
+    def select(self, white_bucket: int = None, black_bucket: int = None) -> np.ndarray:
+        """Row numbers of the games in the given Elo buckets (None matches any)."""
+        mask = np.ones(len(self), dtype=bool)
+        if white_bucket is not None:
+            mask &= self["white_bucket"] == white_bucket
+        if black_bucket is not None:
+            mask &= self["black_bucket"] == black_bucket
+        return np.flatnonzero(mask)
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from pathlib import Path
+from typing import NamedTuple
+
+import aiohttp
+
+from maia2.data_ingestion import (
+    DownloadCheckpoint,
+    EloStratifiedSampler,
+    GameFilter,
+    metadata_outputs,
+    output_paths,
+    process_lichess_pgn_database,
+)
+from maia2.dump_cache import DumpCache
+from maia2.game_metadata import column_paths
+from maia2.logger import get_logger
+from maia2.utils import Config, EloBuckets, setup_data_directory
+
+log = get_logger("data")
+
+LICHESS_URL = "https://database.lichess.org/standard/lichess_db_standard_rated_{year}-{month:02d}.pgn.zst"
+
+
+class MonthJob(NamedTuple):
+    year: int
+    month: int
+    url: str
+    expected_size: int
+    last_modified: str
+    remaining: int          # Compressed bytes left according to the month's checkpoint
+
+
+def month_range(start_year: int, start_month: int, end_year: int, end_month: int) -> list[tuple[int, int]]:
+    """All (year, month) pairs from the start month to the end month, both included."""
+    first, last = start_year * 12 + start_month - 1, end_year * 12 + end_month - 1
+    return [(m // 12, m % 12 + 1) for m in range(first, last + 1)]
+
+
+def manifest_path(year: int, month: int) -> Path:
+    return setup_data_directory() / f"lichess_{year}_{month:02d}.manifest.json"
+
+
+def cpu_budget(cfg: Config) -> int:
+    """Pool size from the config: at most `num_workers`, leaving `num_cpu_left` cores free."""
+    available = (os.cpu_count() or 1) - getattr(cfg, "num_cpu_left", 0)
+    return max(1, min(getattr(cfg, "num_workers", available), available))
+
+
+class IngestionScheduler:
+    """
+    Ingests every month of the config's `start_year/start_month` - `end_year/end_month`
+    range, `max_concurrent_months` at a time.
+
+    All months share one process pool (sized by `cpu_budget`) and one connection budget
+    of `max_connections` range requests in flight, so adding months fills idle cores
+    and bandwidth instead of multiplying them. Months with the most bytes left start
+    first, and each month gets a JSON manifest with its outcome. With a `DumpCache`,
+    cached months are re-processed from disk and downloaded ones are kept.
+    """
+    def __init__(
+        self,
+        cfg: Config,
+        max_concurrent_months: int = 3,
+        max_connections: int = 12,
+        workers: int = None,
+        use_shared_memory: bool = True,
+        cache: DumpCache = None
+    ):
+        self.cfg = cfg
+        self.months = month_range(cfg.start_year, cfg.start_month, cfg.end_year, cfg.end_month)
+        self.max_concurrent_months = max_concurrent_months
+        self.max_connections = max_connections
+        self.workers = workers or cpu_budget(cfg)
+        self.use_shared_memory = use_shared_memory
+        self.cache = cache
+        self.keep_running = True
+
+    async def plan(self) -> list[MonthJob]:
+        """HEADs every month and orders the unfinished ones by remaining bytes, largest first."""
+        connector = aiohttp.TCPConnector(limit=self.max_connections)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            heads = await asyncio.gather(*(self._head(session, year, month) for year, month in self.months))
+
+        jobs = []
+        for (year, month), (url, size, last_modified) in zip(self.months, heads):
+            if not size:
+                log.error(f"No dump found for {year}-{month:02d}, skipping it")
+                continue
+            processed_data, _, checkpoint_path = output_paths(year, month)
+            checkpoint = DownloadCheckpoint(checkpoint_path, processed_data)
+            if checkpoint.is_complete:
+                continue
+            jobs.append(MonthJob(year, month, url, size, last_modified, size - checkpoint.next_byte))
+        return sorted(jobs, key=lambda job: job.remaining, reverse=True)
+
+    @staticmethod
+    async def _head(session: aiohttp.ClientSession, year: int, month: int) -> tuple[str, int, str]:
+        url = LICHESS_URL.format(year=year, month=month)
+        try:
+            async with session.head(url, allow_redirects=True, timeout=aiohttp.ClientTimeout(total=30)) as response:
+                response.raise_for_status()
+                return url, response.content_length or 0, response.headers.get("Last-Modified")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            log.error(f"HEAD request failed for {url}: {e}")
+            return url, 0, None
+
+    async def run(self) -> dict[tuple[int, int], dict]:
+        def handle_exit(sig, frame):
+            log.warning("Shutdown signal received. Finishing current chunks and saving...")
+            self.keep_running = False
+
+        signal.signal(signal.SIGINT, handle_exit)
+        signal.signal(signal.SIGTERM, handle_exit)
+
+        jobs = await self.plan()
+        log.info(f"Scheduling {len(jobs)} months on {self.workers} workers, {self.max_connections} connections")
+
+        connection_budget = asyncio.Semaphore(self.max_connections)
+        pending = list(jobs)
+        manifests = {}
+
+        async def month_worker(executor: ProcessPoolExecutor):
+            while pending and self.keep_running:
+                job = pending.pop(0)
+                manifests[job.year, job.month] = await self._run_month(job, executor, connection_budget)
+
+        resource_tracker.ensure_running()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            await asyncio.gather(*(month_worker(executor) for _ in range(self.max_concurrent_months)))
+        return manifests
+
+    async def _run_month(self, job: MonthJob, executor: ProcessPoolExecutor, connection_budget: asyncio.Semaphore) -> dict:
+        manifest = {
+            "year": job.year,
+            "month": job.month,
+            "url": job.url,
+            "expected_size": job.expected_size,
+            "last_modified": job.last_modified,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        game_filter = GameFilter.from_config(self.cfg)
+        sampler = EloStratifiedSampler.from_config(self.cfg) if hasattr(self.cfg, "max_games_per_elo_range") else None
+        start = time.perf_counter()
+        try:
+            manifest["stage_stats"] = await process_lichess_pgn_database(
+                job.year, job.month,
+                game_filter=game_filter,
+                use_shared_memory=self.use_shared_memory,
+                expected_size=job.expected_size,
+                executor=executor,
+                connection_budget=connection_budget,
+                should_stop=lambda: not self.keep_running,
+                cache=self.cache,
+                elo_buckets=EloBuckets.from_config(self.cfg),
+                sampler=sampler
+            )
+        except Exception as e:
+            log.error(f"Ingestion of {job.year}-{job.month:02d} failed: {e}")
+            manifest["error"] = repr(e)
+
+        processed_data, metadata_dir, checkpoint_path = output_paths(job.year, job.month)
+        checkpoint = DownloadCheckpoint(checkpoint_path, processed_data)
+        manifest.update(
+            status="complete" if checkpoint.is_complete else ("failed" if "error" in manifest else "stopped"),
+            finished=time.strftime("%Y-%m-%dT%H:%M:%S"),
+            elapsed=round(time.perf_counter() - start, 3),
+            next_byte=checkpoint.next_byte,
+            processed_games=checkpoint.state["processed_games"],
+            checksum=checkpoint.state["checksum"],
+            verified=checkpoint.state["verified"],
+            filter_stats=game_filter.stats(),
+            sampler_stats=sampler.stats() if sampler is not None else None,
+            outputs={
+                name: {"path": str(path), "bytes": checkpoint.state["output_offsets"].get(name)}
+                for name, path in {"pgn": processed_data, **metadata_outputs(column_paths(metadata_dir))}.items()
+            },
+        )
+        path = manifest_path(job.year, job.month)
+        temp_path = path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps(manifest, indent=4))
+        temp_path.replace(path)
+        return manifest
@@ -1,24 +1,35 @@
-import logging.config
+import atexit
+import copy
+import json
 import logging
+import logging.config
+import logging.handlers
+import multiprocessing.util
+import os
 import pathlib
+import queue
+import threading
+import time
+
 
-def setup_log_directory():
-    log_dir_path = pathlib.Path(__file__).parent / "logs"
-    
-    if not log_dir_path.exists():
-        print("Creating logs directory")
-        log_dir_path.mkdir(parents=True, exist_ok=True)
-        print(f"Created logs directory: {log_dir_path}")
+def setup_log_directory() -> pathlib.Path:
+    # MAIA2_LOG_DIR moves the logs out of the package directory
+    log_dir_path = pathlib.Path(os.environ.get("MAIA2_LOG_DIR") or pathlib.Path(__file__).parent / "logs")
+    log_dir_path.mkdir(parents=True, exist_ok=True)
     return log_dir_path
 
-log_path = setup_log_directory()
 
+# `filename`s are relative to the log directory, which is only created when logging is
+# first configured. Records reach these handlers through `configure_logging`'s queue
 LOGGING_CONFIG = {
     'version': 1,
     'disable_existing_loggers': True, # Keep existing loggers
     'formatters': {
         'standard': {
-            'format': '%(asctime)s [%(levelname)s] %(name)s: %(message)s' 
+            'format': '%(asctime)s [%(levelname)s] %(name)s: %(message)s'
+        },
+        'json_lines': {
+            '()': 'maia2.logger.JsonLinesFormatter',
         },
     },
     'handlers': {
@@ -26,16 +37,21 @@ LOGGING_CONFIG = {
             'class': 'logging.StreamHandler', #
             'formatter': 'standard',
         },
+        "console_warnings": {
+            "class": "logging.StreamHandler",
+            "formatter": "standard",
+            "level": "WARNING"
+        },
         "data_file": {
             "class": "logging.handlers.RotatingFileHandler",
-            "filename": log_path / "data.log",
+            "filename": "data.log",
             "formatter": "standard",
             "maxBytes": 10 * 1024 * 1024,
             "backupCount": 3
         },
         "file": { # default file handler
             "class": "logging.handlers.RotatingFileHandler",
-            "filename": log_path / "app.log",
+            "filename": "app.log",
             "formatter": "standard",
             "maxBytes": 1 * 1024 * 1024,
             "backupCount": 1
@@ -43,7 +59,7 @@ LOGGING_CONFIG = {
     },
     'loggers': {
         'data': {
-            'handlers': ['data_file'],
+            'handlers': ['data_file', 'console_warnings'],
             'level': 'DEBUG',
         },
         'processing': {
@@ -61,6 +77,203 @@ LOGGING_CONFIG = {
     }
 }
 
+# Structured copy of every configured logger's records, enabled with `json_lines=True`
+# or the MAIA2_LOG_JSON environment variable
+JSON_LINES_HANDLER = {
+    "class": "logging.handlers.RotatingFileHandler",
+    "filename": "maia2.jsonl",
+    "formatter": "json_lines",
+    "maxBytes": 50 * 1024 * 1024,
+    "backupCount": 3
+}
+
+_lock = threading.Lock()
+_records = queue.SimpleQueue()
+_listener: logging.handlers.QueueListener = None
+_queue_handlers: list[logging.handlers.QueueHandler] = []
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, exception and `extra` fields."""
+    RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        entry.update({key: value for key, value in vars(record).items() if key not in self.RECORD_ATTRIBUTES})
+        return json.dumps(entry, default=str)
+
+
+class _Router(logging.Handler):
+    """Runs on the listener thread, handing each record to its configured logger's handlers."""
+    def __init__(self, routes: dict[str, list[logging.Handler]]):
+        super().__init__()
+        self.routes = routes
+
+    def handle(self, record: logging.LogRecord):
+        name = record.name
+        while name not in self.routes and "." in name:
+            name = name.rpartition(".")[0]
+        for handler in self.routes.get(name, ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """Puts records on the shared queue, configuring logging on the first one."""
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Like QueueHandler.prepare, but the traceback stays out of the message so that
+        # JsonLinesFormatter can still report it separately
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if _listener is None:
+            configure_logging()
+        self.queue.put_nowait(record)
+
+
+def _attach_queue_handlers(loggers: dict):
+    for name, logger_config in loggers.items():
+        queue_handler = _LazyQueueHandler(_records)
+        logger = logging.getLogger(name)
+        logger.handlers = [queue_handler]
+        if "level" in logger_config:
+            logger.setLevel(logger_config["level"])
+        _queue_handlers.append(queue_handler)
+
+
+def configure_logging(config: dict = None, json_lines: bool = None) -> logging.handlers.QueueListener:
+    """
+    Applies `config` (by default `LOGGING_CONFIG`) once per process and moves every
+    configured logger's handlers behind a `QueueHandler`. Loggers then only put records
+    on an unbounded queue, which never blocks the event loop, and a `QueueListener`
+    thread formats and writes them. `get_logger` leaves this to the first record, so
+    importing a module creates no log files. Later calls return the running listener.
+    Forked children run their own listener and write per-process files instead of
+    the parent's rotating ones.
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return _listener
+        config = json.loads(json.dumps(config or LOGGING_CONFIG))
+        if json_lines is None:
+            json_lines = bool(os.environ.get("MAIA2_LOG_JSON"))
+        if json_lines:
+            config["handlers"]["json_lines"] = dict(JSON_LINES_HANDLER)
+            for logger_config in config["loggers"].values():
+                logger_config["handlers"].append("json_lines")
+        log_dir = setup_log_directory()
+        for handler_config in config["handlers"].values():
+            if "filename" in handler_config:
+                handler_config["filename"] = str(log_dir / handler_config["filename"])
+        for name in config["loggers"]:
+            # The first record may still be going through the old list, which dictConfig
+            # would otherwise refill with the handlers it creates
+            logging.getLogger(name).handlers = []
+        logging.config.dictConfig(config)
+
+        routes = {name: logging.getLogger(name).handlers[:] for name in config["loggers"]}
+        _queue_handlers.clear()
+        _attach_queue_handlers(config["loggers"])
+        _listener = logging.handlers.QueueListener(_records, _Router(routes))
+        _listener.start()
+        atexit.register(_stop_listener)
+        return _listener
+
+
+def _stop_listener():
+    # Flushes the records still queued
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def _per_process_handler(handler: logging.Handler, replaced: dict) -> logging.Handler:
+    """
+    A forked child's stand-in for one of the parent's rotating files: a plain file
+    named after the child's pid (`data.1234.log`), opened on its first record. Only
+    the parent rotates, so processes never rename a file another one is writing.
+    """
+    if not isinstance(handler, logging.handlers.RotatingFileHandler):
+        return handler
+    if handler not in replaced:
+        path = pathlib.Path(handler.baseFilename)
+        replaced[handler] = logging.FileHandler(path.with_name(f"{path.stem}.{os.getpid()}{path.suffix}"), delay=True)
+        replaced[handler].setFormatter(handler.formatter)
+        replaced[handler].setLevel(handler.level)
+    return replaced[handler]
+
+
+def _restart_after_fork():
+    # A forked child inherits the queue handlers but not the listener thread
+    global _records, _listener
+    _records = queue.SimpleQueue()
+    for queue_handler in _queue_handlers:
+        queue_handler.queue = _records
+    if _listener is None:
+        return
+    replaced = {}
+    router = _Router({
+        name: [_per_process_handler(handler, replaced) for handler in handlers]
+        for name, handlers in _listener.handlers[0].routes.items()
+    })
+    _listener = logging.handlers.QueueListener(_records, router)
+    _listener.start()
+    # multiprocessing children leave through os._exit, which skips atexit
+    multiprocessing.util.Finalize(None, _stop_listener, exitpriority=0)
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
 def get_logger(name: str) -> logging.Logger:
-    logging.config.dictConfig(LOGGING_CONFIG)
-    return logging.getLogger(name)
\ No newline at end of file
+    if not _queue_handlers:
+        with _lock:
+            if not _queue_handlers:
+                _attach_queue_handlers(LOGGING_CONFIG["loggers"])
+    return logging.getLogger(name)
+
+
+class RateLimitedLogger(logging.LoggerAdapter):
+    """
+    For messages on hot paths: each message template (pass values as %-style
+    arguments, not in an f-string) is emitted at most once per `interval` seconds, and
+    the next one that goes through reports how many were dropped. Suppressed calls
+    return before any formatting.
+    """
+    def __init__(self, logger: logging.Logger, interval: float = 10.0):
+        super().__init__(logger, {})
+        self.interval = interval
+        self._last = {}
+        self._suppressed = {}
+
+    def log(self, level: int, msg, *args, **kwargs):
+        if not self.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        if now - self._last.get(msg, -self.interval) < self.interval:
+            self._suppressed[msg] = self._suppressed.get(msg, 0) + 1
+            return
+        self._last[msg] = now
+        suppressed = self._suppressed.pop(msg, 0)
+        if suppressed:
+            msg = f"{msg} (+{suppressed} similar messages suppressed)"
+        self.logger.log(level, msg, *args, **kwargs)
+
+
+def rate_limited(logger: logging.Logger | str, interval: float = 10.0) -> RateLimitedLogger:
+    return RateLimitedLogger(get_logger(logger) if isinstance(logger, str) else logger, interval)
@@ -0,0 +1,66 @@
+import chess
+import numpy as np
+import torch
+
+from maia2.utils import MIRROR_KEY, MOVE_VOCABULARY, MoveVocabulary
+
+# Legal-move masks over the move vocabulary, one bit per move (1856 bits -> 232 bytes)
+MASK_SIZE: int = len(MOVE_VOCABULARY)
+PACKED_MASK_SIZE: int = (MASK_SIZE + 7) // 8
+
+
+def legal_move_indices(board: chess.Board, mirror: bool = None, vocabulary: MoveVocabulary = MOVE_VOCABULARY) -> np.ndarray:
+    """
+    Vocabulary indices of the legal moves of `board`, looked up in `square_index` from
+    each move's squares instead of its UCI string. With `mirror` (by default when black
+    is to move) the moves are seen from the other side, matching mirrored positions.
+    Capture promotions are not in the vocabulary and are left out.
+    """
+    keys = np.fromiter(
+        ((move.promotion or 0) << 12 | move.from_square << 6 | move.to_square for move in board.generate_legal_moves()),
+        dtype=np.int32
+    )
+    if mirror is None:
+        mirror = not board.turn
+    if mirror:
+        keys ^= MIRROR_KEY
+    indices = vocabulary.square_index[keys]
+    return indices[indices >= 0]
+
+
+def indices_to_masks(indices: list[np.ndarray], packed: bool = True, n_moves: int = MASK_SIZE) -> np.ndarray:
+    """
+    `(N, n_moves)` bool masks from per-position index arrays, set in one scatter, or
+    with `packed` `(N, ceil(n_moves / 8))` uint8 bitsets (np.packbits, little bit order).
+    """
+    masks = np.zeros((len(indices), n_moves), dtype=bool)
+    if indices:
+        rows = np.repeat(np.arange(len(indices)), [len(row) for row in indices])
+        masks[rows, np.concatenate(indices)] = True
+    return np.packbits(masks, axis=1, bitorder="little") if packed else masks
+
+
+def unpack_masks(packed: np.ndarray, n_moves: int = MASK_SIZE) -> torch.Tensor:
+    """Inverse of `indices_to_masks(..., packed=True)`: `(N, n_moves)` bool tensor."""
+    return torch.from_numpy(np.unpackbits(packed, axis=1, count=n_moves, bitorder="little").view(bool))
+
+
+def legal_move_masks(boards: list[chess.Board | str], mirror_black: bool = True, packed: bool = False) -> np.ndarray:
+    """
+    Legal-move masks of a batch of boards (or FEN strings), for the shard builder and
+    inference alike. With `mirror_black` black-to-move boards get their mirrored moves,
+    as in position shards and `replay_movetext`.
+    """
+    boards = [chess.Board(board) if isinstance(board, str) else board for board in boards]
+    indices = [legal_move_indices(board, mirror=mirror_black and not board.turn) for board in boards]
+    return indices_to_masks(indices, packed=packed)
+
+
+def legal_move_tensor(boards: list[chess.Board | str], mirror_black: bool = True) -> torch.Tensor:
+    """`(N, MASK_SIZE)` bool tensor version of `legal_move_masks`."""
+    return torch.from_numpy(legal_move_masks(boards, mirror_black, packed=False))
+
+
+def mask_logits(logits: torch.Tensor, masks: torch.Tensor) -> torch.Tensor:
+    """Policy logits with illegal moves set to -inf, ready for softmax/argmax."""
+    return logits.masked_fill(~masks.to(logits.device), float("-inf"))
@@ -0,0 +1,310 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+from maia2.game_metadata import GameMetadata
+from maia2.logger import get_logger
+from maia2.move_masks import PACKED_MASK_SIZE, indices_to_masks, unpack_masks
+from maia2.replay import PositionSelection, replay_movetext
+from maia2.utils import (
+    N_BOARD_CHANNELS,
+    Config,
+    bitboards_to_tensor,
+    setup_data_directory,
+)
+
+log = get_logger("data")
+
+PACKED_PLANES_SIZE: int = N_BOARD_CHANNELS * 64 // 8     # 18x64 bits
+SHARD_SIZE: int = 1 << 20                                 # Positions per shard (~150 MB)
+
+# One training position, `board_to_tensor` planes packed with np.packbits. As in the
+# move vocabulary, black-to-move positions are mirrored to white's point of view
+POSITION_DTYPE = np.dtype([
+    ("planes", np.uint8, (PACKED_PLANES_SIZE,)),
+    ("move", np.int16),             # `MOVE_VOCABULARY` index of the (mirrored) move played
+    ("elo_self", np.int8),          # `EloBuckets` id of the side to move
+    ("elo_oppo", np.int8),
+    ("white_to_move", np.bool_),
+    ("clock", np.int16),            # Mover's clock after the move in seconds, -1 without [%clk]
+    ("value", np.int8),             # Game result for the side to move: 1 win, 0 draw, -1 loss
+])
+# Shards built with `legal_masks` also hold each position's packed legal-move mask
+MASKED_POSITION_DTYPE = np.dtype(POSITION_DTYPE.descr + [("legal", np.uint8, (PACKED_MASK_SIZE,))])
+
+
+def position_dtype(legal_masks: bool = False) -> np.dtype:
+    return MASKED_POSITION_DTYPE if legal_masks else POSITION_DTYPE
+
+
+def mirror_bitboards(
+    bitboards: np.ndarray,
+    turns: np.ndarray,
+    castling: np.ndarray,
+    ep_squares: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Batched `chess.Board.mirror()` of `_board_bitboards` values: ranks flipped and colours swapped."""
+    bitboards = np.concatenate([bitboards[:, 6:], bitboards[:, :6]], axis=1).byteswap()
+    ep_squares = np.where(ep_squares >= 0, ep_squares ^ 56, ep_squares)
+    return bitboards, ~turns, castling[:, [2, 3, 0, 1]], ep_squares
+
+
+def pack_planes(bitboards: np.ndarray, turns: np.ndarray, castling: np.ndarray, ep_squares: np.ndarray) -> np.ndarray:
+    """`(N, 144)` uint8 packed `board_to_tensor` planes of a batch of `_board_bitboards` values."""
+    planes = bitboards_to_tensor(bitboards, turns, castling, ep_squares, dtype=torch.uint8).numpy()
+    return np.packbits(planes.reshape(len(planes), -1), axis=1, bitorder="little")
+
+
+def unpack_planes(packed: np.ndarray, dtype: torch.dtype = torch.float32) -> torch.Tensor:
+    """Inverse of `pack_planes`: `(N, 18, 8, 8)` tensor, identical to `boards_to_tensor`."""
+    planes = np.unpackbits(packed, axis=1, bitorder="little").reshape(-1, N_BOARD_CHANNELS, 8, 8)
+    tensor = torch.from_numpy(planes)
+    return tensor if dtype == torch.uint8 else tensor.to(dtype)
+
+
+def encode_game_range(
+    pgn_path: Path,
+    start: int,
+    end: int,
+    metadata: dict[str, np.ndarray],
+    selection: PositionSelection,
+    legal_masks: bool = False,
+    cache=None
+) -> np.ndarray:
+    """
+    Encodes the games stored in `pgn_path[start:end]` (runs in a worker process).
+    `metadata` holds their `offset`, `white_bucket`, `black_bucket` and `result` columns.
+    """
+    with open(pgn_path, "rb") as file:
+        file.seek(start)
+        data = file.read(end - start)
+    starts = (metadata["offset"] - start).tolist()
+    games = [data[game_start: game_end].decode() for game_start, game_end in zip(starts, starts[1:] + [end - start])]
+    return encode_games(
+        games, metadata["white_bucket"], metadata["black_bucket"], metadata["result"], selection, legal_masks, cache
+    )
+
+
+def encode_games(
+    games: list[str],
+    white_buckets: np.ndarray,
+    black_buckets: np.ndarray,
+    results: np.ndarray,
+    selection: PositionSelection,
+    legal_masks: bool = False,
+    cache=None
+) -> np.ndarray:
+    """
+    Replays a batch of games with `replay_movetext` and encodes their selected plies as
+    `POSITION_DTYPE` rows, packing all the boards in one call. `results` are `RESULT_CODES`
+    values. With `legal_masks` rows are `MASKED_POSITION_DTYPE`, masks set in one scatter,
+    and an `EncodingCache` given as `cache` serves and stores the masks of repeated positions.
+    """
+    bitboards, turns, castling, ep_squares, rows, legal, keys = [], [], [], [], [], [], []
+    for idx, game in enumerate(games):
+        header_end = game.find("\n\n")
+        movetext = game[header_end + 2:] if header_end != -1 else ""
+        white, black = int(white_buckets[idx]), int(black_buckets[idx])
+        result = int(results[idx]) if results[idx] >= -1 else 0
+        try:
+            for position in replay_movetext(movetext, selection, legal_masks, cache):
+                turn = position.white_to_move
+                self_elo, oppo_elo, value = (white, black, result) if turn else (black, white, -result)
+                bitboards.append(position.bitboards), turns.append(turn)
+                castling.append(position.castling), ep_squares.append(position.ep_square)
+                rows.append((position.move, self_elo, oppo_elo, turn, position.clock, value))
+                legal.append(position.legal), keys.append(position.key)
+        except ValueError as e:
+            log.warning(f"Skipping the rest of a game after an illegal move: {e}")
+
+    positions = np.empty(len(rows), dtype=position_dtype(legal_masks))
+    if not rows:
+        return positions
+    bitboards, turns = np.array(bitboards, dtype=np.uint64), np.array(turns)
+    castling, ep_squares = np.array(castling), np.array(ep_squares, dtype=np.int16)
+    black = ~turns
+    bitboards[black], turns[black], castling[black], ep_squares[black] = mirror_bitboards(
+        bitboards[black], turns[black], castling[black], ep_squares[black]
+    )
+    positions["planes"] = pack_planes(bitboards, turns, castling, ep_squares)
+    move, elo_self, elo_oppo, white_to_move, clock, value = zip(*rows)
+    positions["move"], positions["elo_self"], positions["elo_oppo"] = move, elo_self, elo_oppo
+    positions["white_to_move"], positions["clock"], positions["value"] = white_to_move, np.clip(clock, -1, 32767), value
+    if legal_masks:
+        positions["legal"] = indices_to_masks(legal)
+        if cache is not None:
+            cache.put_many(keys, positions["planes"], positions["legal"])
+    return positions
+
+
+def positions_to_tensors(rows: np.ndarray) -> tuple[torch.Tensor, ...]:
+    """
+    A batch of `POSITION_DTYPE` rows as `(planes, move, elo_self, elo_oppo, white_to_move, clock, value)`
+    tensors, followed by the `(N, MASK_SIZE)` bool legal-move masks for `MASKED_POSITION_DTYPE` rows.
+    """
+    tensors = (
+        unpack_planes(rows["planes"]),
+        torch.from_numpy(rows["move"].astype(np.int64)),
+        torch.from_numpy(rows["elo_self"].astype(np.int64)),
+        torch.from_numpy(rows["elo_oppo"].astype(np.int64)),
+        torch.from_numpy(np.ascontiguousarray(rows["white_to_move"])),
+        torch.from_numpy(rows["clock"].astype(np.float32)),
+        torch.from_numpy(rows["value"].astype(np.float32)),
+    )
+    if "legal" in rows.dtype.names:
+        tensors += (unpack_masks(rows["legal"]),)
+    return tensors
+
+
+class PositionShardWriter:
+    """
+    Writes positions to `shard_{n:05d}.npy` files of exactly `shard_size` rows (the last
+    one may be shorter). Shards are written to a temp file and renamed, so a shard
+    that exists is always complete.
+    """
+    def __init__(self, directory: Path, shard_size: int = SHARD_SIZE):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.shard_size = shard_size
+        self.shards = 0
+        self.positions = 0
+        self._pending, self._pending_rows = [], 0
+
+    def append(self, positions: np.ndarray):
+        self._pending.append(positions)
+        self._pending_rows += len(positions)
+        while self._pending_rows >= self.shard_size:
+            rows = np.concatenate(self._pending)
+            self._write(rows[:self.shard_size])
+            self._pending, self._pending_rows = [rows[self.shard_size:]], len(rows) - self.shard_size
+
+    def _write(self, rows: np.ndarray):
+        path = self.directory / f"shard_{self.shards:05d}.npy"
+        temp_path = path.with_suffix(".tmp")
+        with open(temp_path, "wb") as file:
+            np.save(file, rows)
+        temp_path.replace(path)
+        self.shards += 1
+        self.positions += len(rows)
+
+    def close(self):
+        if self._pending_rows:
+            self._write(np.concatenate(self._pending))
+        self._pending, self._pending_rows = [], 0
+
+
+def position_shard_dir(year: int, month: int) -> Path:
+    return setup_data_directory() / f"lichess_positions_{year}_{month:02d}"
+
+
+async def build_position_shards(
+    pgn_path: Path,
+    metadata_dir: Path,
+    out_dir: Path,
+    selection: PositionSelection = PositionSelection(),
+    shard_size: int = SHARD_SIZE,
+    games_per_task: int = 20000,
+    executor: Executor = None,
+    max_in_flight: int = None,
+    legal_masks: bool = False,
+    cache=None
+) -> int:
+    """
+    Offline stage turning a month's filtered PGN (and its game metadata columns) into
+    position shards. Blocks of `games_per_task` games (the config's `chunk_size`) are
+    encoded in a process pool and written in game order. With `legal_masks` shards also
+    hold legal-move masks, computed once per position across the pool with a `shared`
+    `EncodingCache`. Returns the position count.
+    """
+    metadata = GameMetadata(metadata_dir)
+    n_games, pgn_size = len(metadata), Path(pgn_path).stat().st_size
+    own_executor = executor is None
+    executor = executor or ProcessPoolExecutor()
+    max_in_flight = max_in_flight or getattr(executor, "_max_workers", 4) * 2
+    loop = asyncio.get_running_loop()
+    writer = PositionShardWriter(out_dir, shard_size)
+
+    pending = []
+    try:
+        for first in range(0, n_games, games_per_task):
+            last = min(first + games_per_task, n_games)
+            columns = {name: np.array(metadata[name][first:last]) for name in ("offset", "white_bucket", "black_bucket", "result")}
+            end = int(metadata["offset"][last]) if last < n_games else pgn_size
+            if len(pending) >= max_in_flight:
+                writer.append(await pending.pop(0))
+            pending.append(loop.run_in_executor(
+                executor, encode_game_range, pgn_path, int(columns["offset"][0]), end, columns, selection, legal_masks, cache
+            ))
+        for future in pending:
+            writer.append(await future)
+        pending.clear()
+        writer.close()
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+    log.info(f"Encoded {writer.positions} positions of {n_games} games into {writer.shards} shards in {out_dir}")
+    if cache is not None:
+        log.info(f"Encoding cache: {cache.stats()}")
+    return writer.positions
+
+
+class PositionShardDataset(Dataset):
+    """
+    Training positions from a directory of position shards. Shards are memory-mapped
+    lazily in each DataLoader worker (only paths and lengths are pickled), rows are
+    read straight from the page cache and batches are unpacked in one call through
+    `__getitems__`. Items are `(planes, move, elo_self, elo_oppo, white_to_move, clock, value)`
+    plus the legal-move mask for shards built with `legal_masks`.
+    """
+    def __init__(self, directory: Path):
+        self.paths = sorted(Path(directory).glob("shard_*.npy"))
+        lengths = [np.load(path, mmap_mode="r").shape[0] for path in self.paths]
+        self.starts = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        self._shards = None
+
+    def __len__(self) -> int:
+        return int(self.starts[-1])
+
+    def _rows(self, indices: np.ndarray) -> np.ndarray:
+        if self._shards is None:
+            self._shards = [np.load(path, mmap_mode="r") for path in self.paths]
+        shard_ids = np.searchsorted(self.starts, indices, side="right") - 1
+        if (shard_ids == shard_ids[0]).all():
+            return self._shards[shard_ids[0]][indices - self.starts[shard_ids[0]]]
+        rows = np.empty(len(indices), dtype=self._shards[0].dtype)
+        for shard_id in np.unique(shard_ids):
+            mask = shard_ids == shard_id
+            rows[mask] = self._shards[shard_id][indices[mask] - self.starts[shard_id]]
+        return rows
+
+    def __getitems__(self, indices: list[int]) -> tuple[torch.Tensor, ...]:
+        return positions_to_tensors(self._rows(np.asarray(indices, dtype=np.int64)))
+
+    def __getitem__(self, idx: int) -> tuple[torch.Tensor, ...]:
+        return tuple(item[0] for item in self.__getitems__([idx]))
+
+
+def _batch_collate(batch):
+    # `__getitems__` already returns stacked tensors
+    return batch
+
+
+def position_loader(directory: Path, cfg: Config, shuffle: bool = True) -> DataLoader:
+    """DataLoader over position shards using the config's `batch_size`, `num_workers` and `queue_length`."""
+    num_workers = getattr(cfg, "num_workers", 0)
+    return DataLoader(
+        PositionShardDataset(directory),
+        batch_size=getattr(cfg, "batch_size", 8192),
+        shuffle=shuffle,
+        num_workers=num_workers,
+        collate_fn=_batch_collate,
+        prefetch_factor=getattr(cfg, "queue_length", 2) if num_workers else None,
+        persistent_workers=num_workers > 0,
+        pin_memory=torch.cuda.is_available()
+    )
@@ -0,0 +1,127 @@
+import re
+from typing import Iterator, NamedTuple
+
+import chess
+import numpy as np
+
+from maia2.move_masks import legal_move_indices
+from maia2.utils import MOVE_VOCABULARY, Config, _board_bitboards
+
+# A `{...}` comment or a bare token (SAN, move number, NAG or result)
+MOVETEXT_TOKEN_RE = re.compile(r"\{[^}]*\}|[^\s{]+")
+CLOCK_COMMENT_RE = re.compile(r"\[%clk (\d+):(\d+):(\d+)\]")
+GAME_RESULTS = frozenset(("1-0", "0-1", "1/2-1/2", "*"))
+
+
+class PositionSelection(NamedTuple):
+    """Which plies of a game become training positions, see `select_plies`."""
+    first_n_moves: int = 0
+    last_n_moves: int = 0
+    max_ply: int = None
+    clock_threshold: int = 0
+
+    @classmethod
+    def from_config(cls, cfg: Config) -> "PositionSelection":
+        return cls(
+            first_n_moves=getattr(cfg, "first_n_moves", 0),
+            last_n_moves=getattr(cfg, "last_n_moves", 0),
+            max_ply=getattr(cfg, "max_ply", None),
+            clock_threshold=getattr(cfg, "clock_threshold", 0)
+        )
+
+
+def select_plies(n_plies: int, clocks: np.ndarray, selection: PositionSelection) -> np.ndarray:
+    """
+    Plies kept for training: the first `first_n_moves` and last `last_n_moves` plies
+    are skipped, nothing from `max_ply` on, and (when the game has clocks) only moves
+    made with more than `clock_threshold` seconds left, as in `ClockPredicate`.
+    """
+    stop = n_plies - selection.last_n_moves
+    if selection.max_ply is not None:
+        stop = min(stop, selection.max_ply)
+    plies = np.arange(selection.first_n_moves, max(stop, selection.first_n_moves))
+    if len(clocks) >= n_plies and (clocks[:n_plies] >= 0).all():
+        plies = plies[clocks[plies] > selection.clock_threshold]
+    return plies
+
+
+def tokenize_movetext(movetext: str) -> tuple[list[str], np.ndarray]:
+    """
+    Splits a Lichess movetext (no variations) into its SAN moves and, aligned with
+    them, the `[%clk]` seconds left after each move (-1 when a move has none), in one
+    regex pass. Move numbers, NAGs, `!?` annotations and the result are dropped.
+    """
+    moves, clocks = [], []
+    for token in MOVETEXT_TOKEN_RE.findall(movetext):
+        if token[0] == "{":
+            match = CLOCK_COMMENT_RE.search(token)
+            if match and moves:
+                hours, minutes, seconds = match.groups()
+                clocks[-1] = int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+        elif token[-1] == "." or token[0] == "$" or token in GAME_RESULTS:
+            continue
+        else:
+            moves.append(token.rstrip("!?"))
+            clocks.append(-1)
+    return moves, np.array(clocks, dtype=np.int32)
+
+
+class ReplayedPosition(NamedTuple):
+    """A position right before `move` was played, as `_board_bitboards` values."""
+    bitboards: list[int]        # 12 piece bitboards, white pieces then black
+    white_to_move: bool
+    castling: tuple[bool, ...]
+    ep_square: int
+    move: int                   # `MOVE_VOCABULARY` index, mirrored when black is to move
+    clock: int                  # Mover's clock after the move in seconds, -1 without [%clk]
+    ply: int
+    legal: np.ndarray = None    # Vocabulary indices of the legal moves, mirrored like `move`
+    key: int = None             # `position_key`, when replayed with an `EncodingCache`
+
+
+def _mirror_uci(move: chess.Move) -> str:
+    return chess.Move(chess.square_mirror(move.from_square), chess.square_mirror(move.to_square), move.promotion).uci()
+
+
+def replay_movetext(
+    movetext: str,
+    selection: PositionSelection = PositionSelection(),
+    legal_moves: bool = False,
+    cache=None
+) -> Iterator[ReplayedPosition]:
+    """
+    Replays a movetext on a single `chess.Board`, without building a `chess.pgn` game
+    tree, and yields the selected positions. Replay stops after the last selected ply,
+    moves outside the move vocabulary (capture promotions) are skipped, and an illegal
+    move ends the game (ValueError from `parse_san`). With `legal_moves` positions also
+    carry their `legal_move_indices`, served from and added to `cache` (an
+    `EncodingCache`); the caller adds the packed planes (`encode_games`).
+    """
+    moves, clocks = tokenize_movetext(movetext)
+    plies = select_plies(len(moves), clocks, selection)
+    if not len(plies):
+        return
+    selected = np.zeros(int(plies[-1]) + 1, dtype=bool)
+    selected[plies] = True
+    selected = selected.tolist()
+
+    board = chess.Board()
+    for ply, san in enumerate(moves[:len(selected)]):
+        move = board.parse_san(san)
+        if selected[ply]:
+            uci = move.uci() if board.turn else _mirror_uci(move)
+            if uci in MOVE_VOCABULARY:
+                bitboards, turn, castling, ep_square = _board_bitboards(board)
+                legal = key = None
+                if legal_moves:
+                    if cache is not None:
+                        key = cache.key(board)
+                        legal = cache.legal_indices(key)
+                    if legal is None:
+                        legal = legal_move_indices(board)
+                        if cache is not None:
+                            cache.put_indices(key, legal)
+                yield ReplayedPosition(
+                    bitboards, turn, castling, ep_square, MOVE_VOCABULARY.index(uci), int(clocks[ply]), ply, legal, key
+                )
+        board.push(move)
@@ -0,0 +1,277 @@
+import codecs
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
+
+from maia2.data_ingestion import GAME_BOUNDARY, ZstdUtf8Stream, output_paths, scan_pgn_header
+from maia2.encoding_cache import EncodingCache
+from maia2.game_metadata import RESULT_CODES, UNKNOWN_RESULT
+from maia2.logger import get_logger
+from maia2.position_shards import encode_games, position_dtype, positions_to_tensors
+from maia2.replay import PositionSelection
+from maia2.utils import ELO_BUCKETS, Config, EloBuckets
+from maia2.zstd_frames import group_frames, scan_zstd_frames
+
+log = get_logger("data")
+
+MB: int = 1024 * 1024
+GAME_START = "[Event "
+
+
+class GrowingPgn:
+    """
+    Read access to a filtered PGN that ingestion may still be appending to. With its
+    month's checkpoint, only bytes the checkpoint has committed are read, and reads
+    past them wait (polling every `poll_seconds`) until ingestion catches up or the
+    month is complete.
+    """
+    def __init__(self, path: Path, checkpoint_path: Path = None, poll_seconds: float = 10.0):
+        self.path = Path(path)
+        self.checkpoint_path = checkpoint_path
+        self.poll_seconds = poll_seconds
+        self.committed, self.complete = 0, checkpoint_path is None
+        self._refresh()
+
+    def _refresh(self):
+        if self.checkpoint_path is None or not Path(self.checkpoint_path).exists():
+            self.committed = self.path.stat().st_size if self.path.exists() else 0
+            return
+        try:
+            state = json.loads(Path(self.checkpoint_path).read_text())
+        except json.JSONDecodeError:
+            return      # Caught mid-replace, keep the last known values
+        self.committed = state.get("output_offsets", {}).get("pgn", 0)
+        self.complete = state.get("complete", False)
+
+    def wait_for(self, end: int) -> int:
+        """Blocks until `end` bytes are readable (or the file is final); returns the readable size."""
+        while self.committed < end and not self.complete:
+            time.sleep(self.poll_seconds)
+            self._refresh()
+        return self.committed
+
+    def read(self, start: int, size: int) -> bytes:
+        end = min(start + size, self.wait_for(start + size))
+        if end <= start:
+            return b""
+        with open(self.path, "rb") as file:
+            file.seek(start)
+            return file.read(end - start)
+
+
+def unit_games(blocks, first_unit: bool) -> list[str]:
+    """
+    Games of one work unit (a byte stripe or a group of zstd frames) from `blocks`, an
+    iterator of `(text, past_end)` pieces starting at the unit's first byte. A unit
+    owns the games whose `[Event ` starts inside it: a partial game at its start
+    belongs to the previous unit, and its last game is completed from the `past_end`
+    text after it. Game starts are tracked as offsets into the unit's text, so a
+    boundary marker that straddles the unit's end is still attributed correctly.
+    """
+    # A virtual newline in front lets a unit that starts right at `[Event ` match it
+    buffer, offset = "\n", -1      # `buffer` holds the unit's text from `offset` on
+    owned = None                    # Length of the unit's text before its end
+    game_start = 0 if first_unit else None
+    for text, past_end in blocks:
+        if past_end and owned is None:
+            owned = offset + len(buffer)
+        search_from = max(len(buffer) - len(GAME_START), 0)
+        buffer += text
+        for boundary in GAME_BOUNDARY.finditer(buffer, search_from):
+            if game_start is not None:
+                game = buffer[game_start - offset: boundary.start()].strip()
+                if game:
+                    yield game
+            game_start = offset + boundary.end()
+            if owned is not None and game_start >= owned:
+                return
+        # Only the open game (or, before the first start, a possible partial marker) is kept
+        keep_from = game_start - offset if game_start is not None else max(len(buffer) - len(GAME_START), 0)
+        buffer, offset = buffer[keep_from:], offset + keep_from
+    if game_start is not None:
+        game = buffer[game_start - offset:].strip()
+        if game:
+            yield game
+
+
+class PgnPositionStream(IterableDataset):
+    """
+    Training positions streamed from filtered `.pgn` files or raw `.pgn.zst` dumps,
+    without an offline encoding pass.
+
+    Inputs are cut into work units, byte stripes of `stripe_size` for `.pgn` (so a
+    `GrowingPgn` can be trained on while it is ingested) and groups of zstd frames
+    for `.zst`, and unit `k` goes to DataLoader worker `k % num_workers`. Games are
+    decoded with `ZstdUtf8Stream` + `unit_games`, encoded `encode_batch` games at
+    a time with `encode_games` (plies chosen by `selection`), and pass through a
+    reservoir of `shuffle_buffer` positions before leaving as `batch_size` batches
+    of `positions_to_tensors` (with legal-move masks when `legal_masks` is set, served
+    from `cache` for repeated positions). Use with `DataLoader(batch_size=None)`.
+    """
+    def __init__(
+        self,
+        sources: list[Path | GrowingPgn],
+        selection: PositionSelection = PositionSelection(),
+        elo_buckets: EloBuckets = None,
+        batch_size: int = 8192,
+        shuffle_buffer: int = 1 << 18,
+        encode_batch: int = 256,
+        stripe_size: int = 64 * MB,
+        seed: int = 0,
+        legal_masks: bool = False,
+        cache: EncodingCache = None
+    ):
+        self.sources = [GrowingPgn(source) if isinstance(source, (str, Path)) and Path(source).suffix == ".pgn" else source
+                        for source in sources]
+        self.selection = selection
+        self.elo_buckets = elo_buckets or ELO_BUCKETS
+        self.batch_size = batch_size
+        self.shuffle_buffer = max(shuffle_buffer, batch_size)
+        self.encode_batch = encode_batch
+        self.stripe_size = stripe_size
+        self.seed = seed
+        self.legal_masks = legal_masks
+        self.cache = cache
+        self.epoch = 0
+
+    @classmethod
+    def from_config(cls, cfg: Config, sources: list[Path | GrowingPgn], **kwargs) -> "PgnPositionStream":
+        kwargs.setdefault("batch_size", getattr(cfg, "batch_size", 8192))
+        return cls(
+            sources,
+            selection=PositionSelection.from_config(cfg),
+            elo_buckets=EloBuckets.from_config(cfg),
+            seed=getattr(cfg, "seed", 0),
+            legal_masks=getattr(cfg, "legal_masks", False),
+            # The cache only saves move generation, planes are cheaper to pack than to look up
+            cache=EncodingCache.from_config(cfg) if getattr(cfg, "legal_masks", False) else None,
+            **kwargs
+        )
+
+    @staticmethod
+    def month_source(year: int, month: int, poll_seconds: float = 10.0) -> GrowingPgn:
+        """A month's filtered PGN, readable up to its checkpoint while it is being ingested."""
+        processed_data, _, checkpoint_path = output_paths(year, month)
+        return GrowingPgn(processed_data, checkpoint_path, poll_seconds)
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def __iter__(self):
+        worker = get_worker_info()
+        worker_id, num_workers = (worker.id, worker.num_workers) if worker is not None else (0, 1)
+        rng = np.random.default_rng((self.seed, self.epoch, worker_id))
+
+        dtype = position_dtype(self.legal_masks)
+        buffer = np.empty(self.shuffle_buffer + self.encode_batch * 64, dtype=dtype)
+        size = 0
+        for rows in self._positions(worker_id, num_workers):
+            if size + len(rows) > len(buffer):
+                buffer = np.concatenate([buffer[:size], np.empty(len(rows), dtype=dtype)])
+            buffer[size: size + len(rows)] = rows
+            size += len(rows)
+            while size >= self.shuffle_buffer:
+                batch, size = self._take(buffer, size, self.batch_size, rng)
+                yield positions_to_tensors(batch)
+
+        # Drain what is left, still in random order
+        order = rng.permutation(size)
+        for first in range(0, size, self.batch_size):
+            yield positions_to_tensors(buffer[order[first: first + self.batch_size]])
+
+    @staticmethod
+    def _take(buffer: np.ndarray, size: int, count: int, rng: np.random.Generator) -> tuple[np.ndarray, int]:
+        """Removes `count` random rows from `buffer[:size]`, filling the holes with its last rows."""
+        picked = rng.choice(size, count, replace=False)
+        batch = buffer[picked]
+        new_size = size - count
+        holes = picked[picked < new_size]
+        tail = np.setdiff1d(np.arange(new_size, size), picked, assume_unique=True)
+        buffer[holes] = buffer[tail]
+        return batch, new_size
+
+    def _positions(self, worker_id: int, num_workers: int):
+        games, unit_number = [], 0
+        for source in self.sources:
+            units = self._zst_units(source) if isinstance(source, (str, Path)) else self._pgn_units(source)
+            for unit, blocks in enumerate(units):
+                unit_number += 1
+                if (unit_number - 1) % num_workers != worker_id:
+                    continue
+                for game in unit_games(blocks(), unit == 0):
+                    games.append(game)
+                    if len(games) >= self.encode_batch:
+                        yield self._encode(games)
+                        games = []
+        if games:
+            yield self._encode(games)
+
+    def _encode(self, games: list[str]) -> np.ndarray:
+        headers = [scan_pgn_header(game) for game in games]
+        white = self.elo_buckets.buckets(np.array([header.white_elo for header in headers]))
+        black = self.elo_buckets.buckets(np.array([header.black_elo for header in headers]))
+        results = np.array([RESULT_CODES.get(header.result, UNKNOWN_RESULT) for header in headers])
+        return encode_games(games, white, black, results, self.selection, self.legal_masks, self.cache)
+
+    def _pgn_units(self, source: GrowingPgn, read_size: int = 4 * MB, tail_read_size: int = 64 * 1024):
+        """One unit per `stripe_size` bytes, for as long as the file grows."""
+        stripe = 0
+        while source.wait_for(stripe * self.stripe_size + 1) > stripe * self.stripe_size:
+            start, end = stripe * self.stripe_size, (stripe + 1) * self.stripe_size
+
+            def blocks(start=start, end=end):
+                decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+                pos = start
+                while True:
+                    past_end = pos >= end
+                    data = source.read(pos, tail_read_size if past_end else min(read_size, end - pos))
+                    if not data:
+                        return
+                    pos += len(data)
+                    yield decoder.decode(data), past_end
+
+            yield blocks
+            stripe += 1
+
+    def _zst_units(self, path: Path, read_size: int = 4 * MB, tail_read_size: int = 256 * 1024):
+        """One unit per group of about `stripe_size` compressed bytes of whole zstd frames."""
+        frames = scan_zstd_frames(path)
+        file_end = int(frames[-1].sum()) if len(frames) else 0
+        for start, end in group_frames(frames, self.stripe_size).tolist():
+
+            def blocks(start=start, end=end):
+                zstream = ZstdUtf8Stream()
+                decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+                with open(path, "rb") as file:
+                    file.seek(start)
+                    pos = start
+                    while pos < file_end:
+                        past_end = pos >= end
+                        data = file.read(min(tail_read_size if past_end else read_size, (file_end if past_end else end) - pos))
+                        pos += len(data)
+                        yield decoder.decode(zstream.feed_bytes(data)), past_end
+
+            yield blocks
+
+
+def _batch_collate(batch):
+    # Batches are assembled by the dataset itself
+    return batch
+
+
+def position_stream_loader(dataset: PgnPositionStream, cfg: Config) -> DataLoader:
+    """DataLoader over a `PgnPositionStream` with the config's `num_workers` and `queue_length`."""
+    num_workers = getattr(cfg, "num_workers", 0)
+    return DataLoader(
+        dataset,
+        batch_size=None,
+        num_workers=num_workers,
+        collate_fn=_batch_collate,
+        prefetch_factor=getattr(cfg, "queue_length", 2) if num_workers else None,
+        persistent_workers=False,
+        pin_memory=torch.cuda.is_available()
+    )
@@ -1,5 +1,7 @@
 
+import bisect
 import chess
+import numpy as np
 import pyzstd
 import torch
 import pathlib
@@ -15,7 +17,7 @@ class Config:
 
 def parse_cfg(cfg_file_path: str):
     with open(cfg_file_path, "r") as file:
-        cfg_dict = yaml.save_load(file)
+        cfg_dict = yaml.safe_load(file)
 
     cfg = Config(cfg_dict)
     return cfg
@@ -41,9 +43,15 @@ def decompress_zstd(compressed_file_path: str, decompressed_file_path: str) -> N
         pyzstd.decompress_stream(compressed_file, decompressed_file)
 
 
+CLOCK_RE = re.compile(r"\[%clk (\d+):(\d+):(\d+)\]")
+CLOCK_VALUE_RE = re.compile(r"\[%clk (\d+:\d\d:\d\d)\]")
+CLOCK_UNITS = np.array([3600, 60, 1], dtype=np.int32)
+# Weights of each character of a "h:mm:ss" clock, the ':' separators get weight 0
+CLOCK_DIGIT_UNITS = np.array([3600, 0, 600, 60, 0, 10, 1], dtype=np.int32)
+
+
 def extract_clock_time(comment: str) -> int:
-    pattern = r"\[%clk (\d+):(\d+):(\d+)\]"
-    match = re.search(pattern, comment)
+    match = CLOCK_RE.search(comment)
     if match:
         hours, minutes, seconds = map(int, match.groups())
         total_seconds = hours * 3600 + minutes * 60 + seconds
@@ -51,6 +59,20 @@ def extract_clock_time(comment: str) -> int:
     return None
 
 
+def extract_clock_times(movetext: str) -> np.ndarray:
+    """
+    Pulls every `[%clk h:mm:ss]` value of a game's movetext, in ply order, into an
+    int32 array of remaining seconds with a single regex pass.
+    """
+    clocks = CLOCK_VALUE_RE.findall(movetext)
+    joined = "".join(clocks).encode("ascii")
+    if len(joined) == 7 * len(clocks):
+        # Fast path, every clock is "h:mm:ss": read the digits straight out of the bytes
+        digits = np.frombuffer(joined, dtype=np.uint8).reshape(-1, 7) - ord("0")
+        return digits.astype(np.int32) @ CLOCK_DIGIT_UNITS
+    return np.array([clock.split(":") for clock in clocks], dtype=np.int32).reshape(-1, 3) @ CLOCK_UNITS
+
+
 def readable_time(elapsed_time: int) -> str:
     hours, rem = divmod(elapsed_time, 3600)
     minutes, seconds = divmod(rem, 60)
@@ -97,6 +119,51 @@ def map_to_category(elo: int, elo_dict: dict) -> int:
         return elo_dict[f"{lower_bound}-{upper_bound}"]
 
 
+class EloBuckets:
+    """
+    Table driven replacement for `create_elo_dict` / `map_to_category`.
+
+    Buckets are defined by a sorted boundary array `[start, start + interval, ..., stop]`,
+    so bucket 0 is `<start`, the last bucket is `>=stop`, and the ids match `create_elo_dict`.
+    """
+    def __init__(self, start: int = 1100, stop: int = 2000, interval: int = 100):
+        self.start, self.stop, self.interval = start, stop, interval
+        self.boundaries = np.array(list(range(start, stop, interval)) + [stop], dtype=np.int32)
+        self.boundaries.setflags(write=False)
+        self._boundary_list = self.boundaries.tolist()
+
+    @classmethod
+    def from_config(cls, cfg: Config) -> "EloBuckets":
+        return cls(
+            start=getattr(cfg, "elo_start", 1100),
+            stop=getattr(cfg, "elo_stop", 2000),
+            interval=getattr(cfg, "elo_interval", 100)
+        )
+
+    def __len__(self) -> int:
+        return len(self.boundaries) + 1
+
+    def bucket(self, elo: int) -> int:
+        """Bucket id of a single rating."""
+        return bisect.bisect_right(self._boundary_list, elo)
+
+    def buckets(self, elos) -> np.ndarray:
+        """Bucket ids (int16) of a whole array of ratings in one call."""
+        return np.searchsorted(self.boundaries, elos, side="right").astype(np.int16)
+
+    def labels(self) -> list[str]:
+        """Human readable bucket names, in bucket id order (same keys as `create_elo_dict`)."""
+        lower_bounds = self._boundary_list[:-1]
+        return (
+            [f"<{self.start}"]
+            + [f"{lower}-{lower + self.interval - 1}" for lower in lower_bounds]
+            + [f">={self.stop}"]
+        )
+
+
+ELO_BUCKETS = EloBuckets()
+
+
 def generate_promotion_moves():
     all_pawn_promotion_moves = []
     white_promotion_rank, black_promotion_rank = 6, 1
@@ -136,6 +203,85 @@ def get_all_possible_moves():
     return all_possible_piece_moves + pawn_promotion_moves
 
 
+# Moves as `promotion << 12 | from_square << 6 | to_square`, promotion being 0 or a
+# chess piece type. Flipping the ranks of both squares is a XOR with `MIRROR_KEY`
+MOVE_KEY_SIZE: int = (chess.KING + 1) << 12
+MIRROR_KEY: int = 56 << 6 | 56
+
+
+def move_key(move: chess.Move) -> int:
+    return (move.promotion or 0) << 12 | move.from_square << 6 | move.to_square
+
+
+class MoveVocabulary:
+    """
+    Frozen index over the policy move list produced by `get_all_possible_moves`.
+
+    Index order is the order of `get_all_possible_moves`, lookups in both directions
+    are plain dict/tuple indexing. `mirrored_index[i]` is the index of move `i` seen
+    from the other side of the board (ranks flipped), used to encode black-to-move
+    positions from white's point of view. `square_index` maps a move key
+    (`move_key`: promotion, from and to squares) to its index, or -1 for moves outside
+    the vocabulary.
+    """
+    def __init__(self, moves: list[str]):
+        self.moves = tuple(moves)
+        self.uci_to_index = {uci: idx for idx, uci in enumerate(self.moves)}
+        self.index_to_move = tuple(chess.Move.from_uci(uci) for uci in self.moves)
+
+        self.mirrored_index = np.array(
+            [self.uci_to_index[self._mirror_uci(move)] for move in self.index_to_move],
+            dtype=np.int16
+        )
+        self.mirrored_index.setflags(write=False)
+
+        self.square_index = np.full(MOVE_KEY_SIZE, -1, dtype=np.int16)
+        for idx, move in enumerate(self.index_to_move):
+            self.square_index[move_key(move)] = idx
+        self.square_index.setflags(write=False)
+
+    @staticmethod
+    def _mirror_uci(move: chess.Move) -> str:
+        return chess.Move(
+            chess.square_mirror(move.from_square),
+            chess.square_mirror(move.to_square),
+            promotion=move.promotion
+        ).uci()
+
+    def __len__(self) -> int:
+        return len(self.moves)
+
+    def __contains__(self, uci: str) -> bool:
+        return uci in self.uci_to_index
+
+    def index(self, uci: str, mirror: bool = False) -> int:
+        idx = self.uci_to_index[uci]
+        return int(self.mirrored_index[idx]) if mirror else idx
+
+    def encode(self, ucis: list[str], mirror: bool = False, out: np.ndarray = None) -> np.ndarray:
+        """
+        Encodes a game's UCI move list into an int16 index array.
+
+        With `mirror=True` every move is mapped through `mirrored_index`. An existing
+        int16 array can be passed as `out` to avoid allocating one per game.
+        """
+        lookup = self.uci_to_index
+        if out is None:
+            out = np.empty(len(ucis), dtype=np.int16)
+        out = out[:len(ucis)]
+        for pos, uci in enumerate(ucis):
+            out[pos] = lookup[uci]
+        if mirror:
+            np.take(self.mirrored_index, out, out=out)
+        return out
+
+    def decode(self, indices) -> list[str]:
+        return [self.moves[idx] for idx in indices]
+
+
+MOVE_VOCABULARY = MoveVocabulary(get_all_possible_moves())
+
+
 def board_to_tensor(board: chess.Board) -> torch.Tensor:
     """
     List of board channels (
@@ -192,3 +338,93 @@ def board_to_tensor(board: chess.Board) -> torch.Tensor:
         tensor[piece_channels + color_channel + castling_rights_channels, rank, file] = 1.0
 
     return tensor
+
+
+PIECE_TYPES = [chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN, chess.KING]
+N_BOARD_CHANNELS = 18
+
+
+def _board_bitboards(board: chess.Board | str):
+    """
+    Pulls the raw occupancy bitboards, side to move, castling rights and en passant
+    square from a board (or FEN string) without touching individual squares.
+    """
+    if isinstance(board, str):
+        board = chess.Board(board)
+
+    white, black = board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK]
+    piece_masks = (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings)
+    bitboards = [mask & white for mask in piece_masks] + [mask & black for mask in piece_masks]
+    castling = (
+        board.has_kingside_castling_rights(chess.WHITE),
+        board.has_queenside_castling_rights(chess.WHITE),
+        board.has_kingside_castling_rights(chess.BLACK),
+        board.has_queenside_castling_rights(chess.BLACK)
+    )
+    ep_square = board.ep_square if board.ep_square else -1
+    return bitboards, board.turn, castling, ep_square
+
+
+def bitboards_to_tensor(
+    bitboards: np.ndarray,
+    turns: np.ndarray,
+    castling: np.ndarray,
+    ep_squares: np.ndarray,
+    out: torch.Tensor = None,
+    dtype: torch.dtype = torch.float32
+) -> torch.Tensor:
+    """
+    Encodes a batch of positions given as bitboards into a `(N, 18, 8, 8)` tensor.
+
+    bitboards: uint64 array of shape (N, 12), white pieces then black pieces in `PIECE_TYPES` order.
+    turns: bool array of shape (N,), True when white is to move.
+    castling: bool array of shape (N, 4), (white king side, white queen side, black king side, black queen side).
+    ep_squares: int array of shape (N,), en passant square or -1.
+
+    The planes are laid out exactly like `board_to_tensor`: piece planes are indexed
+    `[file, rank]` and the en passant square is marked on plane 11 at `[rank, file]`.
+    """
+    bitboards = np.ascontiguousarray(bitboards, dtype="<u8")
+    n_boards = bitboards.shape[0]
+    planes = np.zeros((n_boards, N_BOARD_CHANNELS, 8, 8), dtype=np.uint8)
+
+    # Each uint64 unpacks (little-endian) into 64 bits where bit index == square index
+    piece_bits = np.unpackbits(bitboards.view(np.uint8), axis=-1, bitorder="little")
+    planes[:, :12] = piece_bits.reshape(n_boards, 12, 8, 8).transpose(0, 1, 3, 2)
+
+    planes[:, 12] = np.asarray(turns, dtype=np.uint8)[:, None, None]
+    planes[:, 13:17] = np.asarray(castling, dtype=np.uint8)[:, :, None, None]
+
+    ep_squares = np.asarray(ep_squares)
+    has_ep = np.flatnonzero(ep_squares >= 0)
+    ep_rank, ep_file = np.divmod(ep_squares[has_ep], 8)
+    planes[has_ep, 11, ep_rank, ep_file] = 1
+
+    tensor = torch.from_numpy(planes)
+    if out is None:
+        return tensor if dtype == torch.uint8 else tensor.to(dtype)
+    out.copy_(tensor)
+    return out
+
+
+def boards_to_tensor(
+    boards: list[chess.Board | str],
+    out: torch.Tensor = None,
+    dtype: torch.dtype = torch.float32
+) -> torch.Tensor:
+    """
+    Batched version of `board_to_tensor`.
+
+    Accepts `chess.Board` objects or FEN strings and fills one `(N, 18, 8, 8)` tensor,
+    either freshly allocated with `dtype` or the preallocated `out` tensor.
+    """
+    n_boards = len(boards)
+    bitboards = np.empty((n_boards, 12), dtype=np.uint64)
+    turns = np.empty(n_boards, dtype=bool)
+    castling = np.empty((n_boards, 4), dtype=bool)
+    ep_squares = np.empty(n_boards, dtype=np.int16)
+
+    for idx, board in enumerate(boards):
+        bitboards[idx], turns[idx], castling[idx], ep_squares[idx] = _board_bitboards(board)
+
+    return bitboards_to_tensor(bitboards, turns, castling, ep_squares, out=out, dtype=dtype)
@@ -1,21 +1,34 @@
+from pathlib import Path
+
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.stats import norm
 import pandas as pd
 from pyfonts import set_default_font, load_google_font
 
+from maia2.game_metadata import GameMetadata
+
+
+def load_ratings(path: str) -> np.ndarray:
+    """
+    Every rating of a month: from its game metadata directory (memory-mapped Elo
+    columns), or from a legacy one-rating-per-line `blitz_ratings_*.txt` file.
+    """
+    if Path(path).is_dir():
+        return GameMetadata(path).ratings()
+    return pd.read_table(path, header=None).iloc[:, 0].to_numpy()
+
 
 def create_cdf_pdf_plot(path: str, rating: int|float):
     font = load_google_font("Poppins")
     bold_font = load_google_font("Poppins", weight=400)
     set_default_font(font)
 
-    arr = pd.read_table(path, header=None)
-    ratings = arr.iloc[:, 0]
+    ratings = load_ratings(path)
 
     # Calculate the mean and standard deviation from the ratings data
     mu_ratings = ratings.mean()
-    sigma_ratings = ratings.std()
+    sigma_ratings = ratings.std(ddof=1)
     
     # Calculate the cumulative probability (X <= rating)
     p_rating = np.sum(ratings <= rating) / len(ratings)
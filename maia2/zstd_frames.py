@@ -0,0 +1,409 @@
+import asyncio
+import bisect
+import mmap
+from concurrent.futures import Executor, ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pyzstd
+
+MB: int = 1024 * 1024
+
+
+def scan_zstd_frames(path: Path) -> np.ndarray:
+    """
+    Returns the `(offset, size)` of every complete zstd frame in a local `.zst` file.
+
+    Frame sizes come from the frame and block headers (`pyzstd.get_frame_size`), so no
+    data is decompressed and a `ZSTD_MAGIC` sequence inside compressed data can't be
+    mistaken for a boundary. A truncated last frame (partial download) is left out.
+    """
+    frames = []
+    with open(path, "rb") as file:
+        if Path(path).stat().st_size == 0:
+            return np.empty((0, 2), dtype=np.int64)
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+            pos, total = 0, len(mapped)
+            while pos < total:
+                try:
+                    size = pyzstd.get_frame_size(view[pos:])
+                except pyzstd.ZstdError:
+                    break
+                frames.append((pos, size))
+                pos += size
+    return np.array(frames, dtype=np.int64).reshape(-1, 2)
+
+
+def group_frames(frames: np.ndarray, target_size: int = 32 * MB) -> np.ndarray:
+    """
+    Merges consecutive frames into `(start, end)` compressed byte ranges of roughly
+    `target_size` bytes. Every range starts and ends on a frame boundary, so each one
+    can be decompressed on its own.
+    """
+    if not len(frames):
+        return np.empty((0, 2), dtype=np.int64)
+    ends = frames[:, 0] + frames[:, 1]
+    groups, start = [], int(frames[0, 0])
+    for end in ends.tolist():
+        if end - start >= target_size:
+            groups.append((start, end))
+            start = end
+    if start < ends[-1]:
+        groups.append((start, int(ends[-1])))
+    return np.array(groups, dtype=np.int64)
+
+
+def decompress_file_range(path: Path, start: int, end: int) -> tuple[bytes, np.ndarray]:
+    """
+    Decompresses `path[start:end]`, which must hold whole frames (runs in a worker process).
+    Returns the data and, per frame, `(compressed offset, offset of its first byte in the data)`.
+    """
+    with open(path, "rb") as file:
+        file.seek(start)
+        compressed = file.read(end - start)
+
+    outputs, frames, pos = [], [], 0
+    with memoryview(compressed) as view:
+        while pos < len(compressed):
+            size = pyzstd.get_frame_size(view[pos:])
+            frames.append((start + pos, sum(map(len, outputs))))
+            outputs.append(pyzstd.decompress(view[pos: pos + size]))
+            pos += size
+    return b"".join(outputs), np.array(frames, dtype=np.int64).reshape(-1, 2)
+
+
+def check_file_range(path: Path, start: int, end: int) -> list[tuple[int, int]]:
+    """
+    Decompresses every frame of `path[start:end]` and returns the `(offset, size)` of
+    those that fail (runs in a worker process). A frame header that cannot be parsed
+    marks the rest of the range as corrupt, since the next boundary is unknown.
+    """
+    with open(path, "rb") as file:
+        file.seek(start)
+        compressed = file.read(end - start)
+
+    corrupt, pos = [], 0
+    with memoryview(compressed) as view:
+        while pos < len(compressed):
+            try:
+                size = pyzstd.get_frame_size(view[pos:])
+            except pyzstd.ZstdError:
+                corrupt.append((start + pos, len(compressed) - pos))
+                break
+            try:
+                pyzstd.decompress(view[pos: pos + size])
+            except pyzstd.ZstdError:
+                corrupt.append((start + pos, size))
+            pos += size
+    return corrupt
+
+
+def find_corrupt_frames(path: Path, target_size: int = 32 * MB, executor: Executor = None) -> np.ndarray:
+    """
+    `(offset, size)` byte ranges of `path` that fail to decompress, using the frames'
+    content checksums as per-range digests: after a whole-file hash mismatch only
+    these ranges need to be fetched again. Bytes after the last parseable frame are
+    reported as one range.
+    """
+    frames = scan_zstd_frames(path)
+    ranges = group_frames(frames, target_size).tolist()
+    results = (
+        executor.map(check_file_range, *zip(*((path, start, end) for start, end in ranges)))
+        if executor is not None and ranges else
+        (check_file_range(path, start, end) for start, end in ranges)
+    )
+    corrupt = [frame for result in results for frame in result]
+
+    scanned = int(frames[-1].sum()) if len(frames) else 0
+    total = Path(path).stat().st_size
+    if scanned < total:
+        corrupt.append((scanned, total - scanned))
+    return np.array(corrupt, dtype=np.int64).reshape(-1, 2)
+
+
+async def parallel_decompress_file(
+    path: Path,
+    start_byte: int = 0,
+    target_size: int = 32 * MB,
+    executor: Executor = None,
+    max_in_flight: int = None
+):
+    """
+    Decompresses a local multi-frame `.zst` file in a process pool.
+
+    Frames are grouped into independent ranges of about `target_size` compressed bytes,
+    at most `max_in_flight` ranges are decompressed at once, and results are yielded in
+    file order as `(range end offset, decompressed bytes, frames)` where `frames` is
+    the per-frame table of `decompress_file_range`. Games that straddle a range
+    boundary come out split across two consecutive results; feeding them in order to a
+    `PgnByteSplitter` stitches them back together.
+    """
+    frames = scan_zstd_frames(path)
+    frames = frames[frames[:, 0] >= start_byte]
+    ranges = group_frames(frames, target_size).tolist()
+
+    own_executor = executor is None
+    executor = executor or ProcessPoolExecutor()
+    max_in_flight = max_in_flight or getattr(executor, "_max_workers", 4) * 2
+    loop = asyncio.get_running_loop()
+
+    pending = []
+    try:
+        for start, end in ranges:
+            if len(pending) >= max_in_flight:
+                # Results must come out in order, so always wait for the oldest range
+                end_offset, future = pending.pop(0)
+                yield (end_offset, *await future)
+            pending.append((end, loop.run_in_executor(executor, decompress_file_range, path, start, end)))
+        for end_offset, future in pending:
+            yield (end_offset, *await future)
+        pending.clear()
+    finally:
+        for _, future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+
+
+ZSTD_FRAME_MAGIC = 0xFD2FB528
+ZSTD_SKIPPABLE_MAGIC = 0x184D2A50       # 0x184D2A50 - 0x184D2A5F
+DICTIONARY_ID_SIZES = (0, 1, 2, 4)
+CONTENT_SIZE_SIZES = (0, 2, 4, 8)
+
+
+class ZstdFrameWalker:
+    """
+    Follows zstd frame and block headers of a compressed stream fed in arbitrary chunks,
+    without decompressing or buffering it. Only headers that straddle two chunks are
+    kept (a few bytes). `feed()` returns the absolute end offsets of the frames whose
+    last block header was read in that chunk.
+    """
+    def __init__(self, start_offset: int = 0):
+        self._offset = start_offset       # Absolute offset of the next chunk's first byte
+        self._cursor = start_offset       # Absolute offset of the next header to read
+        self._pending = b""               # Header bytes from the previous chunk, starting at _cursor
+        self._in_frame = False
+        self._has_checksum = False
+
+    def _peek(self, chunk: bytes, base: int, n: int) -> bytes:
+        rel = self._cursor - base
+        if rel >= 0:
+            return chunk[rel: rel + n]
+        return (self._pending + chunk[:n])[:n]
+
+    def feed(self, chunk: bytes) -> list[int]:
+        base = self._offset
+        self._offset += len(chunk)
+        frame_ends = []
+
+        while self._cursor < self._offset:
+            if not self._in_frame:
+                header = self._peek(chunk, base, 8)
+                if len(header) < 5 or (len(header) < 8 and header[:4] != b'\x28\xb5\x2f\xfd'):
+                    break
+                magic = int.from_bytes(header[:4], "little")
+                if magic & 0xFFFFFFF0 == ZSTD_SKIPPABLE_MAGIC:
+                    self._cursor += 8 + int.from_bytes(header[4:8], "little")
+                    frame_ends.append(self._cursor)
+                    continue
+                if magic != ZSTD_FRAME_MAGIC:
+                    raise ValueError(f"Not a zstd frame header at byte {self._cursor}")
+                descriptor = header[4]
+                single_segment = (descriptor >> 5) & 1
+                content_size_flag = descriptor >> 6
+                content_size = CONTENT_SIZE_SIZES[content_size_flag] or single_segment
+                self._has_checksum = bool((descriptor >> 2) & 1)
+                self._cursor += 5 + (1 - single_segment) + DICTIONARY_ID_SIZES[descriptor & 3] + content_size
+                self._in_frame = True
+            else:
+                header = self._peek(chunk, base, 3)
+                if len(header) < 3:
+                    break
+                block_header = int.from_bytes(header, "little")
+                block_type, block_size = (block_header >> 1) & 3, block_header >> 3
+                if block_type == 3:
+                    raise ValueError(f"Reserved zstd block type at byte {self._cursor}")
+                # RLE blocks store a single byte, Block_Size is their regenerated size
+                self._cursor += 3 + (1 if block_type == 1 else block_size)
+                if block_header & 1:
+                    self._cursor += 4 if self._has_checksum else 0
+                    self._in_frame = False
+                    frame_ends.append(self._cursor)
+        else:
+            self._pending = b""
+            return frame_ends
+
+        # Header straddles the end of this chunk, keep its first bytes for the next call
+        rel = self._cursor - base
+        self._pending = chunk[rel:] if rel >= 0 else self._pending + chunk
+        return frame_ends
+
+
+class FrameTracker:
+    """
+    Decompresses a stream chunk by chunk while recording where frames start, in the same
+    `(compressed offset, offset in the chunk's decompressed data)` form as
+    `decompress_file_range`. Chunks are cut at frame ends to line both offsets up.
+    """
+    def __init__(self, start_offset: int = 0):
+        self.walker = ZstdFrameWalker(start_offset)
+        self._position = start_offset
+        self._frame_start = start_offset
+        self._start_reported = False
+        self._frame_ends = []             # Known frame ends, possibly beyond the data seen so far
+
+    def decompress(self, chunk: bytes, decompress) -> tuple[bytes, np.ndarray]:
+        """`decompress` is the stream's own decompression call, e.g. `ZstdUtf8Stream.feed_bytes`."""
+        base = self._position
+        self._position += len(chunk)
+        self._frame_ends.extend(self.walker.feed(chunk))
+        n_complete = bisect.bisect_right(self._frame_ends, self._position)
+        frame_ends, self._frame_ends = self._frame_ends[:n_complete], self._frame_ends[n_complete:]
+
+        outputs, starts, cut, produced = [], [], 0, 0
+        if chunk and not self._start_reported:
+            starts.append((self._frame_start, 0))
+            self._start_reported = True
+        for end in frame_ends:
+            output = decompress(chunk[cut: end - base])
+            outputs.append(output)
+            produced += len(output)
+            self._frame_start, cut = end, end - base
+            # A frame ending exactly at the chunk end has its successor reported with the next chunk
+            self._start_reported = cut < len(chunk)
+            if self._start_reported:
+                starts.append((end, produced))
+        if cut < len(chunk):
+            outputs.append(decompress(chunk[cut:]))
+
+        return b"".join(outputs), np.array(starts, dtype=np.int64).reshape(-1, 2)
+
+
+FRAME_INDEX_DTYPE = np.dtype([
+    ("offset", "<i8"),                # Compressed byte offset of the frame
+    ("decompressed_offset", "<i8"),   # Offset of the frame's first byte in the decompressed stream
+    ("first_game", "<i8"),            # Number of the first game starting at or after the frame start
+    ("first_game_offset", "<i8"),     # Where that game starts, relative to the frame's decompressed start (-1: later frame)
+])
+
+
+class FrameIndexBuilder:
+    """
+    Builds a frame index while a stream is ingested from its first byte.
+
+    Frame starts (from `FrameTracker` / `decompress_file_range`) and game starts (absolute
+    offsets in the decompressed stream, from `PgnByteSplitter`) arrive in stream order;
+    a frame is written once the first game starting at or after it is known.
+    """
+    def __init__(self):
+        self.rows: list[tuple] = []
+        self._pending: list[tuple[int, int]] = []   # (offset, decompressed offset) of unresolved frames
+        self._decompressed_end = 0
+
+    def add_frames(self, frames: np.ndarray, data_size: int):
+        """`frames` start within the next `data_size` decompressed bytes of the stream."""
+        for offset, data_offset in frames.tolist():
+            self._pending.append((offset, self._decompressed_end + data_offset))
+        self._decompressed_end += data_size
+
+    def add_games(self, game_starts: np.ndarray, first_number: int, next_start: int, next_number: int):
+        """
+        `game_starts` are the decompressed offsets of games `first_number, first_number + 1, ...`,
+        `next_start` is where game `next_number` (still incomplete) starts.
+        """
+        starts = np.append(game_starts, next_start)
+        numbers = np.append(np.arange(first_number, first_number + len(game_starts)), next_number)
+        while self._pending and self._pending[0][1] <= next_start:
+            offset, decompressed_offset = self._pending.pop(0)
+            idx = int(np.searchsorted(starts, decompressed_offset, side="left"))
+            game_start = int(starts[idx])
+            # Every frame starting before the data seen so far is known, so this is the frame's end
+            in_frame = not self._pending or game_start < self._pending[0][1]
+            self.rows.append((
+                offset, decompressed_offset, int(numbers[idx]),
+                game_start - decompressed_offset if in_frame else -1
+            ))
+
+    def finish(self, total_games: int):
+        """Resolves the frames after the last game start once the stream has ended."""
+        for offset, decompressed_offset in self._pending:
+            self.rows.append((offset, decompressed_offset, total_games, -1))
+        self._pending.clear()
+
+    def snapshot(self) -> np.ndarray:
+        return np.array(self.rows, dtype=FRAME_INDEX_DTYPE)
+
+    @staticmethod
+    def save(rows: np.ndarray, path: Path):
+        """Atomically writes the index as a `.npy` file, readable with `FrameIndex.load`."""
+        path = Path(path)
+        temp_path = path.with_suffix(".tmp")
+        with open(temp_path, "wb") as file:
+            np.save(file, rows)
+        temp_path.replace(path)
+
+
+class FrameIndex:
+    """
+    Memory-mapped sidecar index of a `.pgn.zst` stream: compressed byte offset -> zstd
+    frame -> first game number. Used to start decompression at the frame holding any
+    game instead of streaming and fast-forwarding from the beginning.
+    """
+    def __init__(self, rows: np.ndarray):
+        self.rows = rows
+
+    @classmethod
+    def load(cls, path: Path) -> "FrameIndex":
+        return cls(np.load(path, mmap_mode="r"))
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def locate_game(self, game_number: int) -> tuple[int, int, int]:
+        """
+        Returns `(compressed offset, bytes to drop, games to skip)`: decompress from the
+        offset, drop that many decompressed bytes (the tail of an earlier game), then skip
+        that many whole games to reach `game_number`.
+        """
+        first_games = self.rows["first_game"]
+        k = int(np.searchsorted(first_games, game_number, side="right")) - 1
+        # Walk back over frames in which no game starts
+        while k >= 0 and self.rows["first_game_offset"][k] == -1:
+            k -= 1
+        if k < 0:
+            return 0, 0, game_number
+        row = self.rows[k]
+        return int(row["offset"]), int(row["first_game_offset"]), game_number - int(row["first_game"])
+
+
+def read_games(path: Path, index: FrameIndex, game_number: int, count: int = 1) -> list[bytes]:
+    """
+    Reads `count` games starting at `game_number` from a local `.pgn.zst`, decompressing
+    only from the frame that holds the first one.
+    """
+    offset, drop_bytes, skip_games = index.locate_game(game_number)
+    games, buffer = [], b""
+    with open(path, "rb") as file:
+        file.seek(offset)
+        decompressor = pyzstd.EndlessZstdDecompressor()
+        while len(games) < count:
+            compressed = file.read(MB)
+            buffer += decompressor.decompress(compressed) if compressed else b""
+            if drop_bytes:
+                dropped = min(drop_bytes, len(buffer))
+                buffer, drop_bytes = buffer[dropped:], drop_bytes - dropped
+            *complete, buffer = buffer.split(b"\n[Event ")
+            if not compressed:
+                complete.append(buffer)
+            for game in complete:
+                # split() removed the "[Event " prefix from all but the first piece
+                game = game if game.startswith(b"[Event ") else b"[Event " + game
+                if skip_games:
+                    skip_games -= 1
+                    continue
+                games.append(game.strip() + b"\n")
+                if len(games) == count:
+                    break
+            if not compressed:
+                break
+    return games
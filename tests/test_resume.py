@@ -0,0 +1,89 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+import maia2.data_ingestion as data_ingestion
+from benchmarks.synthetic_pgn import generate_pgn_corpus, write_pgn_zst
+from maia2.data_ingestion import (
+    ELO_BUCKETS,
+    EloStratifiedSampler,
+    GameFilter,
+    IngestionPipeline,
+    output_paths,
+    process_local_pgn_database,
+)
+
+YEAR, MONTH = 2020, 5
+
+
+def stopped_after(n_chunks: int):
+    """`IngestionPipeline.run` stopped (as by SIGINT) once `n_chunks` chunks were fetched."""
+    run = IngestionPipeline.run
+
+    async def stopped_run(self, chunks, should_stop=None, decompressed: bool = False) -> dict:
+        fetched = iter(range(n_chunks))
+        return await run(self, chunks, should_stop=lambda: next(fetched, None) is None, decompressed=decompressed)
+    return stopped_run
+
+
+def run_month(
+    zst_path: Path,
+    monkeypatch,
+    data_dir: Path,
+    stop_after: int = None,
+    task_size: int = 16 * 1024,
+    sampled: bool = False
+) -> dict:
+    with monkeypatch.context() as patch:
+        patch.setattr(data_ingestion, "setup_data_directory", lambda: data_dir)
+        if stop_after is not None:
+            patch.setattr(IngestionPipeline, "run", stopped_after(stop_after))
+        sampler = EloStratifiedSampler(ELO_BUCKETS, max_games=2, chunk_games=100) if sampled else None
+        asyncio.run(process_local_pgn_database(
+            zst_path, YEAR, MONTH, game_filter=GameFilter.from_spec({}), workers=2,
+            frames_per_task_size=task_size, sampler=sampler
+        ))
+        checkpoint_path = output_paths(YEAR, MONTH)[2]
+        return json.loads(checkpoint_path.read_text())
+
+
+@pytest.fixture
+def dump(tmp_path):
+    text = generate_pgn_corpus(400 * 1024, seed=7)
+    path = tmp_path / "dump.pgn.zst"
+    write_pgn_zst(path, text, frame_size=4 * 1024)
+    return path, text.count(b"[Event ")
+
+
+def test_interrupted_resume_matches_a_single_run(tmp_path, monkeypatch, dump):
+    zst_path, n_games = dump
+    reference_dir, resumed_dir = tmp_path / "reference", tmp_path / "resumed"
+    reference_dir.mkdir(), resumed_dir.mkdir()
+    run_month(zst_path, monkeypatch, reference_dir)
+
+    # Interrupted twice, each resume goes through the frame index written by the first run
+    states = [run_month(zst_path, monkeypatch, resumed_dir, stop_after=stop) for stop in (3, 4)]
+    assert (resumed_dir / f"lichess_{YEAR}_{MONTH:02d}.frames.npy").exists()
+    assert 0 < states[0]["processed_games"] < states[1]["processed_games"] < n_games
+    final = run_month(zst_path, monkeypatch, resumed_dir)
+
+    assert final["processed_games"] == n_games
+    name = f"lichess_blitz_games_{YEAR}_{MONTH:02d}.pgn"
+    assert (resumed_dir / name).read_bytes() == (reference_dir / name).read_bytes()
+
+
+def test_chunk_quota_does_not_depend_on_pipeline_chunks(tmp_path, monkeypatch, dump):
+    zst_path, n_games = dump
+    outputs = []
+    for name, task_size, stops in (("small", 8 * 1024, ()), ("large", 64 * 1024, ()), ("resumed", 16 * 1024, (3,))):
+        data_dir = tmp_path / name
+        data_dir.mkdir()
+        for stop in stops:
+            run_month(zst_path, monkeypatch, data_dir, stop_after=stop, sampled=True)
+        assert run_month(zst_path, monkeypatch, data_dir, task_size=task_size, sampled=True)["complete"]
+        outputs.append((data_dir / f"lichess_blitz_games_{YEAR}_{MONTH:02d}.pgn").read_bytes())
+
+    assert 0 < outputs[0].count(b"[Event ") < n_games
+    assert outputs[0] == outputs[1] == outputs[2]
@@ -0,0 +1,62 @@
+import pyzstd
+import pytest
+
+from maia2.streaming_dataset import GrowingPgn, PgnPositionStream, unit_games
+
+MOVETEXT = "1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 4. Ba4 Nf6 5. O-O Be7 6. Re1 b5 7. Bb3 d6 8. c3 O-O"
+
+
+def make_pgn(n_games: int) -> tuple[bytes, list[str]]:
+    games = []
+    for idx in range(n_games):
+        # Varying lengths (and a multi-byte name) move the game starts around the stripe ends
+        moves = " ".join(MOVETEXT.split()[: 3 + idx % 20])
+        games.append(
+            f'[Event "Rated Blitz game"]\n[Site "https://lichess.org/{idx:08d}"]\n'
+            f'[White "José{idx % 7}"]\n[Black "b{idx}"]\n[Result "1-0"]\n\n{moves} 1-0'
+        )
+    return "\n\n".join(games).encode() + b"\n\n", games
+
+
+def stream_games(dataset: PgnPositionStream, units) -> list[str]:
+    return [game for unit, blocks in enumerate(units) for game in unit_games(blocks(), unit == 0)]
+
+
+@pytest.mark.parametrize("stripe_size", [64, 97, 130, 997, 1500, 4099, 1 << 20])
+@pytest.mark.parametrize("read_size", [13, 4096])
+def test_pgn_stripes_yield_every_game_once(tmp_path, stripe_size, read_size):
+    data, games = make_pgn(200)
+    path = tmp_path / "games.pgn"
+    path.write_bytes(data)
+    dataset = PgnPositionStream([path], stripe_size=stripe_size)
+    units = dataset._pgn_units(GrowingPgn(path), read_size=read_size, tail_read_size=read_size)
+    assert stream_games(dataset, units) == games
+
+
+def test_every_stripe_end_offset(tmp_path):
+    # Stripe ends at every byte around the first few game boundaries
+    data, games = make_pgn(30)
+    path = tmp_path / "games.pgn"
+    path.write_bytes(data)
+    for stripe_size in range(150, 450):
+        dataset = PgnPositionStream([path], stripe_size=stripe_size)
+        assert stream_games(dataset, dataset._pgn_units(GrowingPgn(path))) == games, stripe_size
+
+
+@pytest.mark.parametrize("frame_size", [97, 600, 1500])
+@pytest.mark.parametrize("stripe_size", [1, 500, 5000])
+def test_zst_frame_groups_yield_every_game_once(tmp_path, frame_size, stripe_size):
+    data, games = make_pgn(200)
+    path = tmp_path / "games.pgn.zst"
+    with open(path, "wb") as file:
+        for start in range(0, len(data), frame_size):
+            file.write(pyzstd.compress(data[start: start + frame_size]))
+    dataset = PgnPositionStream([path], stripe_size=stripe_size)
+    assert stream_games(dataset, dataset._zst_units(path, read_size=64, tail_read_size=64)) == games
+
+
+def test_unit_starting_at_game_start():
+    first = [("[Event \"a\"]\n\n1. e4 1-0\n", False), ("\n[Event \"b\"]\n\n1. d4 1-0\n", True)]
+    second = [("[Event \"b\"]\n\n1. d4 1-0\n", False)]
+    assert list(unit_games(iter(first), True)) == ["[Event \"a\"]\n\n1. e4 1-0"]
+    assert list(unit_games(iter(second), False)) == ["[Event \"b\"]\n\n1. d4 1-0"]